@@ -0,0 +1,376 @@
+"""Supports serving the JSON data over HTTP.
+
+The server loads the JSON file once into an in-memory index and serves
+the following endpoints, all returning JSON:
+
+  /                    the node names, with the number of objects in each.
+  /<node>              all objects in a node.  Query parameters filter
+                       by attribute, e.g. /districts?district_type_id=...
+  /<node>/<object_id>  a single object.
+
+For the "phrases" node, the "lang" query parameter restricts each
+phrase to the given comma-separated languages, e.g. /phrases/<id>?lang=es.
+
+  /_search?q=<text>    the objects and phrases matching the text in any
+                       language (see the search module).  The optional
+                       "node" and "limit" parameters restrict the results.
+
+Each response body is serialized at most once per load of the data and
+cached along with its ETag and gzipped form, so repeated requests cost
+only a dict lookup.  Clients can send If-None-Match to get an empty 304
+response when their copy is current.  Attribute filters are answered
+from per-attribute indexes built on first use.
+
+The server checks the JSON file for changes at most once every
+RELOAD_INTERVAL seconds and, if it changed, loads it into a new index
+and swaps it in.  Requests in progress keep using the old index.
+
+"""
+
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import os
+import socketserver
+import threading
+import time
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from pyelect import search
+
+
+_log = logging.getLogger()
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8000
+RELOAD_INTERVAL = 1.0
+
+# Do not compress bodies smaller than this, in bytes.
+GZIP_MIN_SIZE = 512
+# The maximum number of filtered and error responses to cache per load of
+# the data.  Responses for whole nodes and single objects are always cached.
+MAX_CACHED_OTHER_RESPONSES = 10000
+
+NODE_PHRASES = 'phrases'
+PARAM_LANG = 'lang'
+SEARCH_PATH = '_search'
+
+_CONTENT_TYPE = 'application/json; charset=utf-8'
+
+
+def _dumps(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def _get_query_value(value):
+    """Return the string a query parameter must equal to match value."""
+    if isinstance(value, str):
+        return value
+    # Then the value is e.g. an int or bool, and we match its JSON form.
+    return json.dumps(value)
+
+
+class _Response(object):
+
+    """A serialized response body, along with its ETag and gzipped form."""
+
+    __slots__ = ('body', 'etag', 'status', '_gzip_body')
+
+    def __init__(self, data, status=200):
+        self.body = _dumps(data).encode('utf-8')
+        self.etag = '"{0}"'.format(hashlib.sha1(self.body).hexdigest())
+        self.status = status
+        self._gzip_body = None
+
+    def get_gzip_etag(self):
+        # A gzipped body is a different representation, so it needs its
+        # own ETag.
+        return self.etag[:-1] + '-gzip"'
+
+    def get_gzip_body(self):
+        """Return the gzipped body, or None if the body is too small."""
+        if len(self.body) < GZIP_MIN_SIZE:
+            return None
+        if self._gzip_body is None:
+            self._gzip_body = gzip.compress(self.body)
+        return self._gzip_body
+
+
+class DataIndex(object):
+
+    """An in-memory index of one load of the JSON data."""
+
+    def __init__(self, json_data):
+        self.json_data = json_data
+        # Maps (node name, attribute name) to a dict mapping query value
+        # to the list of matching object ID's.
+        self._attr_indexes = {}
+        # Maps (path parts, sorted query parameters) to _Response.
+        self._responses = {}
+        self._other_response_count = 0
+        # The search index, built on the first search.
+        self._search_index = None
+
+    def _get_attr_index(self, node_name, attr):
+        key = (node_name, attr)
+        try:
+            return self._attr_indexes[key]
+        except KeyError:
+            pass
+        attr_index = {}
+        for object_id, obj in sorted(self.json_data[node_name].items()):
+            if not isinstance(obj, dict):
+                continue
+            try:
+                value = obj[attr]
+            except KeyError:
+                continue
+            if isinstance(value, (dict, list)):
+                continue
+            attr_index.setdefault(_get_query_value(value), []).append(object_id)
+        self._attr_indexes[key] = attr_index
+        return attr_index
+
+    def _restrict_phrase(self, phrase, langs):
+        return {lang: text for lang, text in phrase.items() if lang in langs}
+
+    def _make_node_response(self, node_name, params):
+        node = self.json_data[node_name]
+        langs = None
+        if node_name == NODE_PHRASES and PARAM_LANG in params:
+            langs = params.pop(PARAM_LANG).split(',')
+        object_ids = None
+        for attr, query_value in sorted(params.items()):
+            matches = self._get_attr_index(node_name, attr).get(query_value, ())
+            object_ids = set(matches) if object_ids is None else object_ids & set(matches)
+        if object_ids is None:
+            objects = node
+        else:
+            objects = {object_id: node[object_id] for object_id in object_ids}
+        if langs is not None:
+            # Omit phrases with no translation in the given languages.
+            restricted = ((object_id, self._restrict_phrase(phrase, langs)) for
+                          object_id, phrase in objects.items())
+            objects = {object_id: phrase for object_id, phrase in restricted if phrase}
+        return _Response(objects)
+
+    def _make_object_response(self, node_name, object_id, params):
+        try:
+            obj = self.json_data[node_name][object_id]
+        except (KeyError, TypeError):
+            return _make_error(404, "no object {0!r} in node: {1}".format(object_id, node_name))
+        if node_name == NODE_PHRASES and PARAM_LANG in params:
+            langs = params.pop(PARAM_LANG).split(',')
+            obj = self._restrict_phrase(obj, langs)
+            if not obj:
+                return _make_error(404, "no translation of {0!r} for: {1}"
+                                   .format(object_id, ", ".join(langs)))
+        if params:
+            return _make_error(400, "unsupported query parameters: {0}"
+                               .format(", ".join(sorted(params))))
+        return _Response(obj)
+
+    def _make_search_response(self, params):
+        params = dict(params)
+        query = params.pop('q', '')
+        node_name = params.pop('node', None)
+        limit = params.pop('limit', None)
+        if params:
+            return _make_error(400, "unsupported query parameters: {0}"
+                               .format(", ".join(sorted(params))))
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                return _make_error(400, "limit must be an integer: {0!r}".format(limit))
+        if self._search_index is None:
+            self._search_index = search.SearchIndex.from_json_data(self.json_data)
+        results = self._search_index.search(query, node_name=node_name, limit=limit)
+        return _Response([{'id': doc_id, 'node': doc_node, 'label': label} for
+                          doc_id, doc_node, label in results])
+
+    def _make_response(self, parts, params):
+        if parts == [SEARCH_PATH] and SEARCH_PATH not in self.json_data:
+            return self._make_search_response(params)
+        if not parts:
+            if params:
+                return _make_error(400, "the root path takes no query parameters")
+            return _Response({name: len(node) for name, node in self.json_data.items()})
+        node_name = parts[0]
+        if node_name not in self.json_data:
+            return _make_error(404, "no node named: {0}".format(node_name))
+        if len(parts) == 1:
+            return self._make_node_response(node_name, params)
+        if len(parts) == 2:
+            return self._make_object_response(node_name, parts[1], params)
+        return _make_error(404, "path too long")
+
+    def get_response(self, path, query):
+        """Return the _Response for a request path and query string."""
+        parts = [unquote(p) for p in path.split('/') if p]
+        params = dict(parse_qsl(query))
+        key = (tuple(parts), tuple(sorted(params.items())))
+        try:
+            return self._responses[key]
+        except KeyError:
+            pass
+        response = self._make_response(parts, params)
+        # Clients can request any number of distinct filters and missing
+        # objects, so bound the number of those responses cached.
+        if response.status != 200 or (len(parts) == 1 and key[1]):
+            if self._other_response_count >= MAX_CACHED_OTHER_RESPONSES:
+                return response
+            self._other_response_count += 1
+        self._responses[key] = response
+        return response
+
+
+def _make_error(status, message):
+    return _Response({'error': message}, status=status)
+
+
+class DataStore(object):
+
+    """Holds the current DataIndex, reloading it when the file changes."""
+
+    def __init__(self, json_path, reload_interval=None):
+        if reload_interval is None:
+            reload_interval = RELOAD_INTERVAL
+        self.json_path = json_path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._next_check = 0
+        self._stat_key = None
+        self.index = None
+        self._reload()
+
+    def _get_stat_key(self):
+        stat = os.stat(self.json_path)
+        return (stat.st_mtime, stat.st_size)
+
+    def _reload(self):
+        stat_key = self._get_stat_key()
+        with open(self.json_path) as f:
+            json_data = json.load(f)
+        self.index = DataIndex(json_data)
+        self._stat_key = stat_key
+        _log.info("loaded json data: {0}".format(self.json_path))
+
+    def get_index(self):
+        """Return the current DataIndex, reloading first if needed."""
+        now = time.time()
+        if now < self._next_check:
+            return self.index
+        # Only one thread needs to check, and the others can keep using
+        # the current index in the meantime.
+        if not self._lock.acquire(blocking=False):
+            return self.index
+        try:
+            self._next_check = now + self.reload_interval
+            try:
+                if self._get_stat_key() != self._stat_key:
+                    self._reload()
+            except (OSError, ValueError) as err:
+                # For example, the file is in the middle of being written.
+                _log.warning("keeping previous json data: {0}".format(err))
+        finally:
+            self._lock.release()
+        return self.index
+
+
+class APIRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Otherwise, small keep-alive responses can stall on delayed ACKs.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        _log.debug("%s - %s", self.address_string(), format % args)
+
+    def _accepts_gzip(self):
+        accept = self.headers.get('Accept-Encoding', '')
+        return 'gzip' in accept
+
+    def _is_not_modified(self, etag):
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match is None:
+            return False
+        etags = [e.strip() for e in if_none_match.split(',')]
+        return etag in etags or '*' in etags
+
+    def _send(self, include_body):
+        url = urlsplit(self.path)
+        index = self.server.store.get_index()
+        response = index.get_response(url.path, url.query)
+
+        body = response.body
+        etag = response.etag
+        encoding = None
+        if self._accepts_gzip():
+            gzip_body = response.get_gzip_body()
+            if gzip_body is not None:
+                body = gzip_body
+                etag = response.get_gzip_etag()
+                encoding = 'gzip'
+
+        if response.status == 200 and self._is_not_modified(etag):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(response.status)
+        self.send_header('Content-Type', _CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if response.status == 200:
+            self.send_header('ETag', etag)
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self._send(include_body=True)
+
+    def do_HEAD(self):
+        self._send(include_body=False)
+
+
+class ThreadingServer(socketserver.ThreadingMixIn, HTTPServer):
+
+    """An HTTP server that handles each connection in a new thread."""
+
+    daemon_threads = True
+    # Let the server restart right away on the same port.
+    allow_reuse_address = True
+
+
+class APIServer(ThreadingServer):
+
+    def __init__(self, address, store):
+        ThreadingServer.__init__(self, address, APIRequestHandler)
+        self.store = store
+
+
+def serve(json_path, host=None, port=None, reload_interval=None):
+    """Serve the JSON data at the given path until interrupted."""
+    if host is None:
+        host = DEFAULT_HOST
+    if port is None:
+        port = DEFAULT_PORT
+    store = DataStore(json_path, reload_interval=reload_interval)
+    server = APIServer((host, port), store)
+    _log.info("serving {0} at: http://{1}:{2}/".format(json_path, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
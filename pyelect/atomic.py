@@ -0,0 +1,170 @@
+"""Supports writing output files safely while other processes read them.
+
+Files are written to a temporary file in the same directory and then
+renamed over the destination, so readers (e.g. a web server, or another
+build) see either the old file or the new one, never a partial one.
+
+For output directories, builds can take an advisory lock, and can build
+into a fresh directory and then atomically point a symlink at it.
+
+"""
+
+from contextlib import contextmanager
+import logging
+import os
+import shutil
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # Then the platform is not POSIX (e.g. Windows).
+    fcntl = None
+
+
+_log = logging.getLogger()
+
+LOCK_SUFFIX = '.lock'
+# The suffix of the file recording the build a symlink pointed to before
+# the current one.
+PREVIOUS_SUFFIX = '.previous'
+BUILD_DIR_INFIX = '.build-'
+
+# Temporary files are created with mode 0600, so give the final files the
+# mode a plain open() would.  Reading the umask requires setting it, so do
+# that once rather than on each write, when other threads may be running.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+_FILE_MODE = 0o666 & ~_UMASK
+_DIR_MODE = 0o777 & ~_UMASK
+
+
+@contextmanager
+def atomic_open(path, mode='w', **kwargs):
+    """Open a file for writing that replaces path only when closed without error.
+
+    Arguments:
+      mode: 'w' or 'wb'.
+      kwargs: additional keyword arguments to pass to open().
+    """
+    dir_path, file_name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".{0}.".format(file_name), suffix='.tmp',
+                                     dir=dir_path)
+    try:
+        with open(fd, mode, **kwargs) as f:
+            yield f
+        os.chmod(temp_path, _FILE_MODE)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+@contextmanager
+def atomic_path(path):
+    """Yield a temporary path to write to, which then replaces path.
+
+    This is for writers that need a path rather than a file object (e.g.
+    sqlite3).  The path replaces the given one only if the block exits
+    without error.
+    """
+    dir_path, file_name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".{0}.".format(file_name), suffix='.tmp',
+                                     dir=dir_path)
+    os.close(fd)
+    try:
+        yield temp_path
+        os.chmod(temp_path, _FILE_MODE)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def copy_file(source_path, target_path):
+    """Copy a file's contents atomically (see atomic_open())."""
+    with open(source_path, 'rb') as source:
+        with atomic_open(target_path, mode='wb') as target:
+            shutil.copyfileobj(source, target)
+
+
+def get_lock_path(path):
+    return os.path.normpath(path) + LOCK_SUFFIX
+
+
+@contextmanager
+def build_lock(path):
+    """Hold an advisory lock on a build output path (file or directory).
+
+    The lock is a file next to the path rather than in it, so that it is
+    not part of the output.  Blocks until the lock is free.  The lock is
+    released if the process dies.
+    """
+    lock_path = get_lock_path(path)
+    parent_dir = os.path.dirname(os.path.abspath(lock_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    with open(lock_path, 'a') as f:
+        if fcntl is None:
+            _log.warning("file locking is not supported on this platform: "
+                         "building without a lock")
+            yield
+            return
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            _log.info("waiting for build lock: {0}".format(lock_path))
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def make_build_dir(link_path):
+    """Create and return a new, uniquely named directory next to link_path."""
+    link_path = os.path.normpath(link_path)
+    parent_dir, link_name = os.path.split(os.path.abspath(link_path))
+    os.makedirs(parent_dir, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix=link_name + BUILD_DIR_INFIX, dir=parent_dir)
+    os.chmod(build_dir, _DIR_MODE)
+    return build_dir
+
+
+def swap_symlink(link_path, build_dir):
+    """Atomically point a symlink at a build directory.
+
+    The build the symlink pointed to before is kept, since readers may
+    still be reading from it, and the one before that is deleted.  Call
+    this while holding build_lock(link_path).
+    """
+    link_path = os.path.normpath(link_path)
+    if os.path.exists(link_path) and not os.path.islink(link_path):
+        raise Exception("not a symlink: {0} (move it aside to build with a symlink)"
+                        .format(link_path))
+    parent_dir, link_name = os.path.split(os.path.abspath(link_path))
+    # Use a relative target so the tree can be moved as a whole.
+    target = os.path.relpath(build_dir, start=parent_dir)
+    previous_target = os.readlink(link_path) if os.path.islink(link_path) else None
+
+    temp_link_path = os.path.join(parent_dir, ".{0}.{1}.tmp".format(link_name, os.getpid()))
+    if os.path.lexists(temp_link_path):
+        os.remove(temp_link_path)
+    os.symlink(target, temp_link_path)
+    os.replace(temp_link_path, link_path)
+    _log.info("pointed {0} at: {1}".format(link_path, target))
+
+    # Delete the build from two swaps ago.
+    previous_path = link_path + PREVIOUS_SUFFIX
+    if os.path.exists(previous_path):
+        with open(previous_path) as f:
+            retired = f.read().strip()
+        # Only delete directories made by make_build_dir().
+        if (retired.startswith(link_name + BUILD_DIR_INFIX) and
+                retired not in (target, previous_target)):
+            retired_dir = os.path.join(parent_dir, retired)
+            if os.path.isdir(retired_dir):
+                _log.info("removing old build: {0}".format(retired_dir))
+                shutil.rmtree(retired_dir)
+    with atomic_open(previous_path) as f:
+        f.write(previous_target or '')
@@ -0,0 +1,179 @@
+"""Supports computing election years and the election calendar.
+
+An object (e.g. an office) is up for election every term_length years
+starting from its seed_year.  The functions below compute election
+years in constant time rather than by stepping through the terms.
+
+The calendar is computed relative to a reference date.  For
+reproducible builds, the reference date can be pinned by passing it
+explicitly or by setting the environment variable named by
+ENV_REFERENCE_DATE (in YYYY-MM-DD format).  The JSON file records the
+reference date it was built with in _meta.reference_date, and the HTML
+is computed from that date unless another is passed, so that the pages
+agree with the JSON.  The repo's JSON file must be built with a pinned
+date, so that it does not change from day to day.
+
+"""
+
+from datetime import date, datetime
+import os
+
+from pyelect import inherit
+
+
+ENV_REFERENCE_DATE = 'SFBED_REFERENCE_DATE'
+REFERENCE_DATE_FORMAT = '%Y-%m-%d'
+
+# The key in the _meta node of the JSON data of the reference date the
+# data was built with, as a YYYY-MM-DD string.
+META_KEY_REFERENCE_DATE = 'reference_date'
+
+DEFAULT_HORIZON = 12
+
+NODE_NAME = 'election_calendar'
+
+# The nodes whose objects are included in the calendar, in the order
+# they should be processed.
+_CALENDAR_NODE_NAMES = ('bodies', 'offices')
+
+
+def parse_reference_date(text):
+    """Parse a YYYY-MM-DD string as a date."""
+    return datetime.strptime(text, REFERENCE_DATE_FORMAT).date()
+
+
+def get_pinned_reference_date(reference_date=None):
+    """Return the reference date passed or set in the environment, or None.
+
+    Arguments:
+      reference_date: a date, a YYYY-MM-DD string, or None.  If None,
+        the environment variable is used if set.
+    """
+    if reference_date is None:
+        reference_date = os.environ.get(ENV_REFERENCE_DATE) or None
+    if isinstance(reference_date, str):
+        reference_date = parse_reference_date(reference_date)
+    return reference_date
+
+
+def get_reference_date(reference_date=None):
+    """Return the reference date to use for the calendar.
+
+    Arguments:
+      reference_date: a date, a YYYY-MM-DD string, or None.  If None,
+        the environment variable is used if set, and otherwise today.
+    """
+    reference_date = get_pinned_reference_date(reference_date)
+    if reference_date is None:
+        return date.today()
+    return reference_date
+
+
+def get_data_reference_date(json_data, reference_date=None):
+    """Return the reference date to use with the given JSON data.
+
+    Defaults to the date the JSON data was built with, if it records one,
+    and otherwise to get_reference_date().
+
+    Arguments:
+      reference_date: a date, a YYYY-MM-DD string, or None.
+    """
+    if reference_date is None:
+        reference_date = json_data.get('_meta', {}).get(META_KEY_REFERENCE_DATE)
+    return get_reference_date(reference_date)
+
+
+def get_schedule(obj):
+    """Return the (seed_year, term_length) pair of an object, or None.
+
+    The object can be a read-only view including inherited values.
+    """
+    term_length = obj.get('term_length')
+    # TODO: make this required.
+    if not term_length:
+        return None
+    seed_year = obj.get('seed_year')
+    if seed_year is None:
+        return None
+    return seed_year, term_length
+
+
+def next_election_year(seed_year, term_length, year):
+    """Return the first election year on or after the given year."""
+    return year + (seed_year - year) % term_length
+
+
+def previous_election_year(seed_year, term_length, year):
+    """Return the last election year before the given year."""
+    return next_election_year(seed_year, term_length, year) - term_length
+
+
+def is_election_year(seed_year, term_length, year):
+    return (year - seed_year) % term_length == 0
+
+
+def compute_next_election_year(obj, reference_date=None):
+    """Return the next election year for an object, or None if unknown."""
+    schedule = get_schedule(obj)
+    if schedule is None:
+        return None
+    year = get_reference_date(reference_date).year
+    return next_election_year(*schedule, year=year)
+
+
+def make_calendar_index(json_data, reference_date=None, horizon=None):
+    """Return a dict mapping year to the bodies and offices up for election.
+
+    Offices inherit their schedule from their body when they do not have
+    their own.  A body is included in a year if it or any of its offices
+    is up for election that year.
+
+    Arguments:
+      json_data: a dict of JSON nodes.
+      horizon: the number of years to include, starting with the year
+        of the reference date.
+    """
+    if horizon is None:
+        horizon = DEFAULT_HORIZON
+    start_year = get_reference_date(reference_date).year
+    end_year = start_year + horizon
+
+    index = {year: {'body_ids': set(), 'office_ids': set()} for
+             year in range(start_year, end_year)}
+    resolver = inherit.Resolver(json_data)
+
+    for node_name in _CALENDAR_NODE_NAMES:
+        node = json_data[node_name]
+        for object_id in node.keys():
+            obj = resolver.get_view(node_name, object_id)
+            schedule = get_schedule(obj)
+            if schedule is None:
+                continue
+            seed_year, term_length = schedule
+            year = next_election_year(seed_year, term_length, start_year)
+            for year in range(year, end_year, term_length):
+                entry = index[year]
+                if node_name == 'offices':
+                    entry['office_ids'].add(object_id)
+                    body_id = obj.get('body_id')
+                    if body_id is not None:
+                        entry['body_ids'].add(body_id)
+                else:
+                    entry['body_ids'].add(object_id)
+
+    return index
+
+
+def make_calendar_node(json_data, reference_date=None, horizon=None):
+    """Return the calendar as a JSON node keyed by year (as a string)."""
+    index = make_calendar_index(json_data, reference_date=reference_date,
+                                horizon=horizon)
+    node = {}
+    for year, entry in index.items():
+        node[str(year)] = {
+            'body_ids': sorted(entry['body_ids']),
+            'office_ids': sorted(entry['office_ids']),
+            'year': year,
+        }
+
+    return node
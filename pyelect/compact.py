@@ -0,0 +1,252 @@
+"""Supports a compact form of the JSON data, for clients on slow networks.
+
+The compact form stores the same data as the JSON file in less space,
+and expand() turns it back into exactly the JSON file's data.
+
+In the compact form, the objects of each node are numbered in order of
+their ID's, and each node is stored as a list of ID's, a list of fields,
+and one row of values per object (so attribute names are not repeated
+in every object).  Fields referencing the objects of a node (like
+"body_id" or "name_i18n") store those numbers instead of ID's.  Strings
+occurring more than once in the other fields are stored once, in a
+string table, and referenced by position.
+
+Structure
+---------
+
+The compact form is a dict with these keys:
+
+version:
+  The format version, FORMAT_VERSION.
+
+strings:
+  The string table: a list of strings.
+
+nodes:
+  A dict mapping node name to a dict with keys "ids" (the sorted object
+  ID's), "fields", and "rows".  Each field is a [name, type] or
+  [name, type, node_name] list, and each row a list with one value per
+  field, null meaning the object lacks the attribute.  The field types
+  are--
+
+    s:  a string, stored as a string table position, or as itself if
+        it occurs only once.
+    r:  an object ID in the given node, stored as its number.
+    rl: a list of object ID's in the given node, stored as numbers.
+    v:  any other value, stored as itself.
+
+other:
+  The nodes that are not dicts of objects (e.g. "_meta"), stored as is.
+
+"""
+
+from collections import Counter
+import json
+import logging
+import os
+
+
+_log = logging.getLogger()
+
+FORMAT_VERSION = 1
+
+KEY_IDS = 'ids'
+KEY_FIELDS = 'fields'
+KEY_NODES = 'nodes'
+KEY_OTHER = 'other'
+KEY_ROWS = 'rows'
+KEY_STRINGS = 'strings'
+KEY_VERSION = 'version'
+
+FIELD_REF = 'r'
+FIELD_REF_LIST = 'rl'
+FIELD_STRING = 's'
+FIELD_VALUE = 'v'
+
+NODE_PHRASES = 'phrases'
+
+_I18N_SUFFIX = '_i18n'
+_REF_SUFFIXES = ('_id', '_ids')
+
+
+def is_object_node(node):
+    """Return whether a node is a dict of objects with no null values."""
+    # Rows store missing attributes as null, so null values cannot be rows.
+    return (isinstance(node, dict) and
+            all(isinstance(obj, dict) and None not in obj.values() for obj in node.values()))
+
+
+def _pluralize(name):
+    if name.endswith('y'):
+        return name[:-1] + 'ies'
+    return name + 's'
+
+
+def get_ref_node_candidate(field_name, node_names):
+    """Return the node a field's name says it references, or None.
+
+    For example, "body_id" and "body_ids" reference "bodies", and
+    "jurisdiction_area_id" references "areas".
+    """
+    if field_name.endswith(_I18N_SUFFIX):
+        return NODE_PHRASES if NODE_PHRASES in node_names else None
+    for suffix in _REF_SUFFIXES:
+        if field_name.endswith(suffix):
+            break
+    else:
+        return None
+    words = field_name[:-len(suffix)].split('_')
+    # Try the longest name first, e.g. "district_types" before "types".
+    for i in range(len(words)):
+        node_name = _pluralize("_".join(words[i:]))
+        if node_name in node_names:
+            return node_name
+    return None
+
+
+def _get_field_type(values, target_ids):
+    """Return the type of a field.
+
+    Arguments:
+      values: the field's values.
+      target_ids: the ID's of the node the field's name references, or
+        None if it references none.
+    """
+    if target_ids is not None:
+        if all(isinstance(value, str) and value in target_ids for value in values):
+            return FIELD_REF
+        if all(isinstance(value, list) and
+               all(isinstance(item, str) and item in target_ids for item in value)
+               for value in values):
+            return FIELD_REF_LIST
+    if all(isinstance(value, str) for value in values):
+        return FIELD_STRING
+    return FIELD_VALUE
+
+
+def _make_fields(node, node_name, object_nodes, id_numbers):
+    values_by_field = {}
+    for obj in node.values():
+        for field_name, value in obj.items():
+            values_by_field.setdefault(field_name, []).append(value)
+    fields = []
+    for field_name in sorted(values_by_field):
+        target = get_ref_node_candidate(field_name, object_nodes)
+        target_ids = None if target is None else id_numbers[target]
+        field_type = _get_field_type(values_by_field[field_name], target_ids)
+        if field_type in (FIELD_REF, FIELD_REF_LIST):
+            fields.append([field_name, field_type, target])
+        else:
+            if target is not None:
+                _log.debug("not encoding field {0}.{1} as a reference to: {2}"
+                           .format(node_name, field_name, target))
+            fields.append([field_name, field_type])
+    return fields
+
+
+def compact(json_data):
+    """Return the compact form of the JSON data (see the module docstring)."""
+    object_nodes = {node_name: node for node_name, node in json_data.items() if
+                    is_object_node(node)}
+    id_numbers = {node_name: {object_id: i for i, object_id in enumerate(sorted(node))}
+                  for node_name, node in object_nodes.items()}
+    node_fields = {node_name: _make_fields(node, node_name, object_nodes, id_numbers) for
+                   node_name, node in object_nodes.items()}
+
+    # Only strings occurring more than once go in the table, with the most
+    # common first so that they get the shortest positions.
+    counts = Counter()
+    for node_name, fields in node_fields.items():
+        string_fields = [field[0] for field in fields if field[1] == FIELD_STRING]
+        for obj in object_nodes[node_name].values():
+            counts.update(obj[name] for name in string_fields if name in obj)
+    strings = [s for s, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+               if count > 1]
+    string_numbers = {s: i for i, s in enumerate(strings)}
+
+    nodes = {}
+    for node_name, node in sorted(object_nodes.items()):
+        fields = node_fields[node_name]
+        rows = []
+        for object_id in sorted(node):
+            obj = node[object_id]
+            row = []
+            for field in fields:
+                field_name, field_type = field[:2]
+                try:
+                    value = obj[field_name]
+                except KeyError:
+                    row.append(None)
+                    continue
+                if field_type == FIELD_STRING:
+                    value = string_numbers.get(value, value)
+                elif field_type == FIELD_REF:
+                    value = id_numbers[field[2]][value]
+                elif field_type == FIELD_REF_LIST:
+                    numbers = id_numbers[field[2]]
+                    value = [numbers[item] for item in value]
+                row.append(value)
+            rows.append(row)
+        nodes[node_name] = {
+            KEY_IDS: sorted(node),
+            KEY_FIELDS: fields,
+            KEY_ROWS: rows,
+        }
+
+    return {
+        KEY_VERSION: FORMAT_VERSION,
+        KEY_STRINGS: strings,
+        KEY_NODES: nodes,
+        KEY_OTHER: {node_name: node for node_name, node in json_data.items() if
+                    node_name not in object_nodes},
+    }
+
+
+def expand(compact_data):
+    """Return the JSON data stored in its compact form."""
+    version = compact_data.get(KEY_VERSION)
+    if version != FORMAT_VERSION:
+        raise Exception("unsupported compact JSON version: {0!r}".format(version))
+    strings = compact_data[KEY_STRINGS]
+    nodes = compact_data[KEY_NODES]
+
+    json_data = dict(compact_data[KEY_OTHER])
+    for node_name, node in nodes.items():
+        fields = node[KEY_FIELDS]
+        objects = {}
+        for object_id, row in zip(node[KEY_IDS], node[KEY_ROWS]):
+            obj = {}
+            for field, value in zip(fields, row):
+                if value is None:
+                    continue
+                field_type = field[1]
+                if field_type == FIELD_STRING:
+                    if not isinstance(value, str):
+                        value = strings[value]
+                elif field_type == FIELD_REF:
+                    value = nodes[field[2]][KEY_IDS][value]
+                elif field_type == FIELD_REF_LIST:
+                    target_ids = nodes[field[2]][KEY_IDS]
+                    value = [target_ids[number] for number in value]
+                obj[field[0]] = value
+            objects[object_id] = obj
+        json_data[node_name] = objects
+    return json_data
+
+
+def get_compact_path(path):
+    """Return the path of the compact form of the JSON file at path."""
+    base, ext = os.path.splitext(path)
+    return "{0}.compact{1}".format(base, ext)
+
+
+def dumps(compact_data):
+    """Serialize the compact form to a string, without whitespace."""
+    return json.dumps(compact_data, ensure_ascii=False, sort_keys=True,
+                      separators=(',', ':'))
+
+
+def load(path):
+    """Read a compact JSON file, and return the expanded JSON data."""
+    with open(path) as f:
+        return expand(json.load(f))
@@ -0,0 +1,198 @@
+"""Supports finding which phrases are missing a translation.
+
+The coverage index is built in one pass over the phrases.  It assigns
+each text ID a bit position and stores, for each language, the phrases
+with a translation in that language as a bitset (a Python int whose
+bit i is set if the i-th text ID has one).  It also stores a bitset for
+each object type (e.g. "offices") of the phrases its objects reference.
+Queries like "which office phrases lack Filipino" are then a few integer
+operations instead of a scan of every translations dict.
+
+Terminology
+-----------
+
+expected:
+  A phrase is expected to have a translation in a language if the
+  translations files for that language list it.  Every phrase is
+  expected in every language, except that "edge" phrases are expected
+  only in the languages of LANGS_SHORT.
+
+object type:
+  The name of a JSON node whose objects reference phrases through their
+  "_i18n" fields, for example "bodies".
+
+"""
+
+from collections import defaultdict
+import logging
+
+from pyelect.lang import EDGE_STRING, I18N_SUFFIX, LANGS, LANGS_SHORT
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+_CACHE_NAME = 'coverage'
+
+# A one-item cache of (phrases, index), so the index is built once per
+# run.  The phrases dict is kept (rather than its id()) so that it cannot
+# be garbage-collected and its id() reused.
+_cached = None
+
+
+def is_expected(text_id, lang_code):
+    """Return whether a phrase should have a translation in the language."""
+    # This matches the text ID's lang._make_translations_texts() writes.
+    if EDGE_STRING in text_id:
+        return lang_code in LANGS_SHORT
+    return True
+
+
+def get_object_refs(json_data):
+    """Return a dict mapping text_id to the object types referencing it."""
+    refs = defaultdict(set)
+    for node_name, node in json_data.items():
+        if node_name == 'phrases' or not isinstance(node, dict):
+            continue
+        for obj in node.values():
+            if not isinstance(obj, dict):
+                continue
+            for key, value in obj.items():
+                if key.endswith(I18N_SUFFIX) and isinstance(value, str):
+                    refs[value].add(node_name)
+    return refs
+
+
+def _count_bits(mask):
+    return bin(mask).count('1')
+
+
+class CoverageIndex(object):
+
+    """An index of which phrases have a translation in each language."""
+
+    def __init__(self, phrases, object_refs=None, langs=None):
+        """
+        Arguments:
+          phrases: a phrases dict (see the lang module).
+          object_refs: a dict mapping text_id to an iterable of the object
+            types referencing it (see get_object_refs()).
+          langs: the language codes to index.  Defaults to lang.LANGS.
+        """
+        if object_refs is None:
+            object_refs = {}
+        if langs is None:
+            langs = LANGS
+        self.langs = tuple(langs)
+        self.text_ids = sorted(phrases)
+        self._positions = {text_id: i for i, text_id in enumerate(self.text_ids)}
+        self.all_mask = (1 << len(self.text_ids)) - 1
+
+        present = {lang_code: 0 for lang_code in self.langs}
+        expected = {lang_code: 0 for lang_code in self.langs}
+        type_masks = defaultdict(int)
+        for i, text_id in enumerate(self.text_ids):
+            bit = 1 << i
+            translations = phrases[text_id]
+            for lang_code in self.langs:
+                if translations.get(lang_code):
+                    present[lang_code] |= bit
+                if is_expected(text_id, lang_code):
+                    expected[lang_code] |= bit
+            for object_type in object_refs.get(text_id, ()):
+                type_masks[object_type] |= bit
+        self._present = present
+        self._expected = expected
+        self._type_masks = dict(type_masks)
+
+    @property
+    def object_types(self):
+        return sorted(self._type_masks)
+
+    def _check_lang(self, lang_code):
+        if lang_code not in self._present:
+            raise Exception("unknown language {0!r}: choose from: {1}"
+                            .format(lang_code, ", ".join(self.langs)))
+
+    def _get_type_mask(self, object_type):
+        if object_type is None:
+            return self.all_mask
+        try:
+            return self._type_masks[object_type]
+        except KeyError:
+            raise Exception("unknown object type {0!r}: choose from: {1}"
+                            .format(object_type, ", ".join(self.object_types)))
+
+    def _to_text_ids(self, mask):
+        text_ids = []
+        while mask:
+            low_bit = mask & -mask
+            text_ids.append(self.text_ids[low_bit.bit_length() - 1])
+            mask ^= low_bit
+        return text_ids
+
+    def get_present_mask(self, lang_code, object_type=None):
+        self._check_lang(lang_code)
+        return self._present[lang_code] & self._get_type_mask(object_type)
+
+    def get_missing_mask(self, lang_code, object_type=None):
+        self._check_lang(lang_code)
+        return (self._expected[lang_code] & ~self._present[lang_code] &
+                self._get_type_mask(object_type))
+
+    def get_expected_mask(self, lang_code, object_type=None):
+        self._check_lang(lang_code)
+        return self._expected[lang_code] & self._get_type_mask(object_type)
+
+    def get_present(self, lang_code, object_type=None):
+        """Return the sorted text ID's with a translation in the language."""
+        return self._to_text_ids(self.get_present_mask(lang_code, object_type))
+
+    def get_missing(self, lang_code, object_type=None):
+        """Return the sorted text ID's expected but missing in the language."""
+        return self._to_text_ids(self.get_missing_mask(lang_code, object_type))
+
+    def get_missing_langs(self, text_id):
+        """Return the languages a phrase is expected in but missing."""
+        bit = 1 << self._positions[text_id]
+        return [lang_code for lang_code in self.langs if
+                self._expected[lang_code] & bit and not self._present[lang_code] & bit]
+
+    def get_counts(self, lang_code, object_type=None):
+        """Return a dict of the expected, present, and missing counts."""
+        return {
+            'expected': _count_bits(self.get_expected_mask(lang_code, object_type)),
+            'missing': _count_bits(self.get_missing_mask(lang_code, object_type)),
+            # Only count translations of expected phrases.
+            'present': _count_bits(self.get_present_mask(lang_code, object_type) &
+                                   self._expected[lang_code]),
+        }
+
+    def make_summary(self):
+        """Return a dict of the counts by language and by object type."""
+        return {
+            'by_lang': {lang_code: self.get_counts(lang_code) for lang_code in self.langs},
+            'by_type': {object_type: {lang_code: self.get_counts(lang_code, object_type)
+                                      for lang_code in self.langs}
+                        for object_type in self.object_types},
+        }
+
+
+def get_coverage_index(json_data):
+    """Return the coverage index for the JSON data, building it at most once."""
+    global _cached
+    phrases = json_data['phrases']
+    if _cached is not None and _cached[0] is phrases:
+        metrics.record_cache(_CACHE_NAME, hit=True)
+        return _cached[1]
+    metrics.record_cache(_CACHE_NAME, hit=False)
+    with metrics.stage('coverage_index'):
+        index = CoverageIndex(phrases, object_refs=get_object_refs(json_data))
+    _cached = (phrases, index)
+    return index
+
+
+def format_percent(present, expected):
+    if not expected:
+        return "100%"
+    return "{0}%".format(100 * present // expected)
@@ -0,0 +1,108 @@
+"""Supports generating numbered families of objects from a declarative spec.
+
+A family describes many similar objects (for example, the eleven
+Supervisorial districts) with a single entry in the families pre-data
+file.  Each family spec is a dict with the following keys:
+
+  node: the name of the node the members belong to, for example "offices".
+  id_format: a format string for the object ID of each member.
+  numbers: a list of member numbers.  Alternatively, number_range can
+    give the first and last number of an inclusive range.
+  number_attr: optionally, the attribute to set to the member number.
+  attributes: optionally, attribute values shared by every member.
+  attribute_formats: optionally, a dict mapping attribute name to a
+    format string for the attribute value.
+  overrides: optionally, a dict mapping member number to a dict of
+    attribute values for that member only.
+
+The format strings can use the replacement fields {number} and
+{ordinal} (for example, "17th").
+
+The members are generated when the node is built (see add_members()),
+and each member is a read-only view that shares the family's attributes
+rather than copying them.  Only the attributes formatted per member are
+stored per member.
+
+"""
+
+from pyelect import inherit
+
+
+FILE_BASE_FAMILIES = 'families'
+
+_ORDINAL_SUFFIXES = {1: 'st', 2: 'nd', 3: 'rd'}
+
+
+def make_ordinal(number):
+    """Return the ordinal string for a number, for example "17th"."""
+    if 10 <= number % 100 <= 20:
+        suffix = 'th'
+    else:
+        suffix = _ORDINAL_SUFFIXES.get(number % 10, 'th')
+    return "{0}{1}".format(number, suffix)
+
+
+def get_member_numbers(family_id, spec):
+    """Return the iterable of member numbers for a family spec."""
+    numbers = spec.get('numbers')
+    number_range = spec.get('number_range')
+    if (numbers is None) == (number_range is None):
+        raise Exception("family {0!r} must have exactly one of numbers "
+                        "and number_range".format(family_id))
+    if numbers is not None:
+        return numbers
+    first, last = number_range
+    return range(first, last + 1)
+
+
+def iter_members(family_id, spec):
+    """Yield an (object_id, object) pair for each member of a family."""
+    id_format = spec['id_format']
+    number_attr = spec.get('number_attr')
+    shared = spec.get('attributes', {})
+    attribute_formats = spec.get('attribute_formats', {})
+    overrides = spec.get('overrides', {})
+
+    for number in get_member_numbers(family_id, spec):
+        format_kwargs = {'number': number, 'ordinal': make_ordinal(number)}
+        own = {name: value_format.format(**format_kwargs) for
+               name, value_format in attribute_formats.items()}
+        if number_attr is not None:
+            own[number_attr] = number
+        layers = [own, shared]
+        try:
+            layers.insert(0, overrides[number])
+        except KeyError:
+            pass
+        object_id = id_format.format(**format_kwargs)
+        yield object_id, inherit.InheritedView(layers)
+
+
+def iter_node_members(families, node_name):
+    """Yield the (object_id, object) pairs of all families in a node."""
+    for family_id in sorted(families.keys()):
+        spec = families[family_id]
+        if spec['node'] != node_name:
+            continue
+        for item in iter_members(family_id, spec):
+            yield item
+
+
+def add_members(objects, families, node_name):
+    """Return a new dict of the given objects plus the node's family members.
+
+    Every member is generated up front, so that an ID clashing with
+    another object's is reported while building the node.
+
+    Arguments:
+      objects: a dict mapping object ID to object.
+      families: a dict mapping family ID to family spec.
+    """
+    objects = dict(objects)
+    for object_id, obj in iter_node_members(families, node_name):
+        if object_id in objects:
+            raise Exception("family member {0!r} already in node: {1}"
+                            .format(object_id, node_name))
+        objects[object_id] = obj
+
+    return objects
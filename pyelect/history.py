@@ -0,0 +1,229 @@
+"""Supports storing versioned snapshots of the JSON data.
+
+Each snapshot is stored in a local history directory as either a full
+copy of the JSON data or a delta against the previous version.  A delta
+stores, for each node, only the objects that were added or changed and
+the ID's of the objects that were removed.  A full copy is stored every
+KEYFRAME_INTERVAL versions so that reconstructing any version applies a
+bounded number of deltas.
+
+The history directory contains an index file listing the versions, and
+one file per version.
+
+"""
+
+from datetime import datetime
+import json
+import logging
+import os
+
+from pyelect import utils
+
+
+_log = logging.getLogger()
+
+DEFAULT_REL_DIR = os.path.join('_build', 'json_history')
+FILE_NAME_INDEX = 'index.json'
+KEYFRAME_INTERVAL = 20
+
+KIND_DELTA = 'delta'
+KIND_FULL = 'full'
+
+_CREATED_FORMAT = '%Y-%m-%dT%H:%M:%S'
+_KEY_VERSIONS = 'versions'
+
+# Maps (history dir, version) to the reconstructed JSON data.
+_cache = {}
+
+
+def get_history_dir(history_dir=None):
+    if history_dir is None:
+        repo_dir = utils.get_repo_dir()
+        history_dir = os.path.join(repo_dir, DEFAULT_REL_DIR)
+    return history_dir
+
+
+def _dumps(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _get_version_file_name(version):
+    return "{0:06d}.json".format(version)
+
+
+def read_index(history_dir=None):
+    """Return the list of version info dicts, oldest first."""
+    history_dir = get_history_dir(history_dir)
+    path = os.path.join(history_dir, FILE_NAME_INDEX)
+    if not os.path.exists(path):
+        return []
+    data = _read_json(path)
+    return data[_KEY_VERSIONS]
+
+
+def _write_index(history_dir, versions):
+    path = os.path.join(history_dir, FILE_NAME_INDEX)
+    utils.write(path, json.dumps({_KEY_VERSIONS: versions}, indent=4, sort_keys=True))
+
+
+def make_delta(old_data, new_data):
+    """Return the per-node, per-object delta from old_data to new_data."""
+    delta = {}
+    removed_nodes = sorted(set(old_data) - set(new_data))
+    for node_name, new_node in new_data.items():
+        old_node = old_data.get(node_name, {})
+        changed = {object_id: obj for object_id, obj in new_node.items() if
+                   old_node.get(object_id) != obj}
+        removed = sorted(set(old_node) - set(new_node))
+        if changed or removed:
+            delta[node_name] = {'changed': changed, 'removed': removed}
+    return {'nodes': delta, 'removed_nodes': removed_nodes}
+
+
+def apply_delta(data, delta):
+    """Return a new copy of data with the delta applied.
+
+    Nodes not touched by the delta are shared with the input.
+    """
+    data = dict(data)
+    for node_name in delta['removed_nodes']:
+        del data[node_name]
+    for node_name, node_delta in delta['nodes'].items():
+        node = dict(data.get(node_name, {}))
+        for object_id in node_delta['removed']:
+            del node[object_id]
+        node.update(node_delta['changed'])
+        data[node_name] = node
+    return data
+
+
+def load_version(version, history_dir=None):
+    """Return the JSON data for the given version number.
+
+    The return value should be treated as read-only, since parts of it
+    are shared with other reconstructed versions.
+    """
+    history_dir = get_history_dir(history_dir)
+    key = (history_dir, version)
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+
+    versions = read_index(history_dir)
+    infos = {info['version']: info for info in versions}
+    try:
+        info = infos[version]
+    except KeyError:
+        raise Exception("no version {0} in: {1}".format(version, history_dir))
+
+    path = os.path.join(history_dir, info['file'])
+    stored = _read_json(path)
+    if info['kind'] == KIND_FULL:
+        data = stored
+    else:
+        previous = load_version(info['base'], history_dir=history_dir)
+        data = apply_delta(previous, stored)
+
+    _cache[key] = data
+    return data
+
+
+def _parse_as_of(as_of):
+    # Accept either a date or a date and time.
+    for date_format in (_CREATED_FORMAT, '%Y-%m-%d'):
+        try:
+            return datetime.strptime(as_of, date_format)
+        except ValueError:
+            pass
+    raise Exception("as_of should be a version number or have the form "
+                    "YYYY-MM-DD[THH:MM:SS]: {0!r}".format(as_of))
+
+
+def resolve_as_of(as_of, history_dir=None):
+    """Return the version number for a version number or date string.
+
+    For a date string, returns the last version created at or before
+    that time (a date alone is treated as the end of that day).
+    """
+    versions = read_index(history_dir)
+    if not versions:
+        raise Exception("no versions in: {0}".format(get_history_dir(history_dir)))
+    if isinstance(as_of, int) or str(as_of).isdigit():
+        return int(as_of)
+    as_of_time = _parse_as_of(as_of)
+    if len(as_of) == len('YYYY-MM-DD'):
+        as_of_time = as_of_time.replace(hour=23, minute=59, second=59)
+    version = None
+    for info in versions:
+        created = datetime.strptime(info['created'], _CREATED_FORMAT)
+        if created > as_of_time:
+            break
+        version = info['version']
+    if version is None:
+        raise Exception("no version as of: {0}".format(as_of))
+    return version
+
+
+def load_as_of(as_of, history_dir=None):
+    """Return the JSON data as of a version number or date string."""
+    version = resolve_as_of(as_of, history_dir=history_dir)
+    return load_version(version, history_dir=history_dir)
+
+
+def add_snapshot(json_data, history_dir=None, created=None):
+    """Store the JSON data as a new version, and return its version number.
+
+    If the data is identical to the latest version, no new version is
+    stored and the latest version number is returned.
+
+    Arguments:
+      json_data: the JSON data as plain dicts (e.g. as read from file).
+    """
+    history_dir = get_history_dir(history_dir)
+    if created is None:
+        created = datetime.now()
+    versions = read_index(history_dir)
+    data_hash = utils.compute_json_hash(json_data)
+
+    if versions:
+        latest = versions[-1]
+        if latest['hash'] == data_hash:
+            _log.info("json unchanged since version: {0}".format(latest['version']))
+            return latest['version']
+        version = latest['version'] + 1
+    else:
+        latest = None
+        version = 1
+
+    if latest is None or (version - 1) % KEYFRAME_INTERVAL == 0:
+        kind = KIND_FULL
+        stored = json_data
+    else:
+        kind = KIND_DELTA
+        previous = load_version(latest['version'], history_dir=history_dir)
+        stored = make_delta(previous, json_data)
+
+    info = {
+        'created': created.strftime(_CREATED_FORMAT),
+        'file': _get_version_file_name(version),
+        'hash': data_hash,
+        'kind': kind,
+        'version': version,
+    }
+    if kind == KIND_DELTA:
+        info['base'] = latest['version']
+
+    if not os.path.exists(history_dir):
+        os.makedirs(history_dir)
+    utils.write(os.path.join(history_dir, info['file']), _dumps(stored))
+    versions.append(info)
+    _write_index(history_dir, versions)
+    _cache[(history_dir, version)] = json_data
+
+    return version
@@ -0,0 +1,136 @@
+"""Supports fingerprinting the static files in the HTML output.
+
+Fingerprinting copies each static file to a name containing a hash of
+its contents (e.g. css/style.3f2a9c1e04.css), and the rendered pages
+link to those names via the asset_url template tag.  Since a file's
+fingerprinted name changes whenever its contents do, a web server can
+serve the fingerprinted files with long-lived, immutable cache headers.
+
+The files are also left at their original names, since other sites may
+link to them (e.g. to the JSON data).  The mapping from original to
+fingerprinted name is written to a manifest file in the output directory.
+Each build reads the previous build's manifest to delete the
+fingerprinted copies it no longer links to, so they do not build up in
+the output directory (and get deployed).
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from pyelect import atomic
+from pyelect.html import optimize
+from pyelect import metrics
+from pyelect import utils
+
+
+_log = logging.getLogger()
+
+MANIFEST_FILE_NAME = 'asset_manifest.json'
+# The number of hex digits of the hash to include in file names.
+HASH_LENGTH = 10
+
+
+def make_fingerprinted_path(rel_path, data):
+    """Return the path with a hash of the given bytes inserted before the extension."""
+    digest = hashlib.sha1(data).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(rel_path)
+    return "{0}.{1}{2}".format(base, digest, ext)
+
+
+def get_asset_url(manifest, rel_path):
+    """Return the URL to use for a static file, given its original path.
+
+    Returns the path unchanged if it was not fingerprinted.
+    """
+    return manifest.get(rel_path, rel_path)
+
+
+def remove_stale_files(output_dir, manifest):
+    """Delete the fingerprinted copies of the previous build not in a manifest.
+
+    The previous build's copies are the ones listed in the manifest file
+    in the output directory, so no other files are deleted.  Their
+    gzipped copies (see the optimize module) are also deleted.
+
+    Arguments:
+      manifest: the manifest of the new build, or an empty dict to delete
+        every copy (e.g. when no longer fingerprinting).
+    """
+    old_manifest = read_manifest(output_dir)
+    if old_manifest is None:
+        return
+    keep = set(manifest.values())
+    for rel_path in sorted(set(old_manifest.values()) - keep):
+        path = os.path.join(output_dir, rel_path)
+        for stale_path in (path, optimize.get_gzip_path(path)):
+            try:
+                os.remove(stale_path)
+            except FileNotFoundError:
+                continue
+            _log.info("deleted: {0}".format(stale_path))
+            metrics.incr(metrics.METRIC_FILES_DELETED)
+
+
+def fingerprint_files(output_dir, paths):
+    """Write a fingerprinted copy of each file, and return the manifest.
+
+    The previous build's copies that are no longer needed are deleted
+    first (see remove_stale_files()).
+
+    Arguments:
+      paths: the paths of files in the output directory.
+
+    Returns a dict mapping the original path of each file to its
+    fingerprinted path, both relative to the output directory and with
+    "/" separators.
+    """
+    manifest = {}
+    # Tuples of (path, data, fingerprinted path) of the files to copy.
+    sources = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        rel_path = os.path.relpath(path, start=output_dir).replace(os.sep, '/')
+        rel_target_path = make_fingerprinted_path(rel_path, data)
+        manifest[rel_path] = rel_target_path
+        sources.append((path, data, rel_target_path))
+
+    remove_stale_files(output_dir, manifest)
+
+    for path, data, rel_target_path in sources:
+        target_path = os.path.join(output_dir, rel_target_path)
+        # The same name means the same contents, so skip existing copies.
+        if not os.path.exists(target_path):
+            _log.info("copying file to: {0}".format(target_path))
+            atomic.copy_file(path, target_path)
+            metrics.incr(metrics.METRIC_FILES_COPIED)
+            metrics.incr(metrics.METRIC_BYTES_WRITTEN, len(data))
+    return manifest
+
+
+def read_manifest(output_dir):
+    """Return the manifest in an output directory, or None if it has none."""
+    path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    text = json.dumps(manifest, indent=4, sort_keys=True)
+    utils.write(path, text + "\n")
+
+
+def remove_fingerprinted_files(output_dir):
+    """Delete the previous build's fingerprinted copies and manifest, if any."""
+    remove_stale_files(output_dir, {})
+    try:
+        os.remove(os.path.join(output_dir, MANIFEST_FILE_NAME))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,120 @@
+"""Supports comparing the speed of the template engines.
+
+Each engine renders the same pages from the same template data, so the
+timings only differ by the engine.
+
+"""
+
+import logging
+import os
+import re
+import time
+
+from pyelect.html import context
+from pyelect.html import engines
+from pyelect.html import generator
+from pyelect import jsongen
+
+
+_log = logging.getLogger()
+
+DEFAULT_REPEAT = 20
+
+_TAG_SPACE_PATTERN = re.compile(r'\s*(<[^>]+>)\s*')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def normalize_html(html):
+    """Return the HTML with insignificant whitespace differences removed."""
+    html = _TAG_SPACE_PATTERN.sub(r'\1', html)
+    return _SPACE_PATTERN.sub(' ', html).strip()
+
+
+class EngineResult(object):
+
+    def __init__(self, engine_name):
+        self.engine_name = engine_name
+        self.init_seconds = None
+        # Maps page file name to a (first_seconds, mean_seconds) pair.
+        self.page_seconds = {}
+        # Maps page file name to the normalized HTML.
+        self.page_html = {}
+
+    def get_total_seconds(self):
+        return sum(mean for first, mean in self.page_seconds.values())
+
+
+def _time_engine(engine_name, html_data, page_names, repeat):
+    result = EngineResult(engine_name)
+    start = time.perf_counter()
+    engine = engines.get_engine(engine_name)
+    result.init_seconds = time.perf_counter() - start
+    for file_name in page_names:
+        page_base = os.path.splitext(file_name)[0]
+        times = []
+        for i in range(repeat):
+            # Include making the template data, as rendering a page does.
+            start = time.perf_counter()
+            data = context.make_template_data(html_data, page_base)
+            html = generator.render_template(engine, file_name, data)
+            times.append(time.perf_counter() - start)
+        later_times = times[1:] or times
+        result.page_seconds[file_name] = (times[0], sum(later_times) / len(later_times))
+        result.page_html[file_name] = normalize_html(html)
+    return result
+
+
+def run_benchmark(engine_names=None, page_names=None, repeat=None, reference_date=None):
+    """Render the pages with each engine, and return a list of EngineResult objects."""
+    if engine_names is None:
+        engine_names = engines.ENGINES
+    if page_names is None:
+        page_names = sorted(generator.get_template_page_file_names())
+    if repeat is None:
+        repeat = DEFAULT_REPEAT
+    json_data = jsongen.get_json()
+    html_data = context.make_html_data(json_data, reference_date=reference_date)
+    results = []
+    for engine_name in engine_names:
+        _log.info("benchmarking engine: {0}".format(engine_name))
+        results.append(_time_engine(engine_name, html_data, page_names, repeat))
+    return results
+
+
+def _format_ms(seconds):
+    return "{0:11.2f}".format(1000 * seconds)
+
+
+def format_results(results):
+    """Return a text table of the results, in milliseconds."""
+    names = [result.engine_name for result in results]
+    header = "{0:<24}".format('page (ms)') + "".join(
+        "{0:>11}{1:>11}".format(name + ' 1st', name + ' avg') for name in names)
+    lines = [header]
+    lines.append("{0:<24}".format('engine init') +
+                 "".join(_format_ms(r.init_seconds) + " " * 11 for r in results).rstrip())
+    page_names = sorted(results[0].page_seconds) if results else []
+    for file_name in page_names:
+        cells = []
+        for result in results:
+            first, mean = result.page_seconds[file_name]
+            cells.append(_format_ms(first) + _format_ms(mean))
+        lines.append("{0:<24}".format(file_name) + "".join(cells))
+    lines.append("{0:<24}".format('total (avg)') +
+                 "".join(" " * 11 + _format_ms(r.get_total_seconds()) for r in results))
+
+    if len(results) > 1:
+        base = results[0]
+        for result in results[1:]:
+            differing = [name for name in page_names if
+                         result.page_html[name] != base.page_html[name]]
+            if differing:
+                text = "differ on: {0}".format(", ".join(differing))
+            else:
+                text = "match on all pages"
+            lines.append("{0} vs {1} (up to whitespace): {2}"
+                         .format(base.engine_name, result.engine_name, text))
+            lines.append("{0} speedup: {1:.1f}x"
+                         .format(result.engine_name,
+                                 base.get_total_seconds() / result.get_total_seconds()))
+    return "\n".join(lines)
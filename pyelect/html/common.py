@@ -3,29 +3,19 @@ from pyelect import lang
 
 NON_ENGLISH_ORDER = [lang.LANG_CHINESE, lang.LANG_SPANISH, lang.LANG_FILIPINO]
 
-_SINGULAR_TO_PLURAL = {
-    'body': 'bodies',
-    'category': 'categories',
+_LABEL_TEXTS = {
+    'none': 'Single',
+    'unknown': 'Unknown',
 }
 
-_PLURAL_TO_SINGULAR = {p: s for s, p in _SINGULAR_TO_PLURAL.items()}
 
-
-def type_name_to_plural(singular):
-    """Return the node name given an object type name.
-
-    For example, "body" yields "bodies".
-    """
-    try:
-        plural = _SINGULAR_TO_PLURAL[singular]
-    except KeyError:
-        plural = "{0}s".format(singular)
-    return plural
-
-
-def type_name_to_singular(plural):
+def label_to_text(label):
+    text = None
     try:
-        singular = _PLURAL_TO_SINGULAR[plural]
-    except KeyError:
-        singular = plural[:-1]
-    return singular
+        starts = label.startswith('=')
+    except AttributeError:
+        return text
+    if starts:
+        key = label[1:]
+        text = _LABEL_TEXTS[key]
+    return text
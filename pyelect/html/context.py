@@ -1,18 +1,17 @@
 
 from collections import defaultdict
-from datetime import date
 import logging
 import os
-from pprint import pformat, pprint
+from pprint import pprint
 
-from django.template import Context
-import yaml
-
-from pyelect.html import common
+from pyelect import calendar
+from pyelect import coverage
 from pyelect.html.common import NON_ENGLISH_ORDER
 from pyelect.html import pages
-from pyelect import lang
+from pyelect import inherit
 from pyelect.lang import I18N_SUFFIX, LANG_ENGLISH
+from pyelect import schema
+from pyelect import stats
 from pyelect import utils
 
 
@@ -51,107 +50,22 @@ category_party
 """.splitlines()
 
 
-OFFICE_BODY_COMMON_FIELDS_YAML = """\
-  -
-    name: category_id
-  -
-    name: election_method_id
-  -
-    name: name
-    type: i18n
-  -
-    name: notes
-  -
-    name: seed_year
-  -
-    name: term_length
-  -
-    name: twitter
-  -
-    name: url
-  -
-    name: wikipedia
-"""
-
-TYPE_FIELDS_YAML = """\
-body:
-{office_body_yaml}
-  -
-    name: district_type_id
-    required: true
-  -
-    name: jurisdiction_area_id
-    required: true
-  -
-    name: member_name
-  -
-    name: office_name
-  -
-    name: office_name_format
-  -
-    name: partisan
-    required: true
-  -
-    name: seat_count
-    required: true
-  -
-    name: seat_name_format
-category:
-  -
-    name: name
-    type: i18n
-district:
-  -
-    name: district_code
-  -
-    name: district_type_id
-  -
-    name: name
-    required: true
-  -
-    name: number
-  -
-    name: wikipedia
-district_type:
-  -
-    name: body_id
-  -
-    name: category_id
-  -
-    name: district_count
-  -
-    name: district_name_short_format
-  -
-    name: district_name_full_format
-    # Require this because it is used to generate the name.
-    required: true
-  -
-    name: geographic
-  -
-    name: name
-  -
-    name: name_singular
-    required: true
-  -
-    name: parent_area_id
-  -
-    name: wikipedia
-office:
-{office_body_yaml}
-  -
-    name: body_id
-  -
-    name: district_id
-  -
-    # TODO: make this required.
-    name: jurisdiction_area_id
-  -
-    name: partisan
-  -
-    name: seat
-  -
-    name: seat_name
-""".format(office_body_yaml=OFFICE_BODY_COMMON_FIELDS_YAML)
+# The template data nodes that can be built, mapped to the nodes each
+# one references while being built.  Every page also gets the phrases.
+_HTML_NODE_DEPENDENCIES = {
+    'areas': (),
+    'bodies': ('categories', ),
+    'categories': (),
+    # This node summarizes the translations of the phrases.
+    'coverage': (),
+    'district_types': ('categories', ),
+    'districts': ('categories', 'district_types'),
+    'election_methods': (),
+    'languages': (),
+    'offices': ('bodies', 'categories', 'districts'),
+    # This node also sets each district type's district_count_sf.
+    'stats': ('district_types', 'offices'),
+}
 
 
 class NodeNames(object):
@@ -167,20 +81,44 @@ def _make_category_ordering():
     return ordering
 
 
-def make_template_context(html_data, page_base):
+def get_required_node_names(node_names):
+    """Return the given template data node names with their dependencies."""
+    required = set()
+    remaining = list(node_names)
+    while remaining:
+        node_name = remaining.pop()
+        if node_name in required:
+            continue
+        required.add(node_name)
+        remaining.extend(_HTML_NODE_DEPENDENCIES.get(node_name, ()))
+    return required
+
+
+def get_page_node_names(page_base):
+    """Return the names of the template data nodes needed to render a page."""
+    page = pages.get_page_object(page_base)
+    return get_required_node_names(page.get_node_names())
+
+
+def make_template_data(html_data, page_base):
+    """Return the template variables for a page as a dict."""
     page = pages.get_page_object(page_base)
-    context = Context(html_data)
-    context['current_page'] = page_base
-    context['current_title'] = page.title
+    # Only pass the nodes the page declares, so the context (and any copies
+    # the template engine makes of it) stays small.
+    node_names = set(page.get_node_names())
+    data = {key: value for key, value in html_data.items() if
+            key not in _HTML_NODE_DEPENDENCIES or key in node_names}
+    data['current_page'] = page_base
+    data['current_title'] = page.title
 
     objects = page.get_objects(html_data)
     if not objects:
         raise Exception("no objects for: {0}".format(page_base))
-    context['current_objects'] = objects
+    data['current_objects'] = objects
 
-    context['current_show_template'] = page.get_show_template()
+    data['current_show_template'] = page.get_show_template()
 
-    return context
+    return data
 
 
 def make_translations(id_, json_data):
@@ -190,25 +128,6 @@ def make_translations(id_, json_data):
     return json_data
 
 
-def _compute_next_election_year(json_data):
-    term_length = json_data.get('term_length')
-    # TODO: make this required.
-    if not term_length:
-        return None
-    seed_year = json_data.get('seed_year')
-    if seed_year is None:
-        return None
-
-    year = date.today().year
-    # Find a year before the current year.
-    while seed_year >= year:
-        seed_year -= term_length
-    # Advance until the current or later.
-    while seed_year < year:
-        seed_year += term_length
-    return seed_year
-
-
 def make_phrases(json_data):
     """Return the phrases dict for the context."""
     phrases = json_data['phrases']
@@ -220,43 +139,9 @@ def make_phrases(json_data):
     return phrases
 
 
-# TODO: remove this function in favor of _set_html_object_fields().
-def _set_html_object_data(html_data, json_data, keys):
-    for key in keys:
-        value = json_data.get(key, None)
-        html_data[key] = value
-        # Include internationalized values when they are available, for all fields.
-        i18n_key = lang.get_i18n_field_name(key)
-        html_data[i18n_key] = json_data.get(i18n_key, None)
-
-
-def _set_html_object_fields(html_data, json_data, fields):
-    for field in fields:
-        field_name = field['name']
-        field_type = field.get('type', None)
-        value = json_data.get(field_name, None)
-        html_data[field_name] = value
-        if field_type == 'i18n':
-            # Include internationalized values when they are available, for all fields.
-            i18n_field_name = lang.get_i18n_field_name(field_name)
-            html_data[i18n_field_name] = json_data.get(i18n_field_name, None)
-
-
-# TODO: remove this function in favor of _make_html_object2().
-def _make_html_object(json_data, keys, object_id):
-    context = {'id': object_id}
-    _set_html_object_data(context, json_data, keys)
-    return context
-
-
-def _make_html_object2(json_data, fields, object_id):
-    context = {'id': object_id}
-    _set_html_object_fields(context, json_data, fields)
-    return context
-
-
-def _set_html_election_data(html_data, json_data):
-    html_data['next_election_year'] = _compute_next_election_year(json_data)
+def _set_html_election_data(html_data, json_data, reference_date):
+    next_year = calendar.compute_next_election_year(json_data, reference_date=reference_date)
+    html_data['next_election_year'] = next_year
 
 
 def get_from_html_data(html_data, json_obj, id_attr_name):
@@ -267,7 +152,7 @@ def get_from_html_data(html_data, json_obj, id_attr_name):
         return None
 
     type_name = id_attr_name[:-3]
-    node_name = common.type_name_to_plural(type_name)
+    node_name = schema.type_name_to_plural(type_name)
     object_map = html_data[node_name]
 
     obj = object_map[object_id]
@@ -276,18 +161,13 @@ def get_from_html_data(html_data, json_obj, id_attr_name):
 
 
 def make_one_areas(object_id, json_data, html_data=None):
-    keys = [
-        'name',
-        'notes',
-        'wikipedia'
-    ]
-    context = _make_html_object(json_data, keys, object_id)
-    return context
+    type_schema = schema.get_type_schema('area')
+    return type_schema.make_html_object(json_data, object_id)
 
 
-def make_one_bodies2(html_obj, html_data, json_obj):
+def make_one_bodies2(html_obj, html_data, json_obj, reference_date):
     # TODO: DRY this up with make_one_offices2().
-    _set_html_election_data(html_obj, html_obj)
+    _set_html_election_data(html_obj, html_obj, reference_date)
     _set_category_order(html_data, html_obj)
 
     return html_obj
@@ -301,7 +181,7 @@ def make_one_categories2(html_obj, html_data, json_obj, ordering):
     return html_obj
 
 
-def make_one_district_types2(html_obj, html_data, json_obj):
+def make_one_district_types2(html_obj, html_data, json_obj, resolver):
     name_format = html_obj['district_name_full_format']
     if name_format is None:
         name = html_obj['name_singular']
@@ -309,9 +189,8 @@ def make_one_district_types2(html_obj, html_data, json_obj):
         html_obj['district_name_full_format'] = name_format
 
     if not html_obj['category_id']:
-        body = get_from_html_data(html_data, json_obj, 'body_id')
-        category_id = body.get('category_id')
-        html_obj['category_id'] = category_id
+        effective = resolver.get_view('district_types', html_obj['id'])
+        html_obj['category_id'] = effective.get('category_id')
 
     _set_category_order(html_data, html_obj)
     # TODO: revisit message re: category_id.
@@ -321,10 +200,10 @@ def make_one_district_types2(html_obj, html_data, json_obj):
     return html_obj
 
 
-# TODO: inherit properties from district type (like office from body).
-def make_one_districts2(html_obj, html_data, json_obj):
+def make_one_districts2(html_obj, html_data, json_obj, resolver):
     district_type = get_from_html_data(html_data, json_obj, 'district_type_id')
-    category_id = district_type['category_id']
+    effective = resolver.get_view('districts', html_obj['id'])
+    category_id = effective.get('category_id')
 
     name_format = district_type['district_name_full_format']
     if name_format is not None:
@@ -343,19 +222,13 @@ def make_one_districts2(html_obj, html_data, json_obj):
 
 
 def make_one_election_methods(object_id, json_data, html_data=None):
-    keys = [
-        'name',
-        'notes',
-        'wikipedia',
-    ]
-    context = _make_html_object(json_data, keys, object_id)
-    return context
+    type_schema = schema.get_type_schema('election_method')
+    return type_schema.make_html_object(json_data, object_id)
 
 
 def make_one_languages(object_id, json_data, html_data=None):
-    keys = ('name', 'code', 'notes')
-    context = _make_html_object(json_data, keys, object_id)
-    return context
+    type_schema = schema.get_type_schema('language')
+    return type_schema.make_html_object(json_data, object_id)
 
 
 def _set_category_order(html_data, html_obj):
@@ -370,11 +243,9 @@ def _set_category_order(html_data, html_obj):
 
 
 # TODO: simplify this and DRY up with make_one_bodies().
-def make_one_offices2(html_obj, html_data, json_obj):
-    # TODO: come up with a pattern for inheriting properties between
-    # objects for which a relationship exists.
-    inherited_keys = ('partisan', 'seed_year', 'term_length')
-    effective = {k: html_obj[k] for k in inherited_keys}
+def make_one_offices2(html_obj, html_data, json_obj, resolver, reference_date):
+    # The office with the values inherited from its body, if any.
+    effective = resolver.get_view('offices', html_obj['id'])
 
     phrases = html_data[NodeNames.phrases]
     if 'body_id' in json_obj:
@@ -386,7 +257,7 @@ def make_one_offices2(html_obj, html_data, json_obj):
         html_obj['district_name_short'] = short_name
 
         body = get_from_html_data(html_data, json_obj, 'body_id')
-        html_obj['category_id'] = body['category_id']
+        html_obj['category_id'] = effective.get('category_id')
         member_name = body['member_name']
         html_obj['member_name'] = member_name
 
@@ -401,19 +272,15 @@ def make_one_offices2(html_obj, html_data, json_obj):
         else:
             office_name = office_name_format.format(**html_obj)
             html_obj['name'] = office_name
-        for k in inherited_keys:
-            if effective[k] is None:
-                effective[k] = body[k]
 
-    _set_html_election_data(html_obj, effective)
+    _set_html_election_data(html_obj, effective, reference_date)
     _set_category_order(html_data, html_obj)
 
     # TODO: remove this temporary check.
     if not html_obj['category_id'] or not html_obj['name']:
         return None
 
-    # TODO: use a real seat count.
-    html_obj['seat_count'] = 1
+    html_obj['seat_count'] = stats.get_seat_count(json_obj)
 
     return html_obj
 
@@ -474,42 +341,32 @@ def add_context_node(context, json_data, node_name, json_key=None, **kwargs):
     return objects
 
 
-def check_object(html_obj, fields):
-    for field in fields:
-        field_name = field['name']
-        if field_name not in html_obj:
-            raise Exception("field {0!r} missing: {1}".format(field_name, html_obj))
-        if not field.get('required'):
-            continue
-        if html_obj[field_name] is None:
-            raise Exception("field {0!r} should not be None:\n{1}".format(field_name, pformat(html_obj)))
-
-
-def add_html_node(html_data, json_data, field_data, base_name, json_key=None, **kwargs):
+def add_html_node(html_data, json_data, base_name, json_key=None, **kwargs):
     # TODO: document json_key vs. base_name.
     if json_key is None:
         json_key = base_name
     make_object_func_name = "make_one_{0}2".format(base_name, **kwargs)
     set_object_fields = globals()[make_object_func_name]
 
-    singular = common.type_name_to_singular(base_name)
-    fields = field_data[singular]
+    type_schema = schema.get_node_schema(base_name)
     json_node = json_data[json_key]
 
-    objects = {}
+    all_objects = {}
 
     # Sort the items to get repeatability.  This helps when troubleshooting
     # issues, so that the same item will error out when running a second time.
     for object_id in sorted(json_node.keys()):
         json_obj = json_node[object_id]
-        html_obj = _make_html_object2(json_obj, fields, object_id)
+        html_obj = type_schema.make_html_object(json_obj, object_id)
         set_object_fields(html_obj, html_data, json_obj, **kwargs)
-        # TODO: check the object.
-        check_object(html_obj, fields)
-        # TODO: remove this hack (used to skip offices).
-        if html_obj['name'] is None:
-            continue
-        objects[object_id] = html_obj
+        all_objects[object_id] = html_obj
+
+    # Check all objects at once so that every error is reported.
+    type_schema.check_html_node(all_objects)
+
+    # TODO: remove this hack (used to skip offices).
+    objects = {object_id: html_obj for object_id, html_obj in all_objects.items()
+               if html_obj['name'] is not None}
 
     html_data[base_name] = objects
 
@@ -517,9 +374,59 @@ def add_html_node(html_data, json_data, field_data, base_name, json_key=None, **
     return objects
 
 
+def make_coverage_node(json_data):
+    """Return the translation coverage data for the templates.
+
+    This computes everything the templates show up front, so rendering
+    does no coverage checks of its own.
+    """
+    index = coverage.get_coverage_index(json_data)
+    names = {language['code']: language['name'] for
+             language in json_data['languages'].values()}
+    langs = []
+    for lang_code in NON_ENGLISH_ORDER:
+        counts = index.get_counts(lang_code)
+        langs.append({
+            'name': names[lang_code],
+            'present': counts['present'],
+            'expected': counts['expected'],
+            'percent': coverage.format_percent(counts['present'], counts['expected']),
+        })
+    # Maps text_id to the names of the languages missing, or None if none.
+    missing_texts = {}
+    for text_id in index.text_ids:
+        missing_langs = index.get_missing_langs(text_id)
+        missing = [names[lang_code] for lang_code in NON_ENGLISH_ORDER if
+                   lang_code in missing_langs]
+        missing_texts[text_id] = ", ".join(missing) if missing else None
+    return {
+        'langs': langs,
+        'missing_texts': missing_texts,
+    }
+
+
 # TODO: switch this to use add_context_node() everywhere possible.
-def make_html_data(json_data, local_assets=False):
-    """Return the template data that will be used to create the context."""
+def make_html_data(json_data, local_assets=False, reference_date=None, node_names=None,
+                   asset_manifest=None):
+    """Return the template data that will be used to create the context.
+
+    Arguments:
+      reference_date: the date to compute next election years from.
+        Defaults to the date the JSON data was built with (see
+        calendar.get_data_reference_date()).
+      node_names: the names of the nodes to build, for example the return
+        value of get_page_node_names().  The nodes they depend on are also
+        built.  Defaults to all nodes.
+      asset_manifest: a dict mapping the paths of static files to the
+        paths to link to instead (see assets.fingerprint_files()).
+    """
+    if node_names is None:
+        node_names = _HTML_NODE_DEPENDENCIES.keys()
+    node_names = get_required_node_names(node_names)
+    if asset_manifest is None:
+        asset_manifest = {}
+
+    reference_date = calendar.get_data_reference_date(json_data, reference_date)
     category_ordering = _make_category_ordering()
 
     phrases = make_phrases(json_data)
@@ -529,6 +436,7 @@ def make_html_data(json_data, local_assets=False):
     jquery_prefix = _JQUERY_LOCAL if local_assets else _JQUERY_REMOTE
 
     html_data = {
+        'asset_manifest': asset_manifest,
         'jquery_prefix': jquery_prefix,
         'json_path': JSON_OUTPUT_PATH,
         'language_codes': [LANG_ENGLISH] + NON_ENGLISH_ORDER,
@@ -543,42 +451,46 @@ def make_html_data(json_data, local_assets=False):
         NodeNames.election_methods,
     ]
     for base_name in base_names:
-        add_context_node(html_data, json_data, base_name)
-
-    field_data = yaml.load(TYPE_FIELDS_YAML)
+        if base_name in node_names:
+            add_context_node(html_data, json_data, base_name)
 
     def _add_node(base_name, **kwargs):
-        add_html_node(html_data, json_data, field_data, base_name, **kwargs)
+        if base_name in node_names:
+            add_html_node(html_data, json_data, base_name, **kwargs)
 
     _add_node('categories', ordering=category_ordering)
+    _add_node('bodies', reference_date=reference_date)
 
+    resolver = inherit.Resolver(json_data)
     base_names = [
-        'bodies',
         'district_types',
         'districts',
-        'offices',
     ]
     for base_name in base_names:
-        _add_node(base_name)
-
-    offices = html_data['offices']
-    office_count = 0
-    for office in offices.values():
-        office_count += office['seat_count']
-    html_data['office_count'] = office_count
-
-    # Compute: district_count_sf
-    district_types = html_data['district_types']
-    for district in html_data['districts'].values():
-        district_type_id = district['district_type_id']
-        district_type = district_types[district_type_id]
-        try:
-            district_type['district_count_sf'] += 1
-        except KeyError:
-            district_type['district_count_sf'] = 1
+        _add_node(base_name, resolver=resolver)
+    _add_node('offices', resolver=resolver, reference_date=reference_date)
+
+    if stats.NODE_NAME in node_names:
+        offices = html_data['offices']
+        rollups = stats.get_rollups(json_data, reference_date=reference_date,
+                                    office_ids=offices.keys())
+        html_data[stats.NODE_NAME] = rollups
+        html_data['office_count'] = rollups['totals'][stats.MEASURE_SEATS]
+
+        # Set: district_count_sf
+        by_district_type = rollups[stats.get_dimension_key(stats.DIMENSION_DISTRICT_TYPE)]
+        for district_type_id, district_type in html_data['district_types'].items():
+            try:
+                measures = by_district_type[district_type_id]
+            except KeyError:
+                continue
+            district_type['district_count_sf'] = measures[stats.MEASURE_DISTRICTS]
 
-    languages = add_context_node(html_data, json_data, 'languages')
+    if 'languages' in node_names:
+        languages = add_context_node(html_data, json_data, 'languages')
+        html_data['language_map'] = {lang['code']: lang for lang in languages.values()}
 
-    html_data['language_map'] = {lang['code']: lang for lang in languages.values()}
+    if 'coverage' in node_names:
+        html_data['coverage'] = make_coverage_node(json_data)
 
     return html_data
@@ -0,0 +1,211 @@
+"""Supports deploying the HTML output, copying only the files that changed.
+
+Each build writes a manifest to its output directory listing every
+output file along with a hash of its contents and its size.  Deploying
+copies the build to a target directory, which stands in for the object
+store a site is served from.  The target keeps the manifest of the build
+last deployed to it, so a deploy compares the two manifests and copies
+only the new and changed files, and deletes the files no longer in the
+build.  The target's manifest is replaced last, so an interrupted deploy
+is completed by deploying again.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+
+from pyelect import atomic
+from pyelect import metrics
+from pyelect import utils
+
+
+_log = logging.getLogger()
+
+MANIFEST_FILE_NAME = 'build_manifest.json'
+FORMAT_VERSION = 1
+
+KEY_FILES = 'files'
+KEY_HASH = 'sha1'
+KEY_SIZE = 'size'
+
+
+def _get_file_info(path):
+    sha1 = hashlib.sha1()
+    size = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha1.update(chunk)
+            size += len(chunk)
+    return {KEY_HASH: sha1.hexdigest(), KEY_SIZE: size}
+
+
+def get_output_paths(dir_path):
+    """Return the sorted paths of the files in a directory, except the manifest.
+
+    The paths are relative to dir_path and have "/" separators.
+    """
+    rel_paths = []
+    for parent_dir, dir_names, file_names in os.walk(dir_path):
+        dir_names.sort()
+        for file_name in file_names:
+            path = os.path.join(parent_dir, file_name)
+            rel_path = os.path.relpath(path, start=dir_path).replace(os.sep, '/')
+            if rel_path != MANIFEST_FILE_NAME:
+                rel_paths.append(rel_path)
+    return sorted(rel_paths)
+
+
+def make_manifest(dir_path, workers=None):
+    """Return the manifest of the files in a directory.
+
+    Arguments:
+      workers: the number of worker threads, or None for the number of
+        CPUs.  hashlib releases the GIL while hashing, so threads hash in
+        parallel.
+    """
+    rel_paths = get_output_paths(dir_path)
+    paths = [os.path.join(dir_path, rel_path) for rel_path in rel_paths]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        infos = list(executor.map(_get_file_info, paths))
+    return {
+        'version': FORMAT_VERSION,
+        KEY_FILES: dict(zip(rel_paths, infos)),
+    }
+
+
+def read_manifest(dir_path):
+    """Return the manifest in a directory, or None if it has none."""
+    path = os.path.join(dir_path, MANIFEST_FILE_NAME)
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get('version') != FORMAT_VERSION:
+        raise Exception("unsupported manifest version {0!r} in: {1}"
+                        .format(manifest.get('version'), path))
+    return manifest
+
+
+def write_manifest(dir_path, manifest):
+    path = os.path.join(dir_path, MANIFEST_FILE_NAME)
+    text = json.dumps(manifest, indent=4, sort_keys=True)
+    utils.write(path, text + "\n")
+
+
+def remove_manifest(dir_path):
+    try:
+        os.remove(os.path.join(dir_path, MANIFEST_FILE_NAME))
+    except FileNotFoundError:
+        pass
+
+
+def write_build_manifest(dir_path):
+    """Write the manifest of the files in a build output directory."""
+    with metrics.stage('html_manifest'):
+        write_manifest(dir_path, make_manifest(dir_path))
+
+
+def diff_manifests(old_manifest, new_manifest):
+    """Return the paths to copy and the paths to delete, each sorted.
+
+    Arguments:
+      old_manifest: the manifest of the files already deployed, or None
+        if there are none.
+    """
+    old_files = {} if old_manifest is None else old_manifest[KEY_FILES]
+    new_files = new_manifest[KEY_FILES]
+    to_copy = sorted(rel_path for rel_path, info in new_files.items() if
+                     old_files.get(rel_path) != info)
+    to_delete = sorted(set(old_files) - set(new_files))
+    return to_copy, to_delete
+
+
+def _copy(source_dir, target_dir, rel_path):
+    source_path = os.path.join(source_dir, rel_path)
+    target_path = os.path.join(target_dir, rel_path)
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    atomic.copy_file(source_path, target_path)
+
+
+def _delete(target_dir, rel_path):
+    path = os.path.join(target_dir, rel_path)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    # Remove the directories left empty.
+    parent_dir = os.path.dirname(path)
+    try:
+        while os.path.normpath(parent_dir) != os.path.normpath(target_dir):
+            os.rmdir(parent_dir)
+            parent_dir = os.path.dirname(parent_dir)
+    except OSError:
+        pass
+
+
+def _deploy(source_dir, target_dir, full, dry_run, workers):
+    new_manifest = read_manifest(source_dir)
+    if new_manifest is None:
+        raise Exception("no {0} in: {1} (build the HTML first)"
+                        .format(MANIFEST_FILE_NAME, source_dir))
+    if full:
+        to_copy = sorted(new_manifest[KEY_FILES])
+        # Delete every other file in the target, whether or not the
+        # target's manifest lists it.
+        to_delete = [rel_path for rel_path in get_output_paths(target_dir) if
+                     rel_path not in new_manifest[KEY_FILES]]
+    else:
+        to_copy, to_delete = diff_manifests(read_manifest(target_dir), new_manifest)
+    if dry_run:
+        return to_copy, to_delete
+
+    os.makedirs(target_dir, exist_ok=True)
+    if workers is None:
+        # Copying mostly waits on I/O, so use more threads than CPUs.
+        workers = 4 * (os.cpu_count() or 1)
+    with metrics.stage('deploy_copy'):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Consume the results to raise any error.
+            list(executor.map(lambda rel_path: _copy(source_dir, target_dir, rel_path),
+                              to_copy))
+    new_files = new_manifest[KEY_FILES]
+    for rel_path in to_copy:
+        _log.info("copied: {0}".format(rel_path))
+        metrics.incr(metrics.METRIC_FILES_COPIED)
+        metrics.incr(metrics.METRIC_BYTES_WRITTEN, new_files[rel_path][KEY_SIZE])
+    with metrics.stage('deploy_delete'):
+        for rel_path in to_delete:
+            _log.info("deleting: {0}".format(rel_path))
+            _delete(target_dir, rel_path)
+            metrics.incr(metrics.METRIC_FILES_DELETED)
+    write_manifest(target_dir, new_manifest)
+    return to_copy, to_delete
+
+
+def deploy(source_dir, target_dir, full=False, dry_run=False, workers=None):
+    """Sync a build output directory to a target directory.
+
+    Holds the build lock of both directories (see the atomic module), so
+    that a build cannot change the source, and no other deploy the
+    target, part way through.
+
+    Returns the paths copied and the paths deleted.
+
+    Arguments:
+      full: whether to copy every file and delete every file not in the
+        build, ignoring the target's manifest (e.g. if files in the
+        target were changed by hand).
+      dry_run: whether to only return what would be copied and deleted.
+      workers: the number of files to copy at once, or None for a
+        default based on the number of CPUs.
+    """
+    with atomic.build_lock(source_dir):
+        with atomic.build_lock(target_dir):
+            return _deploy(source_dir, target_dir, full=full, dry_run=dry_run,
+                           workers=workers)
@@ -0,0 +1,117 @@
+"""Supports rendering templates with different template engines.
+
+The default engine uses the Django templates in the templates directory.
+The optional Jinja2 engine uses the equivalent templates in the
+templates_jinja directory, and caches the compiled templates on disk so
+that later runs can skip compiling them.  Both engines render the same
+pages, up to whitespace.
+
+"""
+
+import logging
+import os
+
+from pyelect import utils
+
+
+_log = logging.getLogger()
+
+ENGINE_DJANGO = 'django'
+ENGINE_JINJA2 = 'jinja2'
+
+ENGINES = (ENGINE_DJANGO, ENGINE_JINJA2)
+DEFAULT_ENGINE = ENGINE_DJANGO
+
+DIR_NAME_JINJA_TEMPLATES = 'templates_jinja'
+DEFAULT_REL_BYTECODE_CACHE_DIR = os.path.join('_build', 'jinja_cache')
+
+
+def get_jinja_templates_dir():
+    repo_dir = utils.get_repo_dir()
+    return os.path.join(repo_dir, DIR_NAME_JINJA_TEMPLATES)
+
+
+def get_default_bytecode_cache_dir():
+    repo_dir = utils.get_repo_dir()
+    return os.path.join(repo_dir, DEFAULT_REL_BYTECODE_CACHE_DIR)
+
+
+class DjangoEngine(object):
+
+    name = ENGINE_DJANGO
+
+    def __init__(self, debug=False):
+        from pyelect.html import templateconfig
+        templateconfig.init_django(debug=debug)
+        self.templates_dir = templateconfig.get_templates_dir()
+
+    def render(self, template_name, template_data):
+        """Render a template as a Unicode string.
+
+        Arguments:
+          template_name: the template path relative to the templates
+            directory, with "/" separators.
+          template_data: a dict of template variables.
+        """
+        from django.template import Context
+        from django.template.base import TemplateDoesNotExist
+        from django.template.loader import get_template
+        try:
+            template = get_template(template_name)
+        except TemplateDoesNotExist:
+            raise Exception("template does not exist: {0}".format(template_name))
+        return template.render(Context(template_data))
+
+
+class JinjaEngine(object):
+
+    name = ENGINE_JINJA2
+
+    def __init__(self, debug=False, cache_dir=None):
+        """
+        Arguments:
+          cache_dir: the directory in which to cache compiled templates.
+            Defaults to DEFAULT_REL_BYTECODE_CACHE_DIR in the repo.
+        """
+        try:
+            import jinja2
+        except ImportError:
+            raise Exception("the {0} engine requires Jinja2: pip install Jinja2"
+                            .format(ENGINE_JINJA2))
+        from pyelect.html import jinjatags
+        if cache_dir is None:
+            cache_dir = get_default_bytecode_cache_dir()
+        if not os.path.exists(cache_dir):
+            _log.info("creating dir: {0}".format(cache_dir))
+            os.makedirs(cache_dir)
+        self.templates_dir = get_jinja_templates_dir()
+        self.environment = jinjatags.make_environment(self.templates_dir, cache_dir=cache_dir)
+        if debug:
+            self.environment.undefined = jinja2.DebugUndefined
+
+    def render(self, template_name, template_data):
+        """Render a template as a Unicode string (see DjangoEngine.render)."""
+        import jinja2
+        try:
+            template = self.environment.get_template(template_name)
+        except jinja2.TemplateNotFound:
+            raise Exception("template does not exist: {0}".format(template_name))
+        return template.render(template_data)
+
+
+_ENGINE_CLASSES = {
+    ENGINE_DJANGO: DjangoEngine,
+    ENGINE_JINJA2: JinjaEngine,
+}
+
+
+def get_engine(name=None, **kwargs):
+    """Return a template engine object, initializing it if necessary."""
+    if name is None:
+        name = DEFAULT_ENGINE
+    try:
+        cls = _ENGINE_CLASSES[name]
+    except KeyError:
+        raise Exception("unknown engine {0!r}: choose from: {1}"
+                        .format(name, ", ".join(ENGINES)))
+    return cls(**kwargs)
@@ -6,11 +6,11 @@ import os
 from pprint import pprint
 import shutil
 
-from django.template.base import TemplateDoesNotExist
-from django.template.loader import get_template
-
-from pyelect.html import context, templateconfig
+from pyelect import atomic
+from pyelect.html import assets, context, deploy, engines, optimize, templateconfig
 from pyelect import jsongen
+from pyelect import metrics
+from pyelect import search
 from pyelect import utils
 
 
@@ -38,7 +38,8 @@ HTML_OUTPUT_SUB_DIRS = [
 
 
 def get_page_template_name(file_name):
-    return os.path.join(_DIR_NAME_TEMPLATE_PAGE, file_name)
+    # Template names use "/" separators with every engine.
+    return "{0}/{1}".format(_DIR_NAME_TEMPLATE_PAGE, file_name)
 
 
 def _get_template_page_dir():
@@ -58,25 +59,46 @@ def get_template_page_bases():
     return bases
 
 
-def render_template(file_name, context):
-    """Render the sample template as a Unicode string.
+def render_template(engine, file_name, data):
+    """Render a page template as a Unicode string.
 
-    Argument:
+    Arguments:
+      engine: a template engine object (see the engines module).
       data: a dict of template variables.
     """
-    template_name = get_page_template_name(file_name)
-    try:
-        template = get_template(template_name)
-    except TemplateDoesNotExist:
-        paths = templateconfig.get_template_page_file_names()
+    paths = get_template_page_file_names()
+    if file_name not in paths:
         raise Exception("possible file names:\n  {0}".format("\n  ".join(paths)))
-    return template.render(context)
+    template_name = get_page_template_name(file_name)
+    return engine.render(template_name, data)
+
+
+def render_page(engine, html_data, file_name):
+    """Render the page with the given template file name, and return it."""
+    page_base, ext = os.path.splitext(file_name)
+    with metrics.stage('html_render'):
+        data = context.make_template_data(html_data, page_base)
+        html = render_template(engine, file_name, data)
+    metrics.incr(metrics.METRIC_PAGES_RENDERED)
+    return html
+
+
+def get_static_dirs():
+    """Return the static file directories.
+
+    Returns a list of pairs of: (1) absolute source directory, and
+    (2) target directory relative to the HTML build directory.
+    """
+    repo_dir = utils.get_repo_dir()
+    return [(os.path.join(repo_dir, rel_source_dir), rel_target_dir) for
+            rel_source_dir, rel_target_dir in _STATIC_FILES_INFO]
 
 
 def create_dir(dir_path):
     if not os.path.exists(dir_path):
         _log.info("creating dir: {0}".format(dir_path))
-        os.makedirs(dir_path)
+        # Another build may create it at the same time.
+        os.makedirs(dir_path, exist_ok=True)
 
 
 def get_copy_info(source_dir, target_dir, root_dir, name):
@@ -88,56 +110,138 @@ def get_copy_info(source_dir, target_dir, root_dir, name):
 
 
 def copy_files(source_dir, target_dir):
+    """Copy the files in a directory, and return the target paths."""
+    target_paths = []
     for root_dir, dir_names, file_names in os.walk(source_dir):
         for dir_name in dir_names:
-            source_dir, target_dir = get_copy_info(source_dir, target_dir, root_dir, dir_name)
-            create_dir(target_dir)
+            source_sub_dir, target_sub_dir = get_copy_info(source_dir, target_dir,
+                                                           root_dir, dir_name)
+            create_dir(target_sub_dir)
         for file_name in file_names:
             source_path, target_path = get_copy_info(source_dir, target_dir, root_dir, file_name)
             _log.info("copying file to: {0}".format(target_path))
-            shutil.copyfile(source_path, target_path)
+            atomic.copy_file(source_path, target_path)
+            metrics.incr(metrics.METRIC_FILES_COPIED)
+            metrics.incr(metrics.METRIC_BYTES_WRITTEN, os.path.getsize(target_path))
+            target_paths.append(target_path)
+    return target_paths
 
 
-def make_html(output_dir, page_name=None, print_html=False, local_assets=False,
-              debug=False):
-    """Generate the HTML from the JSON."""
+def _make_html_dir(output_dir, page_name, print_html, local_assets, debug,
+                   reference_date, engine_name, minify, precompress, fingerprint):
+    """Generate the HTML into the given directory (see make_html())."""
     if page_name is None:
         file_names = get_template_page_file_names()
+        node_names = None
     else:
         file_names = [page_name]
+        # Then only build the template data the page needs.
+        page_base = os.path.splitext(page_name)[0]
+        node_names = context.get_page_node_names(page_base)
 
     # Create the output directory skeleton.
     create_dir(output_dir)
+    # Remove the manifest until the build finishes, so that a failed build
+    # cannot be deployed.
+    deploy.remove_manifest(output_dir)
     for dir_name in HTML_OUTPUT_SUB_DIRS:
         dir_path = os.path.join(output_dir, dir_name)
         create_dir(dir_path)
 
     # Copy all static files.
-    repo_dir = utils.get_repo_dir()
-    for rel_source_dir, rel_target_dir in _STATIC_FILES_INFO:
-        source_dir = os.path.join(repo_dir, rel_source_dir)
-        target_dir = os.path.join(output_dir, rel_target_dir)
-        copy_files(source_dir, target_dir)
+    static_paths = []
+    with metrics.stage('html_copy_static'):
+        for source_dir, rel_target_dir in get_static_dirs():
+            target_dir = os.path.join(output_dir, rel_target_dir)
+            static_paths.extend(copy_files(source_dir, target_dir))
+
+    if fingerprint:
+        with metrics.stage('html_fingerprint'):
+            asset_manifest = assets.fingerprint_files(output_dir, static_paths)
+            assets.write_manifest(output_dir, asset_manifest)
+    else:
+        assets.remove_fingerprinted_files(output_dir)
+        asset_manifest = None
+
+    with metrics.stage('html_make_data'):
+        json_data = jsongen.get_json()
+        data = context.make_html_data(json_data, local_assets=local_assets,
+                                      reference_date=reference_date,
+                                      node_names=node_names,
+                                      asset_manifest=asset_manifest)
 
-    json_data = jsongen.get_json()
-    data = context.make_html_data(json_data, local_assets=local_assets)
+    # Write the search index for client-side search.
+    with metrics.stage('html_search_index'):
+        index = search.get_search_index(json_data)
+        index_path = os.path.join(output_dir, _HTML_OUTPUT_DATA_DIR, search.FILE_NAME)
+        utils.write(index_path, search.dumps_index(index))
 
-    page_bases = get_template_page_bases()
-    templateconfig.init_django(debug=debug)
+    engine = engines.get_engine(engine_name, debug=debug)
 
     for file_name in file_names:
         _log.info('processing: {0}'.format(file_name))
-        page_base, ext = os.path.splitext(file_name)
-        context_ = context.make_template_context(data, page_base)
-        html = render_template(file_name, context=context_)
+        html = render_page(engine, data, file_name)
+        if minify:
+            with metrics.stage('html_minify'):
+                html = optimize.minify_html(html)
         if print_html:
             print(html)
         output_path = os.path.join(output_dir, file_name)
         utils.write(output_path, html)
-    if len(file_names) == 1:
-        start_page = file_names[0]
+
+    if precompress:
+        with metrics.stage('html_precompress'):
+            optimize.precompress_dir(output_dir)
     else:
-        start_page = 'index.html'
+        # Otherwise a server could serve the copies of an earlier build.
+        optimize.remove_gzip_files(output_dir)
+
+    # Write the manifest last, so that it lists every output file.
+    deploy.write_build_manifest(output_dir)
+
+
+def make_html(output_dir, page_name=None, print_html=False, local_assets=False,
+              debug=False, reference_date=None, engine_name=None, minify=False,
+              precompress=False, fingerprint=False, swap=False):
+    """Generate the HTML from the JSON.
+
+    Builds hold a lock on the output directory, so that builds into the
+    same directory run one at a time.
+
+    Arguments:
+      engine_name: the name of the template engine to use (see the
+        engines module), or None for the default.
+      minify: whether to collapse the whitespace in the rendered pages.
+      precompress: whether to write a gzipped copy of each HTML, CSS,
+        JS, and JSON file in the output directory.
+      fingerprint: whether to also copy the static files to names
+        containing a hash of their contents, and link to those names
+        (see the assets module).
+      swap: whether to build into a new directory and then atomically
+        point output_dir, which must be a symlink if it exists, at it.
+        Only the swap holds the lock, so such builds can run at once.
+    """
+    options = dict(page_name=page_name, print_html=print_html, local_assets=local_assets,
+                   debug=debug, reference_date=reference_date, engine_name=engine_name,
+                   minify=minify, precompress=precompress, fingerprint=fingerprint)
+    if swap:
+        if page_name is not None:
+            raise Exception("building a single page is not supported with swap")
+        build_dir = atomic.make_build_dir(output_dir)
+        _log.info("building into: {0}".format(build_dir))
+        try:
+            _make_html_dir(build_dir, **options)
+        except:
+            # Nothing points at the directory yet, so remove it.
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        with atomic.build_lock(output_dir):
+            atomic.swap_symlink(output_dir, build_dir)
+    else:
+        with atomic.build_lock(output_dir):
+            _make_html_dir(output_dir, **options)
+
+    start_page = 'index.html' if page_name is None else page_name
     start_path = os.path.join(output_dir, start_page)
 
     return start_path
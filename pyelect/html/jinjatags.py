@@ -0,0 +1,162 @@
+"""Jinja2 equivalents of the custom Django tags and filters.
+
+The tags that render a template are implemented as macros in
+templates_jinja/macros.html.  This module defines the filters and global
+functions those macros use, and creates the Jinja2 environment.
+
+This module requires Jinja2, which is an optional dependency.
+
+"""
+
+from itertools import groupby
+import re
+
+import jinja2
+from markupsafe import Markup
+
+from pyelect.html.assets import get_asset_url
+from pyelect.html.common import NON_ENGLISH_ORDER, label_to_text
+from pyelect.html.pages import get_page_href, get_page_object, get_page_title
+from pyelect import lang
+
+try:
+    from jinja2 import pass_context
+except ImportError:
+    # Then the Jinja2 version is older than 3.0.
+    from jinja2 import contextfunction as pass_context
+
+
+_SPACELESS_PATTERN = re.compile(r'>\s+<')
+
+
+def escape(value):
+    """Escape a value for HTML the way Django 1.8 does.
+
+    This differs from MarkupSafe in how it escapes double quotes.
+    """
+    return (str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            .replace('"', '&quot;').replace("'", '&#39;'))
+
+
+def _finalize(value):
+    if hasattr(value, '__html__'):
+        return value
+    return Markup(escape(value))
+
+
+def get_item(dict_, key):
+    return dict_.get(key)
+
+
+def copy_order_attr(seq, attr):
+    for element in seq:
+        element['order'] = element[attr]
+    return seq
+
+
+def regroup(items, attr):
+    """Group consecutive items by attribute, like Django's regroup tag.
+
+    Unlike Jinja2's groupby filter, this does not sort the items first.
+    """
+    return [{'grouper': grouper, 'list': list(group)} for grouper, group in
+            groupby(items, key=lambda item: item.get(attr))]
+
+
+def join_text(seq, separator):
+    """Join strings without escaping them, so they are escaped once on output."""
+    return separator.join(seq)
+
+
+def spaceless(value):
+    """Remove whitespace between HTML tags, like Django's spaceless tag."""
+    text = _SPACELESS_PATTERN.sub('><', str(value).strip())
+    if hasattr(value, '__html__'):
+        return Markup(text)
+    return text
+
+
+def ternary(value, true, false):
+    if value is None:
+        return None
+    if value:
+        return true
+    return false
+
+
+@pass_context
+def asset_url(context, rel_path):
+    return get_asset_url(context['asset_manifest'], rel_path)
+
+
+@pass_context
+def object_link(context, object_id, page_base_name):
+    """Return a dict with the href and text of a link to an object."""
+    href = None
+    text = None
+    if object_id is None:
+        pass
+    elif label_to_text(object_id):
+        text = label_to_text(object_id)
+    else:
+        objects = context[page_base_name]
+        obj = objects[object_id]
+        text = obj['name']
+        page = get_page_object(page_base_name)
+        href = page.make_href(fragment=object_id)
+    return {'href': href, 'text': text}
+
+
+@pass_context
+def translations(context, item, attr_name):
+    """Return i18n info for an object attribute (see the Django tag)."""
+    i18n_field_name = lang.get_i18n_field_name(attr_name)
+    phrase_id = item.get(i18n_field_name)
+    non_english = []
+    if phrase_id:
+        phrases = context['phrases']
+        phrase = phrases[phrase_id]
+        non_english = [phrase[lang] for lang in NON_ENGLISH_ORDER if lang in phrase]
+    return {'non_english': non_english}
+
+
+_FILTERS = {
+    'copy_order_attr': copy_order_attr,
+    'get_item': get_item,
+    'join_text': join_text,
+    'regroup': regroup,
+    'spaceless': spaceless,
+}
+
+_GLOBALS = {
+    'asset_url': asset_url,
+    'label_to_text': label_to_text,
+    'object_link': object_link,
+    'page_href': get_page_href,
+    'page_title': get_page_title,
+    'ternary': ternary,
+    'translations': translations,
+}
+
+
+def make_environment(templates_dir, cache_dir=None):
+    """Return a Jinja2 Environment for the templates in templates_dir.
+
+    Arguments:
+      cache_dir: a directory in which to cache compiled templates across
+        runs, or None for no on-disk cache.
+    """
+    if cache_dir is None:
+        bytecode_cache = None
+    else:
+        bytecode_cache = jinja2.FileSystemBytecodeCache(cache_dir)
+    env = jinja2.Environment(
+        autoescape=True,
+        bytecode_cache=bytecode_cache,
+        finalize=_finalize,
+        keep_trailing_newline=True,
+        loader=jinja2.FileSystemLoader(templates_dir),
+    )
+    env.filters.update(_FILTERS)
+    env.globals.update(_GLOBALS)
+    return env
@@ -0,0 +1,190 @@
+"""Supports optimizing the HTML output for serving.
+
+This includes minifying the rendered pages and writing gzipped copies
+of the text files in the output directory.  A web server can then serve
+the gzipped copies directly (e.g. with nginx's gzip_static) instead of
+compressing each response.  Since such a server prefers a gzipped copy
+to its file, gzipped copies left by a previous build into the same
+directory are deleted when they would be out of date.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+from io import BytesIO
+import logging
+import os
+import re
+
+from pyelect import atomic
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+# The extensions of the files to write gzipped copies of.
+COMPRESS_EXTENSIONS = ('.css', '.html', '.js', '.json')
+GZIP_EXTENSION = '.gz'
+
+# The contents of these elements are left as is when minifying.
+_PRESERVE_TAGS = ('pre', 'script', 'style', 'textarea')
+
+# Tags at whose boundaries browsers do not render whitespace, so that any
+# whitespace next to them can be removed.
+_BLOCK_TAGS = frozenset("""
+!doctype address article aside blockquote body br dd div dl dt fieldset
+footer form h1 h2 h3 h4 h5 h6 head header hr html li link meta nav ol
+option p section table tbody td tfoot th thead title tr ul
+""".split())
+
+# Matches the parts of the HTML to leave as is: comments (including IE
+# conditional comments), the elements above, and tags (so that attribute
+# values are unchanged).
+_PRESERVE_PATTERN = re.compile(
+    r'<!--.*?-->|{0}|<[^>]*>'.format(
+        "|".join(r'<{0}\b.*?</{0}\s*>'.format(tag) for tag in _PRESERVE_TAGS)),
+    re.DOTALL | re.IGNORECASE)
+# Matches comments other than IE conditional comments.
+_COMMENT_PATTERN = re.compile(r'<!--(?!\[if).*?-->', re.DOTALL)
+_TAG_NAME_PATTERN = re.compile(r'</?([!\w]+)')
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def _is_block_tag(part):
+    match = _TAG_NAME_PATTERN.match(part)
+    return match is not None and match.group(1).lower() in _BLOCK_TAGS
+
+
+def _collapse_space(match):
+    # Keep a line break if there was one, so the output stays readable
+    # and line-oriented diffs of it stay useful.
+    return '\n' if '\n' in match.group() else ' '
+
+
+def _minify_text(text, after_block, before_block):
+    if after_block:
+        text = text.lstrip()
+    if before_block:
+        text = text.rstrip()
+    return _SPACE_PATTERN.sub(_collapse_space, text)
+
+
+def minify_html(html):
+    """Return the HTML with the whitespace in its text collapsed.
+
+    Browsers render each run of whitespace in text as a single space, and
+    no space at the start or end of a block (e.g. next to a <div> tag).
+    This collapses each run to one character, and removes the runs next
+    to block tags.  It also removes comments other than IE conditional
+    comments.  It does not change tags or the contents of elements like
+    <pre> where whitespace matters.
+    """
+    html = _COMMENT_PATTERN.sub('', html)
+    # Split the HTML into alternating text and preserved parts.
+    parts = []
+    start = 0
+    for match in _PRESERVE_PATTERN.finditer(html):
+        parts.append(html[start:match.start()])
+        parts.append(match.group())
+        start = match.end()
+    parts.append(html[start:])
+
+    for i in range(0, len(parts), 2):
+        after_block = i == 0 or _is_block_tag(parts[i - 1])
+        before_block = i == len(parts) - 1 or _is_block_tag(parts[i + 1])
+        parts[i] = _minify_text(parts[i], after_block, before_block)
+    return "".join(parts) + "\n"
+
+
+def get_gzip_path(path):
+    return path + GZIP_EXTENSION
+
+
+def write_gzip(path):
+    """Write a gzipped copy of the file next to it.
+
+    Returns the number of bytes written, or 0 if compressing does not
+    make the file smaller, in which case no copy is kept.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    buffer = BytesIO()
+    # Pass mtime=0 so the output depends only on the input.
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=9, fileobj=buffer,
+                       mtime=0) as f:
+        f.write(data)
+    compressed = buffer.getvalue()
+    gzip_path = get_gzip_path(path)
+    if len(compressed) >= len(data):
+        # Remove any stale copy so a server does not serve it.
+        if os.path.exists(gzip_path):
+            os.remove(gzip_path)
+        return 0
+    with atomic.atomic_open(gzip_path, mode='wb') as f:
+        f.write(compressed)
+    return len(compressed)
+
+
+def get_compressible_paths(dir_path):
+    paths = []
+    for root_dir, dir_names, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            if os.path.splitext(file_name)[1] in COMPRESS_EXTENSIONS:
+                paths.append(os.path.join(root_dir, file_name))
+    return sorted(paths)
+
+
+def _is_gzip_copy(file_name):
+    """Return whether a file name is that of a copy written by write_gzip()."""
+    if not file_name.endswith(GZIP_EXTENSION):
+        return False
+    base = file_name[:-len(GZIP_EXTENSION)]
+    return os.path.splitext(base)[1] in COMPRESS_EXTENSIONS
+
+
+def remove_gzip_files(dir_path, stale_only=False):
+    """Delete the gzipped copies of the text files in a directory.
+
+    Arguments:
+      stale_only: whether to delete only the copies whose file no longer
+        exists.  Otherwise every copy is deleted, for example when a
+        build into the directory no longer precompresses.
+    """
+    for root_dir, dir_names, file_names in os.walk(dir_path):
+        for file_name in sorted(file_names):
+            if not _is_gzip_copy(file_name):
+                continue
+            path = os.path.join(root_dir, file_name)
+            if stale_only and os.path.exists(path[:-len(GZIP_EXTENSION)]):
+                continue
+            _log.info("deleting: {0}".format(path))
+            os.remove(path)
+            metrics.incr(metrics.METRIC_FILES_DELETED)
+
+
+def precompress_dir(dir_path, workers=None):
+    """Write gzipped copies of the text files in a directory.
+
+    Also deletes the copies whose file no longer exists, e.g. a page no
+    longer in the build.
+
+    Arguments:
+      workers: the number of worker threads, or None for the number of
+        CPUs.  zlib releases the GIL while compressing, so threads
+        compress in parallel.
+    """
+    remove_gzip_files(dir_path, stale_only=True)
+    paths = get_compressible_paths(dir_path)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sizes = list(executor.map(write_gzip, paths))
+    # Record the metrics here rather than in the workers, since updating
+    # the metrics is not thread-safe.
+    for path, size in zip(paths, sizes):
+        if not size:
+            continue
+        _log.info("wrote: {0}".format(get_gzip_path(path)))
+        metrics.incr(metrics.METRIC_FILES_COMPRESSED)
+        metrics.incr(metrics.METRIC_FILES_WRITTEN)
+        metrics.incr(metrics.METRIC_BYTES_WRITTEN, size)
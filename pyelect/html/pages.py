@@ -27,10 +27,26 @@ def get_page_object(page_base):
     return page
 
 
+def get_page_href(page_base, fragment=None):
+    page = get_page_object(page_base)
+    href = page.make_href(fragment=fragment)
+    return href
+
+
+def get_page_title(page_base):
+    page = get_page_object(page_base)
+    title = page.title
+    return title
+
+
 class _Page(object):
 
     _title = None
     _objects_name = None
+    # The names of the other template data nodes the page's templates
+    # reference (e.g. to link to related objects).  Only these nodes and
+    # the page's own objects are built and passed to the template.
+    nodes = ()
     singular = None
     sorter = None
 
@@ -58,6 +74,10 @@ class _Page(object):
             url += "#{0}".format(fragment)
         return url
 
+    def get_node_names(self):
+        """Return the names of the template data nodes the page needs."""
+        return (self.objects_name, ) + tuple(self.nodes)
+
     def get_singular(self):
         if self.singular is not None:
             return self.singular
@@ -88,17 +108,21 @@ class AreasPage(_Page):
 
 
 class BodiesPage(_Page):
+    nodes = ('areas', 'categories', 'district_types', 'election_methods')
     singular = 'body'
     title = "Bodies"
     sorter = ('category_order', 'name')
 
 
 class DistrictsPage(_Page):
+    nodes = ('categories', 'district_types')
     # TODO: sort by category sequence number, then district_type sequence.
     sorter = ('category_order', 'district_type_id', 'number')
 
 
 class DistrictTypesPage(_Page):
+    # The stats node sets each district type's district_count_sf.
+    nodes = ('areas', 'bodies', 'categories', 'stats')
     sorter = ('category_order', 'name')
 
 
@@ -108,6 +132,7 @@ class ElectionMethodsPage(_Page):
 
 class IndexPage(_Page):
     _objects_name = 'offices'
+    nodes = ('bodies', 'categories', 'districts', 'election_methods', 'stats')
     sorter = ('category_order', 'body_id', 'id')
 
 
@@ -116,4 +141,5 @@ class LanguagesPage(_Page):
 
 
 class PhrasesPage(_Page):
+    nodes = ('coverage', 'languages')
     _title = "Translated Phrases"
@@ -0,0 +1,213 @@
+"""Supports previewing the HTML over HTTP without writing it to disk.
+
+The preview server initializes the template engine and makes the
+template data once, and renders a page only when it is requested.
+Rendered pages are cached in memory until the JSON file or a template
+changes.  Static files are served directly from their source
+directories rather than copied.
+
+"""
+
+from http.server import BaseHTTPRequestHandler
+import logging
+import mimetypes
+import os
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+from pyelect import api
+from pyelect.html import context
+from pyelect.html import engines
+from pyelect.html import generator
+from pyelect import jsongen
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+DEFAULT_PORT = 8001
+# How often to check the JSON file and templates for changes, in seconds.
+CHECK_INTERVAL = 1.0
+
+_DEFAULT_PAGE = 'index.html'
+_HTML_CONTENT_TYPE = 'text/html; charset=utf-8'
+
+
+def _get_tree_signature(dir_path):
+    """Return a value that changes when any file in the directory changes."""
+    signature = []
+    for root_dir, dir_names, file_names in os.walk(dir_path):
+        for file_name in file_names:
+            path = os.path.join(root_dir, file_name)
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime, stat.st_size))
+    return sorted(signature)
+
+
+def _get_file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime, stat.st_size)
+
+
+class PreviewSite(object):
+
+    """Holds the template data and the cache of rendered pages."""
+
+    def __init__(self, engine, local_assets=False, reference_date=None, check_interval=None):
+        if check_interval is None:
+            check_interval = CHECK_INTERVAL
+        self.check_interval = check_interval
+        self.engine = engine
+        self.local_assets = local_assets
+        self.reference_date = reference_date
+        self.page_file_names = set(generator.get_template_page_file_names())
+        self.static_dirs = generator.get_static_dirs()
+
+        self._json_path = jsongen.get_json_path()
+        self._templates_dir = engine.templates_dir
+        # Rendering mutates some template data (e.g. the copy_order_attr
+        # filter), so render one page at a time.
+        self._lock = threading.Lock()
+        self._next_check = 0
+        self._json_signature = None
+        self._templates_signature = None
+        self._html_data = None
+        # Maps page file name to the rendered HTML, encoded as UTF-8.
+        self._pages = {}
+
+        self._check_changes()
+
+    def _make_html_data(self):
+        with metrics.stage('html_make_data'):
+            json_data = jsongen.get_json()
+            self._html_data = context.make_html_data(json_data, local_assets=self.local_assets,
+                                                     reference_date=self.reference_date)
+
+    def _check_changes(self):
+        """Invalidate the template data and page cache if the sources changed."""
+        now = time.time()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+
+        json_signature = _get_file_signature(self._json_path)
+        if json_signature != self._json_signature:
+            if self._json_signature is not None:
+                _log.info("json changed: reloading data")
+            self._make_html_data()
+            self._json_signature = json_signature
+            self._pages.clear()
+
+        templates_signature = _get_tree_signature(self._templates_dir)
+        if templates_signature != self._templates_signature:
+            if self._templates_signature is not None:
+                _log.info("templates changed: clearing page cache")
+            self._templates_signature = templates_signature
+            self._pages.clear()
+
+    def get_page(self, file_name):
+        """Return the rendered page as bytes, rendering it if needed."""
+        with self._lock:
+            self._check_changes()
+            try:
+                html = self._pages[file_name]
+            except KeyError:
+                metrics.record_cache('preview_page', hit=False)
+            else:
+                metrics.record_cache('preview_page', hit=True)
+                return html
+            _log.info("rendering: {0}".format(file_name))
+            html = generator.render_page(self.engine, self._html_data, file_name).encode('utf-8')
+            self._pages[file_name] = html
+            return html
+
+    def get_static_path(self, rel_path):
+        """Return the source path of a static file, or None if there is none."""
+        for source_dir, rel_target_dir in self.static_dirs:
+            if rel_target_dir:
+                prefix = rel_target_dir + '/'
+                if not rel_path.startswith(prefix):
+                    continue
+                source_rel_path = rel_path[len(prefix):]
+            else:
+                source_rel_path = rel_path
+            path = os.path.normpath(os.path.join(source_dir, source_rel_path))
+            # Do not serve files outside the static directory.
+            if not path.startswith(os.path.join(source_dir, '')):
+                continue
+            if os.path.isfile(path):
+                return path
+        return None
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        _log.debug("%s - %s", self.address_string(), format % args)
+
+    def _send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        site = self.server.site
+        rel_path = unquote(urlsplit(self.path).path).lstrip('/') or _DEFAULT_PAGE
+        if rel_path in site.page_file_names:
+            body = site.get_page(rel_path)
+            self._send_body(200, _HTML_CONTENT_TYPE, body)
+            return
+        path = site.get_static_path(rel_path)
+        if path is None:
+            message = "not found: /{0}".format(rel_path)
+            self._send_body(404, 'text/plain; charset=utf-8', message.encode('utf-8'))
+            return
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        with open(path, 'rb') as f:
+            body = f.read()
+        self._send_body(200, content_type, body)
+
+
+class PreviewServer(api.ThreadingServer):
+
+    def __init__(self, address, site):
+        api.ThreadingServer.__init__(self, address, PreviewRequestHandler)
+        self.site = site
+
+
+def make_server(host=None, port=None, local_assets=False, reference_date=None,
+                debug=False, engine_name=None):
+    """Initialize the template engine and data, and return a PreviewServer."""
+    if host is None:
+        host = api.DEFAULT_HOST
+    if port is None:
+        port = DEFAULT_PORT
+    engine = engines.get_engine(engine_name, debug=debug)
+    site = PreviewSite(engine, local_assets=local_assets, reference_date=reference_date)
+    return PreviewServer((host, port), site)
+
+
+def get_server_url(server, page_name=None):
+    host, port = server.server_address[:2]
+    url = "http://{0}:{1}/".format(host, port)
+    if page_name is not None:
+        url += page_name
+    return url
+
+
+def serve(server):
+    """Serve until interrupted."""
+    _log.info("serving html at: {0}".format(get_server_url(server)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -41,6 +41,8 @@ def copy_order_attr(seq, attr):
 
 def init_django(debug=False):
     """Initialize Django."""
+    if settings.configured:
+        return
     search_dirs = _get_template_search_dirs()
     settings.configure(
         INSTALLED_APPS=('pyelect', ),
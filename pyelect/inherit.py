@@ -0,0 +1,194 @@
+"""Supports layered inheritance of object attributes.
+
+Objects can inherit attributes in two ways:
+
+1. From a mixin, by setting a "mixin_id" attribute.  Mixins can themselves
+   set a "mixin_id", so mixins can be nested to any depth.  Mixins are
+   supported for every object type.
+2. From a related object, according to a declared chain.  For example,
+   an office inherits its term length from its body when it does not
+   set one itself.
+
+In both cases, inheritance is resolved through chained read-only views,
+so no attribute values are copied.  A view can be converted to a plain
+dict with materialize() when needed, for example when serializing.
+
+"""
+
+from collections.abc import Mapping
+
+
+KEY_MIXIN_ID = 'mixin_id'
+
+# The declared inheritance chains.  Each entry maps a node name to a
+# 3-tuple of: (1) the name of the attribute referencing the parent object,
+# (2) the name of the parent node, and (3) the attributes to inherit.
+# Chains can be followed through several levels, for example from
+# district to district type to body.
+INHERITANCE_CHAINS = {
+    'district_types': ('body_id', 'bodies', ('category_id', )),
+    'districts': ('district_type_id', 'district_types', ('category_id', )),
+    'offices': ('body_id', 'bodies',
+                ('category_id', 'jurisdiction_area_id', 'partisan', 'seed_year',
+                 'term_length')),
+}
+
+
+class InheritedView(Mapping):
+
+    """A read-only view of an object backed by a sequence of layers.
+
+    Looking up a key returns the value from the first layer containing it.
+    """
+
+    __slots__ = ('_hidden', '_layers')
+
+    def __init__(self, layers, hidden=()):
+        """
+        Arguments:
+          layers: a sequence of mappings, from highest to lowest precedence.
+          hidden: keys to exclude from the view, even if a layer has them.
+        """
+        self._layers = tuple(layers)
+        self._hidden = frozenset(hidden)
+
+    def __repr__(self):
+        return "<InheritedView: {0!r}>".format(dict(self))
+
+    def __getitem__(self, key):
+        if key not in self._hidden:
+            for layer in self._layers:
+                try:
+                    return layer[key]
+                except KeyError:
+                    pass
+        raise KeyError(key)
+
+    def __iter__(self):
+        seen = set(self._hidden)
+        for layer in self._layers:
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+
+class _RestrictedView(Mapping):
+
+    """A read-only view of a mapping that exposes only some keys."""
+
+    __slots__ = ('_keys', '_mapping')
+
+    def __init__(self, mapping, keys):
+        self._mapping = mapping
+        self._keys = frozenset(keys)
+
+    def __getitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        return self._mapping[key]
+
+    def __iter__(self):
+        return (key for key in self._mapping if key in self._keys)
+
+    def __len__(self):
+        return sum(1 for key in self)
+
+
+def materialize(obj):
+    """Return a plain dict copy of the given (possibly inherited) object.
+
+    This function can also be passed as the "default" argument of
+    json.dump() to serialize views directly.
+    """
+    if not isinstance(obj, Mapping):
+        raise TypeError("not a mapping: {0!r}".format(obj))
+    return dict(obj)
+
+
+def _resolve_mixin(mixin_id, mixins, views, seen):
+    try:
+        return views[mixin_id]
+    except KeyError:
+        pass
+    if mixin_id in seen:
+        raise Exception("mixin cycle: {0}".format(" -> ".join(seen + [mixin_id])))
+    try:
+        mixin = mixins[mixin_id]
+    except KeyError:
+        raise Exception("unknown mixin_id: {0!r}".format(mixin_id))
+    view = _extend_mixin(mixin, mixins, views, seen + [mixin_id])
+    views[mixin_id] = view
+    return view
+
+
+def _extend_mixin(obj, mixins, views, seen):
+    mixin_id = obj.get(KEY_MIXIN_ID)
+    if mixin_id is None:
+        return obj
+    parent = _resolve_mixin(mixin_id, mixins, views, seen)
+    return InheritedView([obj, parent], hidden=(KEY_MIXIN_ID, ))
+
+
+def apply_mixins(objects, mixins):
+    """Return a dict of objects in which each object extends its mixin.
+
+    Objects without a mixin are returned as is.  The "mixin_id" attribute
+    is hidden from the returned views.
+
+    Arguments:
+      objects: a dict mapping object ID to object.
+      mixins: a dict mapping mixin ID to mixin.
+    """
+    # Share mixin views across objects.
+    views = {}
+    return {object_id: _extend_mixin(obj, mixins, views, seen=[]) for
+            object_id, obj in objects.items()}
+
+
+class Resolver(object):
+
+    """Resolves objects through the declared inheritance chains."""
+
+    def __init__(self, nodes, chains=None):
+        """
+        Arguments:
+          nodes: a dict mapping node name to a dict of objects, for
+            example the JSON data.
+          chains: a dict of inheritance chains.  Defaults to
+            INHERITANCE_CHAINS.
+        """
+        if chains is None:
+            chains = INHERITANCE_CHAINS
+        self.chains = chains
+        self.nodes = nodes
+        self._views = {}
+
+    def get_view(self, node_name, object_id, _seen=()):
+        """Return a read-only view of an object including inherited values."""
+        key = (node_name, object_id)
+        try:
+            return self._views[key]
+        except KeyError:
+            pass
+        if key in _seen:
+            raise Exception("inheritance cycle at: {0}".format(key))
+
+        obj = self.nodes[node_name][object_id]
+        view = obj
+        try:
+            ref_name, parent_node_name, inherited_keys = self.chains[node_name]
+        except KeyError:
+            pass
+        else:
+            parent_id = obj.get(ref_name)
+            if parent_id is not None:
+                parent = self.get_view(parent_node_name, parent_id,
+                                       _seen=_seen + (key, ))
+                view = InheritedView([obj, _RestrictedView(parent, inherited_keys)])
+
+        self._views[key] = view
+        return view
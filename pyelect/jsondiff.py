@@ -0,0 +1,206 @@
+"""Supports structural diffs and patches between two builds of the JSON data.
+
+A diff compares two builds node by node and object by object, looking up
+objects by ID, so it runs in time linear in the size of the data.
+
+Terminology
+-----------
+
+diff dict:
+  A dict mapping node name to a node diff dict, for each node that
+  differs.  A node diff dict has keys "added" and "removed" (each mapping
+  object ID to object) and "changed" (mapping object ID to a field diff
+  dict).
+
+field diff dict:
+  A dict with keys "added" and "removed" (each mapping field name to
+  value) and "changed" (mapping field name to an [old, new] pair).
+
+patch:
+  A compact dict that transforms the old build into the new one.  It
+  stores new objects in full, but only the new values of changed fields.
+  It also records a hash of each build so that a client can check that
+  it is patching the right version.
+
+"""
+
+from collections import defaultdict
+
+from pyelect import utils
+
+
+PATCH_FORMAT = 'sfbed-json-patch'
+PATCH_FORMAT_VERSION = 1
+
+NODE_PHRASES = 'phrases'
+
+
+def _is_object(value):
+    return isinstance(value, dict)
+
+
+def diff_fields(old_obj, new_obj):
+    """Return a field diff dict, or None if the objects are equal."""
+    if old_obj == new_obj:
+        return None
+    if not (_is_object(old_obj) and _is_object(new_obj)):
+        # Then treat the value as a single field.
+        return {'added': {}, 'changed': {'': [old_obj, new_obj]}, 'removed': {}}
+    added = {k: v for k, v in new_obj.items() if k not in old_obj}
+    removed = {k: v for k, v in old_obj.items() if k not in new_obj}
+    changed = {k: [old_obj[k], v] for k, v in new_obj.items() if
+               k in old_obj and old_obj[k] != v}
+    return {'added': added, 'changed': changed, 'removed': removed}
+
+
+def diff_nodes(old_node, new_node):
+    """Return a node diff dict, or None if the nodes are equal."""
+    added = {}
+    changed = {}
+    for object_id, new_obj in new_node.items():
+        try:
+            old_obj = old_node[object_id]
+        except KeyError:
+            added[object_id] = new_obj
+            continue
+        field_diff = diff_fields(old_obj, new_obj)
+        if field_diff is not None:
+            changed[object_id] = field_diff
+    removed = {k: v for k, v in old_node.items() if k not in new_node}
+    if not (added or changed or removed):
+        return None
+    return {'added': added, 'changed': changed, 'removed': removed}
+
+
+def diff_json(old_data, new_data):
+    """Return the diff dict between two builds of the JSON data."""
+    diff = {}
+    for node_name in sorted(set(old_data) | set(new_data)):
+        old_node = old_data.get(node_name, {})
+        new_node = new_data.get(node_name, {})
+        node_diff = diff_nodes(old_node, new_node)
+        if node_diff is not None:
+            diff[node_name] = node_diff
+    return diff
+
+
+def summarize_phrases(diff):
+    """Return a dict mapping language code to counts of phrase changes.
+
+    Each value is a dict with keys "added", "changed", and "removed".
+    """
+    counts = defaultdict(lambda: {'added': 0, 'changed': 0, 'removed': 0})
+    node_diff = diff.get(NODE_PHRASES)
+    if node_diff is None:
+        return {}
+    for kind in ('added', 'removed'):
+        for translations in node_diff[kind].values():
+            for lang in translations:
+                counts[lang][kind] += 1
+    for field_diff in node_diff['changed'].values():
+        for kind in ('added', 'changed', 'removed'):
+            for lang in field_diff[kind]:
+                counts[lang][kind] += 1
+    return dict(counts)
+
+
+def format_diff(diff):
+    """Return a human-readable report of a diff dict."""
+    lines = []
+    for node_name in sorted(diff):
+        node_diff = diff[node_name]
+        lines.append("{0}: {1} added, {2} changed, {3} removed".format(
+                     node_name, len(node_diff['added']), len(node_diff['changed']),
+                     len(node_diff['removed'])))
+        for object_id in sorted(node_diff['added']):
+            lines.append("  + {0}".format(object_id))
+        for object_id in sorted(node_diff['removed']):
+            lines.append("  - {0}".format(object_id))
+        for object_id in sorted(node_diff['changed']):
+            field_diff = node_diff['changed'][object_id]
+            lines.append("  ~ {0}".format(object_id))
+            for field, value in sorted(field_diff['added'].items()):
+                lines.append("      + {0}: {1!r}".format(field, value))
+            for field, value in sorted(field_diff['removed'].items()):
+                lines.append("      - {0}: {1!r}".format(field, value))
+            for field, (old, new) in sorted(field_diff['changed'].items()):
+                lines.append("      ~ {0}: {1!r} -> {2!r}".format(field, old, new))
+
+    phrase_counts = summarize_phrases(diff)
+    if phrase_counts:
+        lines.append("phrases by language:")
+        for lang in sorted(phrase_counts):
+            counts = phrase_counts[lang]
+            lines.append("  {0}: {1} added, {2} changed, {3} removed".format(
+                         lang, counts['added'], counts['changed'], counts['removed']))
+    if not lines:
+        lines.append("no differences")
+
+    return "\n".join(lines)
+
+
+def make_patch(old_data, new_data, diff=None):
+    """Return a patch that transforms old_data into new_data."""
+    if diff is None:
+        diff = diff_json(old_data, new_data)
+    nodes = {}
+    for node_name, node_diff in diff.items():
+        node_patch = {}
+        # New objects and objects that are not dicts are stored in full.
+        replace = dict(node_diff['added'])
+        update = {}
+        for object_id, field_diff in node_diff['changed'].items():
+            if '' in field_diff['changed']:
+                replace[object_id] = new_data[node_name][object_id]
+                continue
+            fields = dict(field_diff['added'])
+            fields.update({k: new for k, (old, new) in field_diff['changed'].items()})
+            update[object_id] = {'del': sorted(field_diff['removed']), 'set': fields}
+        if replace:
+            node_patch['put'] = replace
+        if update:
+            node_patch['upd'] = update
+        if node_diff['removed']:
+            node_patch['del'] = sorted(node_diff['removed'])
+        nodes[node_name] = node_patch
+
+    patch = {
+        'format': PATCH_FORMAT,
+        'format_version': PATCH_FORMAT_VERSION,
+        'from': utils.compute_json_hash(old_data),
+        'nodes': nodes,
+        'removed_nodes': sorted(set(old_data) - set(new_data)),
+        'to': utils.compute_json_hash(new_data),
+    }
+    return patch
+
+
+def apply_patch(data, patch, check=True):
+    """Return a new copy of data with the patch applied.
+
+    Arguments:
+      check: whether to check the hashes of the data before and after.
+    """
+    if patch.get('format') != PATCH_FORMAT:
+        raise Exception("not a patch: format={0!r}".format(patch.get('format')))
+    if check and utils.compute_json_hash(data) != patch['from']:
+        raise Exception("patch does not apply: the data does not match the "
+                        "patch's source version")
+    data = dict(data)
+    for node_name, node_patch in patch['nodes'].items():
+        node = dict(data.get(node_name, {}))
+        for object_id in node_patch.get('del', ()):
+            del node[object_id]
+        node.update(node_patch.get('put', {}))
+        for object_id, obj_patch in node_patch.get('upd', {}).items():
+            obj = dict(node[object_id])
+            for field in obj_patch['del']:
+                del obj[field]
+            obj.update(obj_patch['set'])
+            node[object_id] = obj
+        data[node_name] = node
+    for node_name in patch['removed_nodes']:
+        del data[node_name]
+    if check and utils.compute_json_hash(data) != patch['to']:
+        raise Exception("patched data does not match the patch's target version")
+    return data
@@ -1,25 +1,35 @@
 
 from collections import defaultdict
-from copy import deepcopy
 import glob
 import json
+import logging
 import os
 from pprint import pprint
-import textwrap
 
+from pyelect import calendar
+from pyelect import families
+from pyelect import history
+from pyelect import inherit
 from pyelect import lang
+from pyelect import metrics
+from pyelect import predata
+from pyelect import schema
+from pyelect import stats
 from pyelect import utils
 
 
-COURT_OF_APPEALS_ID = 'ca_court_app'
+_log = logging.getLogger()
 
 KEY_DISTRICTS = 'districts'
-KEY_ID = '_id'
 KEY_OFFICES = 'offices'
 
 DIR_NAME_OBJECTS = 'objects'
+# The file holding the _meta of a directory of objects files.
+FILE_NAME_OBJECTS_META = '_meta.yaml'
 _REL_PATH_JSON_DATA = "data/sf.json"
 
+KEY_META = '_meta'
+
 _LICENSE = ("The database consisting of this file is made available under "
 "the Public Domain Dedication and License v1.0 whose full text can be "
 "found at: http://www.opendatacommons.org/licenses/pddl/1.0/ .")
@@ -40,8 +50,24 @@ def get_json_path():
     return json_path
 
 
-def get_json():
-    """Read and return the JSON data."""
+def dumps_json(json_data, **kwargs):
+    """Serialize JSON data returned by make_json_data() to a string.
+
+    Inherited objects are materialized only at this point.
+    """
+    return json.dumps(json_data, default=inherit.materialize, **kwargs)
+
+
+def get_json(as_of=None, history_dir=None):
+    """Read and return the JSON data.
+
+    Arguments:
+      as_of: optionally, a snapshot version number or date string (see
+        history.load_as_of()).  Defaults to the current JSON file.
+      history_dir: the snapshot history directory to use with as_of.
+    """
+    if as_of is not None:
+        return history.load_as_of(as_of, history_dir=history_dir)
     json_path = get_json_path()
     with open(json_path) as f:
         data = json.load(f)
@@ -49,9 +75,44 @@ def get_json():
     return data
 
 
+def _get_yaml_dir_data(base_name, rel_dir):
+    """Return the object data from a directory of YAML files."""
+    dir_path = os.path.join(utils.get_repo_dir(), rel_dir)
+    file_names = sorted(name for name in os.listdir(dir_path) if
+                        os.path.splitext(name)[1] == '.yaml')
+    if FILE_NAME_OBJECTS_META not in file_names:
+        raise Exception("missing {0} in: {1}".format(FILE_NAME_OBJECTS_META, rel_dir))
+    data = utils.read_yaml_rel(os.path.join(rel_dir, FILE_NAME_OBJECTS_META))
+    meta = utils.get_yaml_meta(data)
+
+    paths = [os.path.join(dir_path, name) for name in file_names if
+             name != FILE_NAME_OBJECTS_META]
+    objects = {}
+    for path, data in zip(paths, predata.load_many(paths, utils.read_yaml)):
+        for object_id, obj in utils.get_required(data, base_name).items():
+            if object_id in objects:
+                raise Exception("object {0!r} occurs twice in: {1}".format(object_id, rel_dir))
+            objects[object_id] = obj
+
+    return predata.freeze(objects), meta
+
+
 def _get_yaml_data(base_name):
-    """Return the object data from a YAML file."""
+    """Return the object data from a YAML file, or a directory of them.
+
+    The objects of a type can be in a single file (e.g. objects/offices.yaml)
+    or in a directory (e.g. objects/offices/) containing the node's _meta
+    in a file named FILE_NAME_OBJECTS_META and the objects in any number of
+    other files, usually one per object (see split_objects_file()).  Each
+    file is loaded again only if it changed (see the predata module), and
+    a directory's files are loaded in parallel if there are many.
+    """
     rel_path = _get_rel_path_objects_dir()
+    rel_dir = os.path.join(rel_path, base_name)
+    if os.path.isdir(os.path.join(utils.get_repo_dir(), rel_dir)):
+        if os.path.exists(os.path.join(utils.get_repo_dir(), rel_dir + '.yaml')):
+            raise Exception("both a file and a directory exist for: {0}".format(rel_dir))
+        return _get_yaml_dir_data(base_name, rel_dir)
     data = utils.read_yaml_rel(rel_path, file_base=base_name)
     meta = utils.get_yaml_meta(data)
     objects = utils.get_required(data, base_name)
@@ -59,13 +120,57 @@ def _get_yaml_data(base_name):
     return objects, meta
 
 
-def yaml_to_json(yaml_data, fields):
-    # TODO: construct these fields once per run instead of once per entry.
-    fields = list(fields)
-    fields += ["{0}_i18n".format(f) for f in fields]
-    fields = set(fields)
-    json_data = {f: v for f, v in yaml_data.items() if f in fields}
-    return json_data
+def split_objects_file(base_name):
+    """Split an objects file into a directory with one file per object.
+
+    The directory has the same name as the file, without the extension.
+    The node's _meta goes in the directory's FILE_NAME_OBJECTS_META file,
+    and each object in a file named after its ID, with the file type of
+    the original file.  The original file is then removed.
+
+    Returns the relative path of the new directory.
+    """
+    rel_path = _get_rel_path_objects_dir()
+    rel_dir = os.path.join(rel_path, base_name)
+    repo_dir = utils.get_repo_dir()
+    path = os.path.join(repo_dir, rel_dir + '.yaml')
+    dir_path = os.path.join(repo_dir, rel_dir)
+    if os.path.exists(dir_path):
+        raise Exception("directory already exists: {0}".format(rel_dir))
+
+    # Read the file directly, since the data is modified below.
+    data = utils.read_yaml(path)
+    meta = utils.get_yaml_meta(data)
+    objects = utils.get_required(data, base_name)
+    for object_id in objects:
+        if object_id.startswith('_') or object_id != os.path.basename(object_id):
+            raise Exception("object ID can not be a file name: {0!r}".format(object_id))
+    if utils.get_required(meta, utils.KEY_FILE_TYPE) == utils.FILE_MANUAL:
+        _log.warning("YAML comments in {0} are not copied".format(path))
+
+    os.mkdir(dir_path)
+    utils.write_yaml_with_header({utils.KEY_META: meta},
+                                 rel_path=os.path.join(rel_dir, FILE_NAME_OBJECTS_META))
+    file_type = meta[utils.KEY_FILE_TYPE]
+    for object_id, obj in sorted(objects.items()):
+        file_name = "{0}.yaml".format(object_id)
+        utils.write_yaml_with_header({base_name: {object_id: obj}}, file_type=file_type,
+                                     rel_path=os.path.join(rel_dir, file_name))
+    os.remove(path)
+    predata.invalidate(path)
+
+    return rel_dir
+
+
+def _get_node_objects(base_name, mixins, family_specs):
+    """Return the objects for a node, including family members.
+
+    Objects extending a mixin are returned as read-only views.
+    """
+    objects, meta = _get_yaml_data(base_name)
+    objects = families.add_members(objects, family_specs, base_name)
+    objects = inherit.apply_mixins(objects, mixins)
+    return objects, meta
 
 
 def make_object_areas(yaml_data):
@@ -105,7 +210,7 @@ def make_node_categories(objects, meta):
     for category_id, category in objects.items():
         if 'name' not in category and 'name_i18n' not in category:
             name_i18n = name_i18n_format.format(category_id)
-            category['name_i18n'] = name_i18n
+            category = inherit.InheritedView([{'name_i18n': name_i18n}, category])
         node[category_id] = category
 
     return node
@@ -126,87 +231,15 @@ def make_node_bodies(objects, meta):
     return node
 
 
-def make_node_offices(objects, meta, mixins):
+def make_node_offices(objects, meta):
     """Return the node containing internationalized data."""
-    offices, meta = _get_yaml_data('offices')
-
     node = {}
-    for office_id, office in offices.items():
-        try:
-            mixin_id = office['mixin_id']
-        except KeyError:
-            pass
-        else:
-            # Make the office "extend" from the mixin.
-            office_new = deepcopy(mixins[mixin_id])
-            office_new.update(office)
-            del office_new['mixin_id']
-            office = office_new
-
+    for office_id, office in objects.items():
         node[office_id] = office
 
     return node
 
 
-def make_court_of_appeals_division_numbers():
-    return range(1, 6)
-
-
-def make_court_of_appeals_district_id(division):
-    return "{0}_d1_div{1}".format(COURT_OF_APPEALS_ID, division)
-
-
-def make_court_of_appeals_office_type_id(office_type):
-    return "{0}_{1}".format(COURT_OF_APPEALS_ID, office_type)
-
-
-def make_court_of_appeals_office_id(division, office_type):
-    return "{0}_d1_div{1}_{2}".format(COURT_OF_APPEALS_ID, division, office_type)
-
-
-def make_court_of_appeals_district(division):
-    _id = make_court_of_appeals_district_id(division)
-    district = {
-        KEY_ID: _id,
-        'district_type_id': 'ca_court_app_d1',
-        'district_code': division,
-    }
-    return district
-
-
-def make_court_of_appeals_districts():
-    districts = [make_court_of_appeals_district(c) for c in
-                 make_court_of_appeals_division_numbers()]
-    return districts
-
-
-def make_court_of_appeals_office(division, office_type, seat_count=None):
-    office = {
-        KEY_ID: make_court_of_appeals_office_id(division, office_type),
-        'office_type_id': make_court_of_appeals_office_type_id(office_type),
-    }
-    if seat_count is not None:
-        office['seat_count'] = seat_count
-
-    return office
-
-
-def make_court_of_appeals():
-    keys = (KEY_DISTRICTS, KEY_OFFICES)
-    # TODO: make the following two lines into a helper function.
-    data = {k: [] for k in keys}
-    districts, offices = [data[k] for k in keys]
-
-    division_numbers = make_court_of_appeals_division_numbers()
-    for division in division_numbers:
-        office = make_court_of_appeals_office(division, 'pj')
-        offices.append(office)
-        office = make_court_of_appeals_office(division, 'aj', seat_count=3)
-        offices.append(office)
-
-    return offices
-
-
 # TODO: remove this function.
 def add_source(data, source_name):
     source_data = get_yaml(source_name)
@@ -219,42 +252,48 @@ def add_json_node_i18n(json_data):
     _add_json_node_base(json_data, node, 'phrases')
 
 
-def check_node(node, node_name):
-    allowed_types = (bool, int, str)
-    for object_id, obj in node.items():
-        for attr, value in obj.items():
-            if type(value) not in allowed_types:
-                err = textwrap.dedent("""\
-                json node with key "{node_name}" failed sanity check.
-                  object_id: "{object_id}"
-                  object attribute name: "{attr_name}"
-                  attribute value has type {value_type} (only allowed types are: {allowed_types})
-                  object:
-                -->{object}
-                """.format(node_name=node_name, object_id=object_id, attr_name=attr,
-                           value_type=type(value), allowed_types=allowed_types,
-                           object=obj))
-                raise Exception(err)
-
-
-def _add_json_node_base(json_data, node, node_name):
-    check_node(node, node_name)
+def add_json_node_calendar(json_data, reference_date=None, horizon=None):
+    """Add the node listing the bodies and offices up for election each year."""
+    node = calendar.make_calendar_node(json_data, reference_date=reference_date,
+                                       horizon=horizon)
+    _add_json_node_base(json_data, node, calendar.NODE_NAME,
+                        allowed_types=schema.JSON_ALLOWED_INDEX_TYPES)
+
+
+def check_node(node, node_name, allowed_types=None):
+    schema.check_json_node(node, node_name, allowed_types=allowed_types)
+
+
+def _set_json_node(json_data, node, node_name):
     json_data[node_name] = node
+    metrics.set_value(metrics.METRIC_JSON_OBJECTS, len(node), node=node_name)
+
+
+def _add_json_node_base(json_data, node, node_name, allowed_types=None):
+    check_node(node, node_name, allowed_types=allowed_types)
+    _set_json_node(json_data, node, node_name)
+
+
+def _add_json_object_node(json_data, objects, node_name):
+    """Add a node of objects, projected and checked using the type's schema."""
+    type_schema = schema.get_node_schema(node_name)
+    node = type_schema.make_json_node(objects, node_name)
+    _set_json_node(json_data, node, node_name)
 
 
 # TODO: remove this function?
-def add_json_node(json_data, base_name, **kwargs):
+def add_json_node(json_data, base_name, mixins, family_specs, **kwargs):
     """Add the node with key base_name."""
     make_node_function_name = "make_node_{0}".format(base_name)
     make_node_func = globals()[make_node_function_name]
-    objects, meta = _get_yaml_data(base_name)
+    objects, meta = _get_node_objects(base_name, mixins, family_specs)
     node = make_node_func(objects, meta=meta, **kwargs)
-    _add_json_node_base(json_data, node, base_name)
+    _add_json_object_node(json_data, node, base_name)
 
 
-def add_json_node_simple(json_data, base_name, **kwargs):
+def add_json_node_simple(json_data, base_name, mixins, family_specs, **kwargs):
     """Add the node with key base_name."""
-    objects, meta = _get_yaml_data(base_name)
+    objects, meta = _get_node_objects(base_name, mixins, family_specs)
     make_object_function_name = "make_object_{0}".format(base_name)
     make_object = globals()[make_object_function_name]
 
@@ -263,24 +302,37 @@ def add_json_node_simple(json_data, base_name, **kwargs):
         json_object = make_object(yaml_data)
         json_node[object_id] = json_object
 
-    _add_json_node_base(json_data, json_node, base_name)
+    _add_json_object_node(json_data, json_node, base_name)
+
+
+def add_json_node_stats(json_data, reference_date=None):
+    """Add the node of rollup statistics (e.g. seat counts by category)."""
+    rollups = stats.get_rollups(json_data, reference_date=reference_date)
+    node = stats.make_stats_node(rollups)
+    _add_json_node_base(json_data, node, stats.NODE_NAME)
+
+
+def make_json_data(reference_date=None, calendar_horizon=None):
+    """Return the JSON data as a dict of nodes.
 
+    Objects that extend a mixin or belong to a family are returned as
+    read-only views.
+    Use dumps_json() to serialize the return value.
 
-# TODO
-# add_source(data, 'office_types')
-#
-# # Make districts.
-# districts = make_court_of_appeals_districts()
-# data['districts'] = districts
-#
-# offices = make_court_of_appeals()
-# data['court_offices'] = offices
-def make_json_data():
+    Arguments:
+      reference_date: the date the election calendar starts from (see
+        calendar.get_reference_date()).  It is recorded in the _meta node,
+        since the calendar and statistics depend on it.
+      calendar_horizon: the number of years in the election calendar.
+    """
+    reference_date = calendar.get_reference_date(reference_date)
     mixins, meta = _get_yaml_data('mixins')
+    family_specs, meta = _get_yaml_data(families.FILE_BASE_FAMILIES)
 
     json_data ={
-        '_meta': {
-            'license': _LICENSE
+        KEY_META: {
+            'license': _LICENSE,
+            calendar.META_KEY_REFERENCE_DATE: reference_date.isoformat(),
         }
     }
 
@@ -293,12 +345,22 @@ def make_json_data():
     ]
 
     for base_name in base_names:
-        add_json_node_simple(json_data, base_name)
+        with metrics.stage("json_node_{0}".format(base_name)):
+            add_json_node_simple(json_data, base_name, mixins=mixins, family_specs=family_specs)
 
     # TODO: DRY up the remaining object types.
-    add_json_node(json_data, 'categories')
-    add_json_node(json_data, 'bodies')
-    add_json_node(json_data, 'offices', mixins=mixins)
-    add_json_node_i18n(json_data)
+    with metrics.stage("json_node_categories"):
+        add_json_node(json_data, 'categories', mixins=mixins, family_specs=family_specs)
+    with metrics.stage("json_node_bodies"):
+        add_json_node(json_data, 'bodies', mixins=mixins, family_specs=family_specs)
+    with metrics.stage("json_node_offices"):
+        add_json_node(json_data, 'offices', mixins=mixins, family_specs=family_specs)
+    with metrics.stage("json_node_phrases"):
+        add_json_node_i18n(json_data)
+    with metrics.stage("json_node_election_calendar"):
+        add_json_node_calendar(json_data, reference_date=reference_date,
+                               horizon=calendar_horizon)
+    with metrics.stage("json_node_stats"):
+        add_json_node_stats(json_data, reference_date=reference_date)
 
     return json_data
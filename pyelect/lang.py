@@ -21,6 +21,8 @@ from pprint import pprint
 import re
 import textwrap
 
+from pyelect import metrics
+from pyelect import transmem
 from pyelect import utils
 
 
@@ -242,6 +244,41 @@ def _process_contest_row(row, phrases, all_overrides, text_id, langs, attr_forma
         translations[lang] = translation
 
 
+def _format_suggestion(suggestion, translations):
+    lines = ["    -> {0} ({1:.0%} similar)".format(suggestion.text_id, suggestion.similarity)]
+    for lang in LANGS:
+        if lang in translations:
+            lines.append("       {0}: {1!r}".format(lang, translations[lang]))
+    return lines
+
+
+def _make_unmatched_message(unmatched):
+    """Return an error message suggesting text ID's for unmatched phrases.
+
+    Arguments:
+      unmatched: the CSV English phrases with no text ID.
+    """
+    existing = get_phrases()
+    with metrics.stage('translation_memory'):
+        memory = transmem.TranslationMemory.from_phrases(existing, lang=LANG_ENGLISH)
+        lines = []
+        for english in unmatched:
+            lines.append("  {0!r}".format(english))
+            suggestions = memory.find(english)
+            if not suggestions:
+                lines.append("    (no similar existing phrase)")
+            for suggestion in suggestions:
+                translations = existing[suggestion.text_id]
+                lines.extend(_format_suggestion(suggestion, translations))
+    return textwrap.dedent("""\
+    {0} CSV phrase(s) have no text ID in: {1}
+    Add each to that file, or to {2} to skip it.  The closest existing
+    phrases are--
+
+    """).format(len(unmatched), get_rel_path_text_ids_csv(),
+                FILE_NAME_CSV_SKIPS) + "\n".join(lines)
+
+
 def read_csv_dir():
     """Read the contents of the CSV directory.
 
@@ -256,11 +293,16 @@ def read_csv_dir():
     seq = read_csv_rows_contest()
 
     phrases = {}
+    unmatched = []
     for row in seq:
         english = row.en
         if english in skip_phrases:
             continue
-        text_id = english_to_id[english]
+        try:
+            text_id = english_to_id[english]
+        except KeyError:
+            unmatched.append(english)
+            continue
         _process_contest_row(row, phrases, overrides, text_id=text_id,
                              langs=LANGS, attr_format="{0}")
         english_short = row.en_short
@@ -272,6 +314,9 @@ def read_csv_dir():
         _process_contest_row(row, phrases, overrides, text_id=text_id_short,
                              langs=LANGS_SHORT, attr_format="{0}_short")
 
+    if unmatched:
+        raise Exception(_make_unmatched_message(unmatched))
+
     return phrases
 
 
@@ -290,9 +335,12 @@ def _get_text_ids_csv():
 def read_translations_file(rel_dir, lang):
     """Return the dict of: text_id to dict of info."""
     rel_path = os.path.join(rel_dir, "{0}.yaml".format(lang))
-    phrases = utils.read_yaml_rel(rel_path, key=KEY_TEXTS)
-    for text_id, translations in phrases.items():
-        translations.pop(KEY_ENGLISH_ANNOTATION, None)
+    data = utils.read_yaml_rel(rel_path, key=KEY_TEXTS)
+    # Copy the read-only data, since callers modify the return value.
+    phrases = {}
+    for text_id, translations in data.items():
+        phrases[text_id] = {k: v for k, v in translations.items() if
+                            k != KEY_ENGLISH_ANNOTATION}
     return phrases
 
 
@@ -332,6 +380,14 @@ def get_phrases():
     if common_ids:
         raise Exception("should be empty: {0}".format(common_ids))
     phrases1.update(phrases2)
+
+    lang_counts = defaultdict(int)
+    for translations in phrases1.values():
+        for lang in translations:
+            lang_counts[lang] += 1
+    for lang, count in lang_counts.items():
+        metrics.set_value(metrics.METRIC_PHRASES, count, lang=lang)
+
     return phrases1
 
 
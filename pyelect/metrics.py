@@ -0,0 +1,199 @@
+"""Supports collecting machine-readable build metrics.
+
+Metrics are collected in module-level state for the life of the process.
+Code being measured calls stage() to time a block and incr() or
+set_value() to record a number.  Callers can then render the collected
+metrics as JSON or in the Prometheus textfile format.
+
+Terminology
+-----------
+
+stage:
+  A named block of work timed by wall-clock and CPU time.  A stage
+  entered more than once accumulates its times.
+
+labels:
+  A dict of string keys and values distinguishing values of the same
+  metric, for example {'node': 'offices'}.
+
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import time
+
+
+_log = logging.getLogger()
+
+FORMAT_JSON = 'json'
+FORMAT_PROMETHEUS = 'prometheus'
+FORMATS = (FORMAT_JSON, FORMAT_PROMETHEUS)
+
+_PROMETHEUS_EXTENSIONS = ('.prom', )
+_PROMETHEUS_PREFIX = 'sfbed_'
+
+METRIC_BYTES_WRITTEN = 'bytes_written'
+METRIC_CACHE_HITS = 'cache_hits'
+METRIC_CACHE_MISSES = 'cache_misses'
+METRIC_FILES_COMPRESSED = 'files_compressed'
+METRIC_FILES_COPIED = 'files_copied'
+METRIC_FILES_DELETED = 'files_deleted'
+METRIC_FILES_WRITTEN = 'files_written'
+METRIC_JSON_OBJECTS = 'json_objects'
+METRIC_PAGES_RENDERED = 'pages_rendered'
+METRIC_PHRASES = 'phrases'
+METRIC_SQL_ROWS = 'sql_rows'
+
+# The help text for each metric, as shown in the Prometheus output.
+_METRIC_HELP = {
+    METRIC_BYTES_WRITTEN: "Number of bytes written to output files.",
+    METRIC_CACHE_HITS: "Number of cache lookups that found a value.",
+    METRIC_CACHE_MISSES: "Number of cache lookups that did not find a value.",
+    METRIC_FILES_COMPRESSED: "Number of gzipped copies of output files written.",
+    METRIC_FILES_COPIED: "Number of files copied to an output directory.",
+    METRIC_FILES_DELETED: "Number of files deleted from a deploy target.",
+    METRIC_FILES_WRITTEN: "Number of output files written.",
+    METRIC_JSON_OBJECTS: "Number of objects in each JSON node.",
+    METRIC_PAGES_RENDERED: "Number of HTML pages rendered.",
+    METRIC_PHRASES: "Number of phrases with a translation in each language.",
+    METRIC_SQL_ROWS: "Number of rows written to each SQLite table.",
+}
+
+# Maps stage name to a dict of accumulated times.
+_stages = OrderedDict()
+# Maps metric name to a dict mapping labels tuple to value.
+_values = OrderedDict()
+
+
+def reset():
+    """Clear all collected metrics."""
+    _stages.clear()
+    _values.clear()
+
+
+def _make_labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as the stage with the given name.
+
+    Usage:
+
+        with metrics.stage('make_json_data'):
+            ...
+    """
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        info = _stages.setdefault(name, {'calls': 0, 'cpu_seconds': 0.0,
+                                         'wall_seconds': 0.0})
+        info['calls'] += 1
+        info['cpu_seconds'] += time.process_time() - cpu_start
+        info['wall_seconds'] += time.perf_counter() - wall_start
+
+
+def incr(name, value=1, **labels):
+    """Add value to the metric with the given name and labels."""
+    metric = _values.setdefault(name, OrderedDict())
+    key = _make_labels_key(labels)
+    metric[key] = metric.get(key, 0) + value
+
+
+def set_value(name, value, **labels):
+    """Set the metric with the given name and labels to value."""
+    metric = _values.setdefault(name, OrderedDict())
+    key = _make_labels_key(labels)
+    metric[key] = value
+
+
+def record_cache(cache_name, hit):
+    """Record a hit or miss for a lookup in the cache with the given name."""
+    name = METRIC_CACHE_HITS if hit else METRIC_CACHE_MISSES
+    incr(name, cache=cache_name)
+
+
+def get_data():
+    """Return the collected metrics as a JSON-serializable dict."""
+    stages = {name: dict(info) for name, info in _stages.items()}
+    values = {}
+    for name, metric in _values.items():
+        values[name] = [{'labels': dict(key), 'value': value} for
+                        key, value in sorted(metric.items())]
+    data = {
+        'metrics': values,
+        'stages': stages,
+    }
+    return data
+
+
+def format_json():
+    data = get_data()
+    return json.dumps(data, indent=4, sort_keys=True)
+
+
+def _format_prometheus_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace('\\', r'\\').replace('"', r'\"')
+        parts.append('{0}="{1}"'.format(key, value))
+    return "{{{0}}}".format(",".join(parts))
+
+
+def _format_prometheus_metric(lines, name, help, samples):
+    """
+    Arguments:
+      samples: an iterable of (labels, value) pairs, where labels is a
+        sorted tuple of (key, value) pairs.
+    """
+    full_name = "{0}{1}".format(_PROMETHEUS_PREFIX, name)
+    lines.append("# HELP {0} {1}".format(full_name, help))
+    lines.append("# TYPE {0} gauge".format(full_name))
+    for labels, value in samples:
+        lines.append("{0}{1} {2}".format(full_name, _format_prometheus_labels(labels),
+                                         value))
+
+
+def format_prometheus():
+    """Return the metrics in the Prometheus textfile exposition format."""
+    lines = []
+    stage_metrics = [
+        ('stage_calls', 'calls', "Number of times each build stage ran."),
+        ('stage_cpu_seconds', 'cpu_seconds', "CPU time spent in each build stage."),
+        ('stage_wall_seconds', 'wall_seconds', "Wall-clock time spent in each build stage."),
+    ]
+    for name, key, help in stage_metrics:
+        samples = [((('stage', stage_name), ), info[key]) for
+                   stage_name, info in _stages.items()]
+        _format_prometheus_metric(lines, name, help, samples)
+    for name in sorted(_values.keys()):
+        help = _METRIC_HELP.get(name, name)
+        samples = sorted(_values[name].items())
+        _format_prometheus_metric(lines, name, help, samples)
+
+    return "\n".join(lines) + "\n"
+
+
+def get_format(path, format_=None):
+    """Return the output format to use for the given path."""
+    if format_ is not None:
+        if format_ not in FORMATS:
+            raise Exception("bad metrics format: {0!r} (choose from: {1})"
+                            .format(format_, ", ".join(FORMATS)))
+        return format_
+    if path.endswith(_PROMETHEUS_EXTENSIONS):
+        return FORMAT_PROMETHEUS
+    return FORMAT_JSON
+
+
+def format_text(format_):
+    if format_ == FORMAT_PROMETHEUS:
+        return format_prometheus()
+    return format_json()
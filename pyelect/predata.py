@@ -0,0 +1,144 @@
+"""Supports loading each pre-data file only once until it changes.
+
+The registry maps the absolute path of each loaded file to its parsed,
+read-only contents.  Dicts are returned as read-only mappings and lists
+as tuples, so callers can share the contents safely.  Callers that need
+to modify the contents should copy them first.
+
+Each load checks the file's modification time, and reads the file again
+if it changed since it was loaded, so that a long-running process (e.g.
+the preview server) sees edits.  Code that writes a file should still
+call invalidate() with its path, since a write can leave the
+modification time unchanged on file systems with coarse timestamps.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+from types import MappingProxyType
+
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+_CACHE_NAME = 'pre_data'
+
+# Parse files in worker processes only when there are at least this many
+# to parse, since starting the processes takes time.
+PARALLEL_MIN_FILES = 32
+
+# Maps normalized absolute path to a (mtime, data) pair.
+_registry = {}
+
+# Returned by _get_loaded() for files needing to be read.
+_NOT_LOADED = object()
+
+
+def _normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def freeze(data):
+    """Return a read-only copy of the given parsed data."""
+    if isinstance(data, dict):
+        return MappingProxyType({k: freeze(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return tuple(freeze(v) for v in data)
+    return data
+
+
+def _get_loaded(path):
+    """Return the loaded contents of a file, recording a cache hit or miss.
+
+    Returns _NOT_LOADED if the file is not loaded, or if it changed (or
+    was removed) since it was loaded.
+    """
+    key = _normalize_path(path)
+    try:
+        mtime, data = _registry[key]
+    except KeyError:
+        data = _NOT_LOADED
+    else:
+        try:
+            current = os.path.getmtime(path)
+        except OSError:
+            current = None
+        if current != mtime:
+            _log.debug("pre-data file changed: {0}".format(path))
+            del _registry[key]
+            data = _NOT_LOADED
+    metrics.record_cache(_CACHE_NAME, hit=data is not _NOT_LOADED)
+    return data
+
+
+def load(path, read_func):
+    """Return the read-only contents of the file at path.
+
+    Arguments:
+      read_func: a function that accepts a path and returns the parsed
+        contents.  It is called only if the file is not already loaded,
+        or changed since it was loaded.
+    """
+    data = _get_loaded(path)
+    if data is not _NOT_LOADED:
+        return data
+
+    _log.debug("loading pre-data file: {0}".format(path))
+    mtime = os.path.getmtime(path)
+    data = freeze(read_func(path))
+    _registry[_normalize_path(path)] = (mtime, data)
+
+    return data
+
+
+def _read_chunk(paths, read_func):
+    # Get the mtime first, so a change during the read makes it stale.
+    results = []
+    for path in paths:
+        mtime = os.path.getmtime(path)
+        results.append((mtime, read_func(path)))
+    return results
+
+
+def load_many(paths, read_func, workers=None):
+    """Return a list of the read-only contents of the files at paths.
+
+    This is like calling load() on each path, except that if many of the
+    files need to be read, they are parsed in a pool of processes.
+
+    Arguments:
+      read_func: a module-level function (so that it can be sent to the
+        worker processes), as for load().
+      workers: the number of worker processes, or None for the number
+        of CPUs.
+    """
+    paths = list(paths)
+    missing = [path for path in paths if _get_loaded(path) is _NOT_LOADED]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(missing) < PARALLEL_MIN_FILES:
+        results = _read_chunk(missing, read_func)
+    else:
+        _log.debug("loading {0} pre-data files in {1} processes"
+                   .format(len(missing), workers))
+        # Send the paths in chunks to reduce the overhead per file.
+        chunk_size = -(-len(missing) // (4 * workers))
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = executor.map(_read_chunk, chunks, [read_func] * len(chunks))
+            results = [result for chunk_result in chunk_results for result in chunk_result]
+    for path, (mtime, data) in zip(missing, results):
+        _registry[_normalize_path(path)] = (mtime, freeze(data))
+
+    return [_registry[_normalize_path(path)][1] for path in paths]
+
+
+def invalidate(path=None):
+    """Forget the contents of the file at path, or all files if None."""
+    if path is None:
+        _registry.clear()
+        return
+    _registry.pop(_normalize_path(path), None)
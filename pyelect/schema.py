@@ -0,0 +1,383 @@
+"""Supports the object type schemas shared by the JSON and HTML generation.
+
+The field configuration below is parsed and compiled once per process
+into one TypeSchema object per object type.  Each TypeSchema precomputes
+the field name sets needed to project and validate objects of its type,
+so callers do not need to loop over the field configuration per object.
+The JSON generation uses the schemas to build and check the nodes of
+objects, and the HTML generation to build and check the template data.
+
+Validation functions check an entire node in one pass and raise a
+single exception describing every error found.
+
+"""
+
+import logging
+import textwrap
+
+import yaml
+
+from pyelect import lang
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+FIELD_TYPE_I18N = 'i18n'
+
+# The types allowed for attribute values of objects in the JSON file.
+JSON_ALLOWED_TYPES = (bool, int, str)
+# The types allowed for attribute values of objects in index nodes
+# (i.e. nodes computed from the other nodes, like the election calendar).
+JSON_ALLOWED_INDEX_TYPES = JSON_ALLOWED_TYPES + (list, )
+
+OFFICE_BODY_COMMON_FIELDS_YAML = """\
+  -
+    name: category_id
+  -
+    name: election_method_id
+  -
+    name: name
+    type: i18n
+  -
+    name: notes
+  -
+    name: seed_year
+  -
+    name: term_length
+  -
+    name: twitter
+  -
+    name: url
+  -
+    name: wikipedia
+"""
+
+TYPE_FIELDS_YAML = """\
+area:
+  -
+    name: name
+    type: i18n
+  -
+    name: notes
+    type: i18n
+  -
+    name: wikipedia
+body:
+{office_body_yaml}
+  -
+    name: district_type_id
+    required: true
+  -
+    name: jurisdiction_area_id
+    required: true
+  -
+    name: localwiki
+  -
+    name: member_name
+  -
+    name: office_name
+  -
+    name: office_name_format
+  -
+    name: partisan
+    required: true
+  -
+    name: qualified_name
+  -
+    name: seat_count
+    required: true
+  -
+    name: seat_name_format
+  -
+    name: vote_method
+category:
+  -
+    name: name
+    type: i18n
+district:
+  -
+    name: district_code
+  -
+    name: district_type_id
+  -
+    name: name
+    required: true
+  -
+    name: number
+  -
+    name: wikipedia
+district_type:
+  -
+    name: body_id
+  -
+    name: category_id
+  -
+    name: district_count
+  -
+    name: district_name_short_format
+  -
+    name: district_name_full_format
+    # Require this because it is used to generate the name.
+    required: true
+  -
+    name: geographic
+  -
+    name: name
+  -
+    name: name_singular
+    required: true
+  -
+    name: parent_area_id
+  -
+    name: wikipedia
+election_method:
+  -
+    name: name
+    type: i18n
+  -
+    name: notes
+    type: i18n
+  -
+    name: wikipedia
+language:
+  -
+    name: code
+  -
+    name: name
+  -
+    name: notes
+    type: i18n
+office:
+{office_body_yaml}
+  -
+    name: body_id
+  -
+    # The family member attributes (see the families module).
+    name: district
+  -
+    name: district_id
+  -
+    name: division
+  -
+    # TODO: make this required.
+    name: jurisdiction_area_id
+  -
+    name: office_type_id
+  -
+    name: partisan
+  -
+    name: seat
+  -
+    name: seat_count
+  -
+    name: seat_name
+  -
+    name: vote_method
+""".format(office_body_yaml=OFFICE_BODY_COMMON_FIELDS_YAML)
+
+# The node names of the types whose plural is not formed by adding "s".
+_SINGULAR_TO_PLURAL = {
+    'body': 'bodies',
+    'category': 'categories',
+}
+
+_PLURAL_TO_SINGULAR = {p: s for s, p in _SINGULAR_TO_PLURAL.items()}
+
+# The compiled schemas, keyed by type name.  Set by get_schemas().
+_schemas = None
+
+
+def type_name_to_plural(singular):
+    """Return the node name given an object type name.
+
+    For example, "body" yields "bodies".
+    """
+    try:
+        plural = _SINGULAR_TO_PLURAL[singular]
+    except KeyError:
+        plural = "{0}s".format(singular)
+    return plural
+
+
+def type_name_to_singular(plural):
+    try:
+        singular = _PLURAL_TO_SINGULAR[plural]
+    except KeyError:
+        singular = plural[:-1]
+    return singular
+
+
+class TypeSchema(object):
+
+    """The compiled schema for one object type."""
+
+    def __init__(self, type_name, fields):
+        """
+        Arguments:
+          type_name: the singular type name, for example "body".
+          fields: a list of field dicts from the field configuration.
+        """
+        self.type_name = type_name
+        self.fields = tuple(fields)
+        self.field_names = tuple(f['name'] for f in fields)
+        self.required_names = frozenset(f['name'] for f in fields if f.get('required'))
+
+        # Pairs of (field name, i18n field name), where the second element
+        # is None for fields that are not of type i18n.
+        html_pairs = []
+        for field in fields:
+            name = field['name']
+            if field.get('type') == FIELD_TYPE_I18N:
+                i18n_name = lang.get_i18n_field_name(name)
+            else:
+                i18n_name = None
+            html_pairs.append((name, i18n_name))
+        self._html_pairs = tuple(html_pairs)
+
+        self.json_names = frozenset(self.field_names +
+                                    tuple(lang.get_i18n_field_name(n) for n in self.field_names))
+
+    def __repr__(self):
+        return "<TypeSchema: {0}>".format(self.type_name)
+
+    def get_unknown_names(self, data):
+        """Return the sorted names of the fields in data unknown to the type."""
+        json_names = self.json_names
+        return sorted(k for k in data if k not in json_names)
+
+    def project(self, data):
+        """Return data with only the fields known to the type.
+
+        Both a field and its internationalized variant are kept.  Returns
+        data itself if every field is known (the usual case), so that
+        read-only views (see the inherit module) are not copied.
+        """
+        json_names = self.json_names
+        if all(k in json_names for k in data):
+            return data
+        return {k: v for k, v in data.items() if k in json_names}
+
+    def make_json_node(self, objects, node_name):
+        """Return the JSON node for the given objects, checking it.
+
+        Fields unknown to the type are dropped (see project()).  Raises
+        one exception describing every bad attribute value found.
+
+        Arguments:
+          objects: a dict mapping object ID to object.
+        """
+        node = {}
+        unknown_names = set()
+        for object_id, obj in objects.items():
+            unknown_names.update(self.get_unknown_names(obj))
+            node[object_id] = self.project(obj)
+        if unknown_names:
+            _log.warning("dropping fields unknown to type {0!r} from node {1!r}: {2}"
+                         .format(self.type_name, node_name, ", ".join(sorted(unknown_names))))
+        check_json_node(node, node_name)
+        return node
+
+    def make_html_object(self, json_obj, object_id):
+        """Return a new html object with every field set (None if absent)."""
+        html_obj = {'id': object_id}
+        for name, i18n_name in self._html_pairs:
+            html_obj[name] = json_obj.get(name)
+            if i18n_name is not None:
+                # Include internationalized values when they are available.
+                html_obj[i18n_name] = json_obj.get(i18n_name)
+        return html_obj
+
+    def get_object_errors(self, html_obj):
+        """Return a list of error strings for the given html object."""
+        errors = []
+        missing = [n for n in self.field_names if n not in html_obj]
+        for name in missing:
+            errors.append("field {0!r} missing".format(name))
+        for name in sorted(self.required_names):
+            if html_obj.get(name, False) is None:
+                errors.append("field {0!r} should not be None".format(name))
+        return errors
+
+    def check_html_node(self, objects):
+        """Check the given html objects, raising one error listing all failures.
+
+        Arguments:
+          objects: a dict mapping object ID to html object.
+        """
+        messages = []
+        for object_id in sorted(objects.keys()):
+            html_obj = objects[object_id]
+            errors = self.get_object_errors(html_obj)
+            if errors:
+                messages.append("{0} {1!r}: {2}\n  object: {3!r}"
+                                .format(self.type_name, object_id, "; ".join(errors),
+                                        html_obj))
+        if messages:
+            raise Exception("{0} object(s) of type {1!r} failed validation:\n{2}"
+                            .format(len(messages), self.type_name, "\n".join(messages)))
+
+
+def _compile_schemas():
+    field_data = yaml.load(TYPE_FIELDS_YAML)
+    schemas = {}
+    for type_name, fields in field_data.items():
+        schemas[type_name] = TypeSchema(type_name, fields)
+    return schemas
+
+
+def get_schemas():
+    """Return a dict mapping type name to TypeSchema, compiling on first use."""
+    global _schemas
+    metrics.record_cache('schema', hit=_schemas is not None)
+    if _schemas is None:
+        _schemas = _compile_schemas()
+    return _schemas
+
+
+def get_type_schema(type_name):
+    """Return the TypeSchema for the given singular type name."""
+    schemas = get_schemas()
+    try:
+        return schemas[type_name]
+    except KeyError:
+        raise Exception("no schema for type {0!r} (choose from: {1})"
+                        .format(type_name, ", ".join(sorted(schemas))))
+
+
+def get_node_schema(node_name):
+    """Return the TypeSchema for the objects of a node, e.g. "bodies"."""
+    return get_type_schema(type_name_to_singular(node_name))
+
+
+def check_json_node(node, node_name, allowed_types=None):
+    """Check the attribute value types of every object in a JSON node.
+
+    Raises one exception describing every bad attribute found.
+
+    Arguments:
+      allowed_types: the allowed value types.  Defaults to JSON_ALLOWED_TYPES.
+    """
+    if allowed_types is None:
+        allowed_types = JSON_ALLOWED_TYPES
+    errors = []
+    for object_id in sorted(node.keys()):
+        obj = node[object_id]
+        for attr in sorted(obj.keys()):
+            value = obj[attr]
+            if type(value) in allowed_types:
+                continue
+            err = textwrap.dedent("""\
+              object_id: "{object_id}"
+              object attribute name: "{attr_name}"
+              attribute value has type {value_type}
+              object:
+            -->{object}""").format(object_id=object_id, attr_name=attr,
+                                   value_type=type(value), object=obj)
+            errors.append(err)
+    if errors:
+        raise Exception('json node with key "{node_name}" failed sanity check '
+                        "with {count} error(s) (only allowed types are: {allowed_types}):\n{errors}"
+                        .format(node_name=node_name, count=len(errors),
+                                allowed_types=allowed_types,
+                                errors="\n".join(errors)))
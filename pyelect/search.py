@@ -0,0 +1,353 @@
+"""Supports searching the objects and phrases by text in any language.
+
+The search index is an inverted index mapping each search term to the
+documents containing it.  There is one document per object (e.g. each
+office), made from its names and their translations, and one per phrase,
+made from all of its translations.
+
+Text is split into terms as follows, which a client-side search should
+repeat on its queries:
+
+1. Lower-case the text (with str.casefold()), decompose it (Unicode NFKD),
+   and remove combining marks, so that e.g. "Asamblea" and "asamblea",
+   and "Apelación" and "apelacion", give the same terms.
+2. Split the text into runs of letters and digits.
+3. Split each run of CJK characters (e.g. Chinese), which are written
+   without spaces, into overlapping character bigrams.  A run of one
+   character is its own term.  Each other run is one term (a word).
+
+A query matches the documents containing all of its terms, except that
+its last word can match any term it is a prefix of (so that results can
+update as someone types), and a query term of one CJK character matches
+any term containing it.
+
+The JSON form of the index is a dict with keys "version", "docs" (a list
+of [doc_id, node_name, label] lists, numbered by position), and "terms"
+(mapping each term to its document numbers).  To keep it compact, each
+list of document numbers is sorted and stored as the differences between
+consecutive numbers.
+
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+import json
+import logging
+import re
+import unicodedata
+
+from pyelect import inherit
+from pyelect.lang import I18N_SUFFIX
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+FORMAT_VERSION = 1
+NODE_PHRASES = 'phrases'
+FILE_NAME = 'search_index.json'
+
+_CACHE_NAME = 'search_index'
+
+# A one-item cache of (json_data, index), so the index is built once per
+# run (see also the coverage module).
+_cached = None
+
+# The object fields to index, along with their "_i18n" fields.
+_OBJECT_TEXT_FIELDS = ('member_name', 'name', 'office_name', 'qualified_name')
+
+# Han characters, Hiragana and Katakana, and Hangul.
+_CJK_RANGES = (
+    ('\u3040', '\u30ff'),
+    ('\u3400', '\u4dbf'),
+    ('\u4e00', '\u9fff'),
+    ('\uac00', '\ud7af'),
+    ('\uf900', '\ufaff'),
+)
+_CJK_CLASS = "".join("{0}-{1}".format(start, end) for start, end in _CJK_RANGES)
+# Splitting text with this alternates between other text and CJK runs.
+_CJK_SPLIT_PATTERN = re.compile('([{0}]+)'.format(_CJK_CLASS))
+_WORD_PATTERN = re.compile(r'\w+')
+
+
+class _StripMarksTable(dict):
+
+    """A str.translate() table deleting combining marks, filled on use."""
+
+    def __missing__(self, code):
+        value = None if unicodedata.combining(chr(code)) else code
+        self[code] = value
+        return value
+
+
+_STRIP_MARKS_TABLE = _StripMarksTable()
+
+
+def _normalize(text):
+    text = text.casefold()
+    try:
+        text.encode('ascii')
+    except UnicodeEncodeError:
+        text = unicodedata.normalize('NFKD', text)
+        return text.translate(_STRIP_MARKS_TABLE)
+    # Then the text needs no more normalizing, which is the common case.
+    return text
+
+
+def _split_cjk(run):
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def _iter_runs(text):
+    """Yield a (run, is_cjk) pair for each part of normalized text."""
+    for i, part in enumerate(_CJK_SPLIT_PATTERN.split(text)):
+        if i % 2:
+            yield part, True
+        elif part:
+            yield part, False
+
+
+def tokenize(text):
+    """Return a list of the terms in the text, with the word flag of each.
+
+    Returns a list of (term, is_word) pairs, in order of appearance.
+    """
+    tokens = []
+    for run, is_cjk in _iter_runs(_normalize(text)):
+        if is_cjk:
+            tokens.extend((term, False) for term in _split_cjk(run))
+        else:
+            tokens.extend((word, True) for word in _WORD_PATTERN.findall(run))
+    return tokens
+
+
+def _get_normalized_terms(text):
+    terms = set()
+    for run, is_cjk in _iter_runs(text):
+        if is_cjk:
+            terms.update(_split_cjk(run))
+        else:
+            terms.update(_WORD_PATTERN.findall(run))
+    return terms
+
+
+def get_terms(text):
+    """Return the set of terms in the text."""
+    return _get_normalized_terms(_normalize(text))
+
+
+def _get_object_texts(view, phrases):
+    texts = []
+    for field in _OBJECT_TEXT_FIELDS:
+        value = view.get(field)
+        if isinstance(value, str):
+            texts.append(value)
+        phrase = phrases.get(view.get(field + I18N_SUFFIX))
+        if phrase:
+            texts.extend(text for text in phrase.values() if isinstance(text, str))
+    return texts
+
+
+def _get_english(phrases, text_id):
+    phrase = phrases.get(text_id)
+    return phrase.get('en') if phrase else None
+
+
+def _iter_documents(json_data):
+    """Yield a (doc_id, node_name, label, texts) tuple for each document."""
+    phrases = json_data.get(NODE_PHRASES, {})
+    resolver = inherit.Resolver(json_data)
+    for node_name in sorted(json_data):
+        node = json_data[node_name]
+        if node_name == NODE_PHRASES or node_name.startswith('_') or not isinstance(node, dict):
+            continue
+        for object_id in sorted(node):
+            if not isinstance(node[object_id], dict):
+                continue
+            view = resolver.get_view(node_name, object_id)
+            texts = _get_object_texts(view, phrases)
+            if not texts:
+                continue
+            label = view.get('name') or _get_english(phrases, view.get('name' + I18N_SUFFIX))
+            yield object_id, node_name, label or object_id, texts
+    for text_id in sorted(phrases):
+        phrase = phrases[text_id]
+        texts = [text for text in phrase.values() if isinstance(text, str)]
+        yield text_id, NODE_PHRASES, phrase.get('en') or text_id, texts
+
+
+class SearchIndex(object):
+
+    """An inverted index from search term to document numbers."""
+
+    def __init__(self, docs, postings):
+        """
+        Arguments:
+          docs: a list of (doc_id, node_name, label) tuples.
+          postings: a dict mapping term to a sorted list of document
+            numbers (i.e. indexes into docs).
+        """
+        self.docs = docs
+        self.postings = postings
+        self._sorted_terms = None
+        # A dict mapping each CJK character to the bigrams ending with it.
+        self._bigrams_by_last = None
+
+    @classmethod
+    def from_json_data(cls, json_data):
+        """Build the index from the JSON data, in one pass over it."""
+        docs = []
+        postings = defaultdict(list)
+        for doc_id, node_name, label, texts in _iter_documents(json_data):
+            doc_number = len(docs)
+            docs.append((doc_id, node_name, label))
+            # Terms cannot span lines, so tokenize the texts in one call.
+            text = "\n".join(_normalize(text) for text in texts)
+            terms = _get_normalized_terms(text)
+            # Documents are numbered in order, so each list stays sorted.
+            for term in terms:
+                postings[term].append(doc_number)
+        return cls(docs, dict(postings))
+
+    @classmethod
+    def from_json(cls, data):
+        """Load the index from the value returned by to_json()."""
+        if data.get('version') != FORMAT_VERSION:
+            raise Exception("unsupported search index version: {0!r}"
+                            .format(data.get('version')))
+        docs = [tuple(doc) for doc in data['docs']]
+        postings = {}
+        for term, deltas in data['terms'].items():
+            doc_numbers = []
+            doc_number = 0
+            for delta in deltas:
+                doc_number += delta
+                doc_numbers.append(doc_number)
+            postings[term] = doc_numbers
+        return cls(docs, postings)
+
+    def to_json(self):
+        """Return the index as a JSON-serializable dict."""
+        terms = {}
+        for term, doc_numbers in self.postings.items():
+            previous = 0
+            deltas = []
+            for doc_number in doc_numbers:
+                deltas.append(doc_number - previous)
+                previous = doc_number
+            terms[term] = deltas
+        return {
+            'version': FORMAT_VERSION,
+            'docs': [list(doc) for doc in self.docs],
+            'terms': terms,
+        }
+
+    def _get_prefix_matches(self, prefix):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        terms = self._sorted_terms
+        doc_numbers = set()
+        i = bisect_left(terms, prefix)
+        while i < len(terms) and terms[i].startswith(prefix):
+            doc_numbers.update(self.postings[terms[i]])
+            i += 1
+        return doc_numbers
+
+    def _get_char_matches(self, char):
+        if self._bigrams_by_last is None:
+            bigrams_by_last = {}
+            for term in self.postings:
+                if len(term) == 2 and _CJK_SPLIT_PATTERN.match(term):
+                    bigrams_by_last.setdefault(term[1], []).append(term)
+            self._bigrams_by_last = bigrams_by_last
+        doc_numbers = self._get_prefix_matches(char)
+        for term in self._bigrams_by_last.get(char, ()):
+            doc_numbers.update(self.postings[term])
+        return doc_numbers
+
+    def search_numbers(self, query):
+        """Return the sorted numbers of the documents matching the query."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        last_term, last_is_word = tokens[-1]
+        exact_terms = set()
+        # The query's runs of one CJK character.  The index has such a
+        # term only for runs of one character, since longer runs give
+        # only bigrams, so each matches any term containing it.
+        char_terms = set()
+        for i, (term, is_word) in enumerate(tokens):
+            if not is_word and len(term) == 1:
+                char_terms.add(term)
+            elif not is_word or i < len(tokens) - 1:
+                exact_terms.add(term)
+        postings = []
+        for term in exact_terms:
+            try:
+                postings.append(self.postings[term])
+            except KeyError:
+                return []
+        # Start with the rarest terms, so the intersection shrinks fastest.
+        postings.sort(key=len)
+        matches = None
+        for doc_numbers in postings:
+            matches = set(doc_numbers) if matches is None else matches.intersection(doc_numbers)
+            if not matches:
+                return []
+        for char in char_terms:
+            char_matches = self._get_char_matches(char)
+            matches = char_matches if matches is None else matches & char_matches
+            if not matches:
+                return []
+        if last_is_word:
+            prefix_matches = self._get_prefix_matches(last_term)
+            matches = prefix_matches if matches is None else matches & prefix_matches
+        return sorted(matches)
+
+    def search(self, query, node_name=None, limit=None):
+        """Return the documents matching the query.
+
+        Returns a list of (doc_id, node_name, label) tuples, with objects
+        before phrases.
+
+        Arguments:
+          node_name: optionally, the node to restrict the results to,
+            e.g. "offices".
+          limit: the maximum number of results to return, or None.
+        """
+        results = []
+        for doc_number in self.search_numbers(query):
+            doc = self.docs[doc_number]
+            if node_name is not None and doc[1] != node_name:
+                continue
+            results.append(doc)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+
+def get_search_index(json_data):
+    """Return the search index for the JSON data, building it at most once."""
+    global _cached
+    if _cached is not None and _cached[0] is json_data:
+        metrics.record_cache(_CACHE_NAME, hit=True)
+        return _cached[1]
+    metrics.record_cache(_CACHE_NAME, hit=False)
+    with metrics.stage('search_index'):
+        index = SearchIndex.from_json_data(json_data)
+    _cached = (json_data, index)
+    return index
+
+
+def search(json_data, query, node_name=None, limit=None):
+    """Search the JSON data (see SearchIndex.search())."""
+    index = get_search_index(json_data)
+    return index.search(query, node_name=node_name, limit=limit)
+
+
+def dumps_index(index):
+    """Return the index as compact JSON text."""
+    return json.dumps(index.to_json(), ensure_ascii=False, sort_keys=True,
+                      separators=(',', ':'))
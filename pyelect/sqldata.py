@@ -0,0 +1,318 @@
+"""Supports exporting the JSON data to an SQLite database, and reading it.
+
+The database has one table per node of objects (e.g. "offices"), with an
+"id" primary key column and one column per attribute.  Columns whose
+names reference another node (e.g. "body_id", see the compact module)
+have an index, and a foreign key constraint unless they reference the
+phrases.  The phrases are in a normalized "phrases" table with columns
+text_id, lang, and text.  For example:
+
+    SELECT o.id, p.text FROM offices o
+      JOIN phrases p ON p.text_id = o.name_i18n AND p.lang = 'es';
+
+Two more tables record what is needed to read the data back exactly:
+"_fields" lists each column along with the JSON type of its values, and
+"_nodes" stores the nodes that are not objects (e.g. "_meta") as JSON.
+
+Column types
+------------
+
+bool:  stored as 0 or 1.
+int:   stored as an integer.
+str:   stored as text.
+any:   a mix of integers and strings, each stored as itself.
+json:  any other values (e.g. lists), each stored as JSON text.
+
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from urllib.parse import quote
+
+from pyelect import atomic
+from pyelect import compact
+from pyelect import metrics
+
+
+_log = logging.getLogger()
+
+FILE_NAME = 'sf.sqlite'
+
+TABLE_FIELDS = '_fields'
+TABLE_NODES = '_nodes'
+TABLE_PHRASES = 'phrases'
+
+COLUMN_ID = 'id'
+
+TYPE_ANY = 'any'
+TYPE_BOOL = 'bool'
+TYPE_INT = 'int'
+TYPE_JSON = 'json'
+TYPE_STR = 'str'
+
+# The declared SQL type of each column type.  A column with no declared
+# type stores each value with its own type.
+_SQL_TYPES = {
+    TYPE_ANY: '',
+    TYPE_BOOL: ' INTEGER',
+    TYPE_INT: ' INTEGER',
+    TYPE_JSON: ' TEXT',
+    TYPE_STR: ' TEXT',
+}
+
+
+def _quote(name):
+    return '"{0}"'.format(name.replace('"', '""'))
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def get_column_type(values):
+    """Return the column type to store the given values."""
+    if all(isinstance(value, bool) for value in values):
+        return TYPE_BOOL
+    if all(_is_int(value) for value in values):
+        return TYPE_INT
+    if all(isinstance(value, str) for value in values):
+        return TYPE_STR
+    if all(_is_int(value) or isinstance(value, str) for value in values):
+        return TYPE_ANY
+    return TYPE_JSON
+
+
+def _to_sql(value, column_type):
+    if value is None:
+        return None
+    if column_type == TYPE_JSON:
+        return json.dumps(value, sort_keys=True)
+    if column_type == TYPE_BOOL:
+        return int(value)
+    return value
+
+
+def _from_sql(value, column_type):
+    if column_type == TYPE_JSON:
+        return json.loads(value)
+    if column_type == TYPE_BOOL:
+        return bool(value)
+    return value
+
+
+def _get_columns(node_name, node, object_nodes):
+    """Return a list of (name, column type, referenced node) tuples."""
+    values_by_field = {}
+    for obj in node.values():
+        for field_name, value in obj.items():
+            values_by_field.setdefault(field_name, []).append(value)
+    if COLUMN_ID in values_by_field:
+        raise Exception("objects in node {0!r} have a reserved attribute: {1}"
+                        .format(node_name, COLUMN_ID))
+    columns = []
+    for field_name in sorted(values_by_field):
+        values = values_by_field[field_name]
+        column_type = get_column_type(values)
+        ref_node = compact.get_ref_node_candidate(field_name, object_nodes)
+        # Only index a reference if every value is an ID in the node.
+        if ref_node is not None and (column_type != TYPE_STR or
+                                     not set(values) <= set(object_nodes[ref_node])):
+            ref_node = None
+        columns.append((field_name, column_type, ref_node))
+    return columns
+
+
+def _create_object_table(conn, node_name, node, columns):
+    column_defs = ["{0} TEXT PRIMARY KEY".format(_quote(COLUMN_ID))]
+    for name, column_type, ref_node in columns:
+        column_def = _quote(name) + _SQL_TYPES[column_type]
+        if ref_node is not None and ref_node != TABLE_PHRASES:
+            column_def += " REFERENCES {0}({1})".format(_quote(ref_node), _quote(COLUMN_ID))
+        column_defs.append(column_def)
+    conn.execute("CREATE TABLE {0} ({1})".format(_quote(node_name), ", ".join(column_defs)))
+
+    names = [COLUMN_ID] + [name for name, column_type, ref_node in columns]
+    sql = "INSERT INTO {0} ({1}) VALUES ({2})".format(
+        _quote(node_name), ", ".join(_quote(name) for name in names),
+        ", ".join('?' for name in names))
+    rows = ([object_id] + [_to_sql(obj.get(name), column_type) for
+                           name, column_type, ref_node in columns]
+            for object_id, obj in sorted(node.items()))
+    conn.executemany(sql, rows)
+
+    for name, column_type, ref_node in columns:
+        if ref_node is not None:
+            conn.execute("CREATE INDEX {0} ON {1} ({2})".format(
+                _quote("{0}_{1}".format(node_name, name)), _quote(node_name), _quote(name)))
+
+
+def _create_phrases_table(conn, phrases):
+    conn.execute("CREATE TABLE {0} (text_id TEXT NOT NULL, lang TEXT NOT NULL, "
+                 "text TEXT NOT NULL, PRIMARY KEY (text_id, lang))"
+                 .format(_quote(TABLE_PHRASES)))
+    rows = ((text_id, lang, text) for text_id, translations in sorted(phrases.items()) for
+            lang, text in sorted(translations.items()))
+    conn.executemany("INSERT INTO {0} VALUES (?, ?, ?)".format(_quote(TABLE_PHRASES)), rows)
+    conn.execute("CREATE INDEX phrases_lang ON {0} (lang)".format(_quote(TABLE_PHRASES)))
+
+
+def write_db(conn, json_data):
+    """Write the JSON data to an empty database, in one transaction."""
+    object_nodes = {node_name: node for node_name, node in json_data.items() if
+                    compact.is_object_node(node) and not node_name.startswith('_')}
+    phrases = object_nodes.get(TABLE_PHRASES)
+    # Store the phrases as a node of objects only if they cannot be
+    # normalized, e.g. if a translation is not a string.
+    if phrases is not None and not all(isinstance(text, str) for
+                                       translations in phrases.values() for
+                                       text in translations.values()):
+        phrases = None
+
+    with conn:
+        conn.execute("CREATE TABLE {0} (node TEXT NOT NULL, name TEXT NOT NULL, "
+                     "type TEXT NOT NULL, ref_node TEXT, PRIMARY KEY (node, name))"
+                     .format(_quote(TABLE_FIELDS)))
+        conn.execute("CREATE TABLE {0} (node TEXT PRIMARY KEY, json TEXT NOT NULL)"
+                     .format(_quote(TABLE_NODES)))
+        field_rows = []
+        for node_name, node in sorted(object_nodes.items()):
+            if phrases is not None and node_name == TABLE_PHRASES:
+                continue
+            columns = _get_columns(node_name, node, object_nodes)
+            _create_object_table(conn, node_name, node, columns)
+            field_rows.extend((node_name, name, column_type, ref_node) for
+                              name, column_type, ref_node in columns)
+            metrics.set_value(metrics.METRIC_SQL_ROWS, len(node), table=node_name)
+        if phrases is not None:
+            _create_phrases_table(conn, phrases)
+            metrics.set_value(metrics.METRIC_SQL_ROWS,
+                              sum(len(translations) for translations in phrases.values()),
+                              table=TABLE_PHRASES)
+        conn.executemany("INSERT INTO {0} VALUES (?, ?, ?, ?)".format(_quote(TABLE_FIELDS)),
+                         field_rows)
+        other_rows = [(node_name, json.dumps(node, sort_keys=True)) for
+                      node_name, node in sorted(json_data.items()) if
+                      node_name not in object_nodes]
+        conn.executemany("INSERT INTO {0} VALUES (?, ?)".format(_quote(TABLE_NODES)),
+                         other_rows)
+
+
+def make_sqlite(json_data, path):
+    """Write the JSON data to a new SQLite database file at path.
+
+    The file is built under a temporary name and then renamed, so readers
+    never see a partial database.
+    """
+    _log.info("writing to: {0}".format(path))
+    with atomic.atomic_path(path) as temp_path:
+        conn = sqlite3.connect(temp_path)
+        try:
+            # The file is discarded on failure, so skip the journal.
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            write_db(conn, json_data)
+        finally:
+            conn.close()
+    metrics.incr(metrics.METRIC_FILES_WRITTEN)
+
+
+class SqliteData(object):
+
+    """Read access to a database written by make_sqlite().
+
+    The lookups return the same values as the corresponding lookups in
+    the JSON data returned by jsongen.get_json().
+    """
+
+    def __init__(self, path):
+        # Open read-only, so a missing file is an error rather than a new
+        # empty database.
+        uri = "file:{0}?mode=ro".format(quote(os.path.abspath(path)))
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        # Maps node name to a list of (name, column type) pairs.
+        self._columns = {}
+        for node_name, name, column_type in self.conn.execute(
+                "SELECT node, name, type FROM {0} ORDER BY node, name"
+                .format(_quote(TABLE_FIELDS))):
+            self._columns.setdefault(node_name, []).append((name, column_type))
+        self._has_phrases_table = bool(self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (TABLE_PHRASES, )).fetchone())
+
+    def close(self):
+        self.conn.close()
+
+    def get_node_names(self):
+        names = set(self._columns)
+        names.update(row[0] for row in self.conn.execute(
+            "SELECT node FROM {0}".format(_quote(TABLE_NODES))))
+        if self._has_phrases_table:
+            names.add(TABLE_PHRASES)
+        return sorted(names)
+
+    def _select_objects(self, node_name, where="", params=()):
+        columns = self._columns[node_name]
+        sql = "SELECT {0} FROM {1}{2} ORDER BY {3}".format(
+            ", ".join(_quote(name) for name in [COLUMN_ID] + [c[0] for c in columns]),
+            _quote(node_name), where, _quote(COLUMN_ID))
+        objects = {}
+        for row in self.conn.execute(sql, params):
+            objects[row[0]] = {name: _from_sql(value, column_type) for
+                               (name, column_type), value in zip(columns, row[1:]) if
+                               value is not None}
+        return objects
+
+    def _select_phrases(self, where="", params=()):
+        phrases = {}
+        sql = "SELECT text_id, lang, text FROM {0}{1}".format(_quote(TABLE_PHRASES), where)
+        for text_id, lang, text in self.conn.execute(sql, params):
+            phrases.setdefault(text_id, {})[lang] = text
+        return phrases
+
+    def get_node(self, node_name):
+        """Return a node, as in json_data[node_name]."""
+        if node_name in self._columns:
+            return self._select_objects(node_name)
+        if node_name == TABLE_PHRASES and self._has_phrases_table:
+            return self._select_phrases()
+        row = self.conn.execute("SELECT json FROM {0} WHERE node = ?".format(_quote(TABLE_NODES)),
+                                (node_name, )).fetchone()
+        if row is None:
+            raise KeyError(node_name)
+        return json.loads(row[0])
+
+    def get_object(self, node_name, object_id):
+        """Return an object, as in json_data[node_name][object_id]."""
+        if node_name in self._columns:
+            objects = self._select_objects(node_name, " WHERE {0} = ?".format(_quote(COLUMN_ID)),
+                                           (object_id, ))
+        elif node_name == TABLE_PHRASES and self._has_phrases_table:
+            objects = self._select_phrases(" WHERE text_id = ?", (object_id, ))
+        else:
+            objects = self.get_node(node_name)
+        return objects[object_id]
+
+    def find(self, node_name, **attrs):
+        """Return the objects in a node with the given attribute values.
+
+        Returns a dict mapping object ID to object, like a node.  Lookups
+        on reference columns (e.g. body_id) use their index.
+        """
+        column_types = dict(self._columns[node_name])
+        clauses = []
+        params = []
+        for name, value in sorted(attrs.items()):
+            try:
+                column_type = column_types[name]
+            except KeyError:
+                raise Exception("no attribute {0!r} in node: {1}".format(name, node_name))
+            clauses.append("{0} = ?".format(_quote(name)))
+            params.append(_to_sql(value, column_type))
+        where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        return self._select_objects(node_name, where, params)
+
+    def get_json(self):
+        """Return all of the data, as jsongen.get_json() would."""
+        return {node_name: self.get_node(node_name) for node_name in self.get_node_names()}
@@ -0,0 +1,191 @@
+"""Supports computing rollup statistics over the object graph.
+
+The rollups are computed in a single pass over the districts and
+offices.  Each object adds its measures (e.g. its number of seats) to
+one bucket per dimension (e.g. its category and its body), so the cost
+is linear in the number of objects regardless of how many dimensions
+or dimension values there are.  get_rollups() also keeps the last
+rollups computed, so that repeated builds from the same JSON data (e.g.
+when benchmarking or previewing) compute them only once.
+
+Terminology
+-----------
+
+dimension:
+  A way of grouping objects, for example by category.
+
+measure:
+  A number summed over the objects in a group, for example seats.
+
+rollups dict:
+  A dict with a "totals" key mapping to a dict of measures, and a
+  "by_<dimension>" key for each dimension mapping dimension value to a
+  dict of measures.
+
+"""
+
+from collections import Counter, defaultdict
+
+from pyelect import calendar
+from pyelect import inherit
+from pyelect import metrics
+
+
+NODE_NAME = 'stats'
+
+DEFAULT_SEAT_COUNT = 1
+
+DIMENSION_BODY = 'body'
+DIMENSION_CATEGORY = 'category'
+DIMENSION_DISTRICT_TYPE = 'district_type'
+DIMENSION_ELECTION_YEAR = 'election_year'
+DIMENSION_JURISDICTION_AREA = 'jurisdiction_area'
+
+DIMENSIONS = (
+    DIMENSION_BODY,
+    DIMENSION_CATEGORY,
+    DIMENSION_DISTRICT_TYPE,
+    DIMENSION_ELECTION_YEAR,
+    DIMENSION_JURISDICTION_AREA,
+)
+
+MEASURE_DISTRICTS = 'districts'
+MEASURE_OFFICES = 'offices'
+# The number of offices whose next election is in the reference year.
+MEASURE_OFFICES_ON_BALLOT = 'offices_on_ballot'
+MEASURE_SEATS = 'seats'
+
+MEASURES = (
+    MEASURE_DISTRICTS,
+    MEASURE_OFFICES,
+    MEASURE_OFFICES_ON_BALLOT,
+    MEASURE_SEATS,
+)
+
+_KEY_TOTALS = 'totals'
+_TOTALS_DIMENSION_VALUE = 'all'
+
+_CACHE_NAME = 'rollups'
+
+# A one-item cache of (json_data, cache key, rollups) (see also the
+# coverage and search modules).
+_cached = None
+
+
+def get_seat_count(office):
+    return office.get('seat_count', DEFAULT_SEAT_COUNT)
+
+
+def get_dimension_key(dimension):
+    return "by_{0}".format(dimension)
+
+
+def _make_empty_measures():
+    return {m: 0 for m in MEASURES}
+
+
+def _add(buckets, dimension, value, measures):
+    if value is None:
+        return
+    buckets[(dimension, value)].update(measures)
+
+
+def compute_rollups(json_data, reference_date=None, office_ids=None):
+    """Return a rollups dict for the given JSON data.
+
+    Arguments:
+      json_data: a dict of JSON nodes.
+      reference_date: the date to compute next election years from.
+      office_ids: optionally, the ID's of the offices to include.
+        Defaults to all offices.
+    """
+    reference_year = calendar.get_reference_date(reference_date).year
+    resolver = inherit.Resolver(json_data)
+    districts = json_data['districts']
+    district_types = json_data['district_types']
+    offices = json_data['offices']
+    if office_ids is None:
+        office_ids = offices.keys()
+
+    # Maps (dimension, value) to a Counter of measures.
+    buckets = defaultdict(Counter)
+    totals = Counter()
+
+    for district_id in districts.keys():
+        district = resolver.get_view('districts', district_id)
+        district_type_id = district.get('district_type_id')
+        district_type = district_types.get(district_type_id, {})
+        measures = {MEASURE_DISTRICTS: 1}
+        totals.update(measures)
+        _add(buckets, DIMENSION_BODY, district_type.get('body_id'), measures)
+        _add(buckets, DIMENSION_CATEGORY, district.get('category_id'), measures)
+        _add(buckets, DIMENSION_DISTRICT_TYPE, district_type_id, measures)
+
+    for office_id in office_ids:
+        office = resolver.get_view('offices', office_id)
+        next_year = calendar.compute_next_election_year(office, reference_date=reference_date)
+        measures = {
+            MEASURE_OFFICES: 1,
+            MEASURE_OFFICES_ON_BALLOT: int(next_year == reference_year),
+            MEASURE_SEATS: get_seat_count(office),
+        }
+        district_id = office.get('district_id')
+        district_type_id = districts[district_id].get('district_type_id') if district_id else None
+        totals.update(measures)
+        _add(buckets, DIMENSION_BODY, office.get('body_id'), measures)
+        _add(buckets, DIMENSION_CATEGORY, office.get('category_id'), measures)
+        _add(buckets, DIMENSION_DISTRICT_TYPE, district_type_id, measures)
+        _add(buckets, DIMENSION_ELECTION_YEAR, next_year, measures)
+        _add(buckets, DIMENSION_JURISDICTION_AREA, office.get('jurisdiction_area_id'), measures)
+
+    rollups = {get_dimension_key(d): {} for d in DIMENSIONS}
+    for (dimension, value), counter in buckets.items():
+        measures = _make_empty_measures()
+        measures.update(counter)
+        rollups[get_dimension_key(dimension)][value] = measures
+    rollups[_KEY_TOTALS] = _make_empty_measures()
+    rollups[_KEY_TOTALS].update(totals)
+
+    return rollups
+
+
+def get_rollups(json_data, reference_date=None, office_ids=None):
+    """Return a rollups dict for the given JSON data, computing it at most once.
+
+    The arguments are the same as for compute_rollups().  The return value
+    is shared, so callers should not modify it.
+    """
+    global _cached
+    reference_date = calendar.get_reference_date(reference_date)
+    key = (reference_date, None if office_ids is None else frozenset(office_ids))
+    if _cached is not None and _cached[0] is json_data and _cached[1] == key:
+        metrics.record_cache(_CACHE_NAME, hit=True)
+        return _cached[2]
+    metrics.record_cache(_CACHE_NAME, hit=False)
+    with metrics.stage('rollups'):
+        rollups = compute_rollups(json_data, reference_date=reference_date,
+                                  office_ids=office_ids)
+    _cached = (json_data, key, rollups)
+    return rollups
+
+
+def make_stats_node(rollups):
+    """Return the rollups dict as a JSON node of flat objects.
+
+    Each object ID has the form "<dimension>.<value>", for example
+    "category.category_state", except for the totals object, whose
+    ID is "all".
+    """
+    node = {}
+    totals = dict(rollups[_KEY_TOTALS])
+    totals['dimension'] = _TOTALS_DIMENSION_VALUE
+    node[_TOTALS_DIMENSION_VALUE] = totals
+    for dimension in DIMENSIONS:
+        for value, measures in rollups[get_dimension_key(dimension)].items():
+            obj = dict(measures)
+            obj['dimension'] = dimension
+            obj['value'] = value
+            object_id = "{0}.{1}".format(dimension, value)
+            node[object_id] = obj
+
+    return node
@@ -16,45 +16,18 @@ import traceback
 
 from django import template
 
-from pyelect.html.common import NON_ENGLISH_ORDER
+from pyelect.html.assets import get_asset_url
+from pyelect.html.common import NON_ENGLISH_ORDER, label_to_text
 from pyelect.html import pages
+from pyelect.html.pages import get_page_href, get_page_title
 from pyelect import lang
 
 
-_LABEL_TEXTS = {
-    'none': 'Single',
-    'unknown': 'Unknown',
-}
-
 _log = logging.getLogger()
 
 register = template.Library()
 
 
-def label_to_text(label):
-    text = None
-    try:
-        starts = label.startswith('=')
-    except AttributeError:
-        return text
-    if starts:
-        key = label[1:]
-        text = _LABEL_TEXTS[key]
-    return text
-
-
-def get_page_href(page_base, fragment=None):
-    page = pages.get_page_object(page_base)
-    href = page.make_href(fragment=fragment)
-    return href
-
-
-def get_page_title(page_base):
-    page = pages.get_page_object(page_base)
-    title = page.title
-    return title
-
-
 # This is a decorator to deal with the fact that by default Django silently
 # swallows exceptions when rendering templates.  This default behavior
 # can be changed by setting TEMPLATE_DEBUG to True.
@@ -158,6 +131,13 @@ def page_href(page_base, fragment):
 
 
 
+@register.simple_tag(takes_context=True)
+@log_errors
+def asset_url(context, rel_path):
+    """Return the URL of a static file, fingerprinted if the build did so."""
+    return get_asset_url(context['asset_manifest'], rel_path)
+
+
 @register.simple_tag(takes_context=True)
 def current_object_count(context):
     current_page_base = context['current_page']
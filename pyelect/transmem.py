@@ -0,0 +1,130 @@
+"""Supports finding the existing phrase closest to a new one.
+
+When the Department sends a new CSV file, some English phrases differ from
+existing ones only slightly (e.g. by a trailing comma), and so have no text
+ID yet.  The translation memory suggests the existing phrase, and so the
+translations, that each such phrase most likely corresponds to.
+
+Phrases are compared by the Jaccard similarity of their sets of character
+trigrams, after lower-casing them and collapsing punctuation and spaces.
+To avoid comparing a phrase with every existing phrase, the memory uses
+MinHash locality-sensitive hashing: each phrase gets a signature of
+NUM_HASHES minimum hash values, split into bands of BAND_SIZE values, and
+only phrases sharing at least one band are compared.  Phrases with a
+similarity of s share a band with probability 1 - (1 - s^BAND_SIZE)^bands,
+which is over 99% for s = 0.7, about 93% for s = 0.5, and about 15% for
+s = 0.2.
+
+"""
+
+from collections import defaultdict, namedtuple
+import random
+import re
+import zlib
+
+
+NUM_HASHES = 60
+BAND_SIZE = 3
+# The default minimum similarity of a suggestion.
+MIN_SIMILARITY = 0.5
+
+# A Mersenne prime larger than any CRC-32 value.
+_PRIME = (1 << 61) - 1
+# Use a fixed seed so that signatures are the same from run to run.
+_random = random.Random(0)
+_HASH_PARAMS = [(_random.randrange(1, _PRIME), _random.randrange(0, _PRIME)) for
+                i in range(NUM_HASHES)]
+
+_NON_WORD_PATTERN = re.compile(r'[\W_]+')
+
+Suggestion = namedtuple('Suggestion', ('text_id', 'text', 'similarity'))
+
+
+def normalize_text(text):
+    """Lower-case the text and replace punctuation and spaces with one space."""
+    return _NON_WORD_PATTERN.sub(' ', text.casefold()).strip()
+
+
+def get_shingles(text):
+    """Return the set of character trigrams of the normalized text."""
+    text = " {0} ".format(normalize_text(text))
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def get_similarity(shingles1, shingles2):
+    """Return the Jaccard similarity of two sets of shingles."""
+    if not shingles1 and not shingles2:
+        return 1.0
+    return len(shingles1 & shingles2) / len(shingles1 | shingles2)
+
+
+def get_signature(shingles):
+    """Return the MinHash signature of a set of shingles, as a tuple."""
+    values = [zlib.crc32(shingle.encode('utf-8')) for shingle in shingles]
+    if not values:
+        return (0, ) * NUM_HASHES
+    return tuple(min((a * value + b) % _PRIME for value in values) for
+                 a, b in _HASH_PARAMS)
+
+
+def _iter_bands(signature):
+    for start in range(0, NUM_HASHES, BAND_SIZE):
+        yield start, signature[start:start + BAND_SIZE]
+
+
+class TranslationMemory(object):
+
+    """An index of existing phrases for finding the ones closest to a text."""
+
+    def __init__(self):
+        # Maps text_id to (text, shingles).
+        self._entries = {}
+        # Maps (band start, band values) to the text ID's with that band.
+        self._buckets = defaultdict(list)
+
+    @classmethod
+    def from_phrases(cls, phrases, lang):
+        """Create a memory of the translations in the given language.
+
+        Arguments:
+          phrases: a phrases dict (see the lang module).
+        """
+        memory = cls()
+        for text_id, translations in sorted(phrases.items()):
+            text = translations.get(lang)
+            if text:
+                memory.add(text_id, text)
+        return memory
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, text_id, text):
+        if text_id in self._entries:
+            raise Exception("text_id already added: {0}".format(text_id))
+        shingles = get_shingles(text)
+        self._entries[text_id] = text, shingles
+        for band in _iter_bands(get_signature(shingles)):
+            self._buckets[band].append(text_id)
+
+    def get_candidates(self, shingles):
+        """Return the text ID's sharing at least one band with the shingles."""
+        candidates = set()
+        for band in _iter_bands(get_signature(shingles)):
+            candidates.update(self._buckets.get(band, ()))
+        return candidates
+
+    def find(self, text, limit=1, min_similarity=MIN_SIMILARITY):
+        """Return the closest phrases to a text, as a list of Suggestion objects.
+
+        Returns at most limit suggestions, most similar first.
+        """
+        shingles = get_shingles(text)
+        suggestions = []
+        for text_id in self.get_candidates(shingles):
+            other_text, other_shingles = self._entries[text_id]
+            similarity = get_similarity(shingles, other_shingles)
+            if similarity >= min_similarity:
+                suggestions.append(Suggestion(text_id, other_text, similarity))
+        suggestions.sort(key=lambda s: (-s.similarity, s.text_id))
+        return suggestions[:limit]
@@ -1,10 +1,17 @@
 """Project-wide helper functions."""
 
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import logging
 import os
 
 import yaml
 
+from pyelect import atomic
+from pyelect import metrics
+from pyelect import predata
+
 
 _log = logging.getLogger()
 
@@ -14,6 +21,11 @@ FILE_AUTO_UPDATED = 'auto_updated'
 
 FILE_TYPES = (FILE_MANUAL, FILE_AUTO_UPDATED, FILE_AUTO_GENERATED)
 
+# The results of normalizing a YAML file.
+NORMALIZE_CHANGED = 'changed'
+NORMALIZE_SKIPPED = 'skipped'
+NORMALIZE_UNCHANGED = 'unchanged'
+
 DIR_PRE_DATA = 'pre_data'
 KEY_META_COMMENTS = 'comments'
 KEY_META = '_meta'
@@ -53,6 +65,12 @@ def filter_dict_by_keys(data, keys):
     return {k: v for k, v in data.items() if k in keys}
 
 
+def compute_json_hash(data):
+    """Return a hash of JSON-serializable data that ignores key order."""
+    text = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
 def get_required(dict_, key, message=None):
     try:
         value = dict_[key]
@@ -75,8 +93,11 @@ def get_pre_data_dir():
 
 def write(path, text):
     _log.info("writing to: {0}".format(path))
-    with open(path, mode='w') as f:
+    with atomic.atomic_open(path, mode='w') as f:
         f.write(text)
+    predata.invalidate(path)
+    metrics.incr(metrics.METRIC_FILES_WRITTEN)
+    metrics.incr(metrics.METRIC_BYTES_WRITTEN, len(text.encode('utf-8')))
 
 
 def read_yaml(path):
@@ -86,7 +107,9 @@ def read_yaml(path):
 
 
 def read_yaml_rel(rel_path, file_base=None, key=None):
-    """Return the data in a YAML file as a Python dict.
+    """Return the data in a YAML file as a read-only mapping.
+
+    Each file is parsed at most once per process (see pyelect.predata).
 
     Arguments:
       rel_path: the path to the file relative to the repo root.
@@ -99,7 +122,7 @@ def read_yaml_rel(rel_path, file_base=None, key=None):
     repo_dir = get_repo_dir()
     path = os.path.join(repo_dir, rel_path)
 
-    data = read_yaml(path)
+    data = predata.load(path, read_yaml)
     if key is not None:
         data = data[key]
 
@@ -113,8 +136,9 @@ def yaml_dump(*args):
 def _write_yaml(data, path, stdout=None):
     if stdout is None:
         stdout = False
-    with open(path, "w") as f:
+    with atomic.atomic_open(path, mode='w') as f:
         yaml_dump(data, f)
+    predata.invalidate(path)
     if stdout:
         print(yaml_dump(data))
 
@@ -175,11 +199,89 @@ def is_yaml_file_normalizable(path):
     return _is_yaml_normalizable(data, path_hint=path)
 
 
-def normalize_yaml(path, stdout=None):
-    data = read_yaml(path)
-    normalizable = _is_yaml_normalizable(data, path_hint=path)
-    if not normalizable:
+def _normalize_yaml_text(text, path_hint):
+    """Return the normalized text, or None if the file is not normalizable."""
+    data = yaml.load(text)
+    if not _is_yaml_normalizable(data, path_hint=path_hint):
+        return None
+    _set_header(data, file_type=None)
+    return yaml_dump(data)
+
+
+def _normalize_yaml_file(path, check):
+    """Normalize a YAML file, reading and parsing it once.
+
+    Returns a pair of the NORMALIZE_* status and the number of bytes
+    written.  The file is written only if its text changes, and never
+    if check is true.
+    """
+    with open(path) as f:
+        text = f.read()
+    normalized = _normalize_yaml_text(text, path_hint=path)
+    if normalized is None:
+        return NORMALIZE_SKIPPED, 0
+    if normalized == text:
+        return NORMALIZE_UNCHANGED, 0
+    if check:
+        return NORMALIZE_CHANGED, 0
+    with atomic.atomic_open(path, mode='w') as f:
+        f.write(normalized)
+    return NORMALIZE_CHANGED, len(normalized.encode('utf-8'))
+
+
+def _normalize_yaml_chunk(paths, check):
+    return [_normalize_yaml_file(path, check) for path in paths]
+
+
+def _record_normalization(path, status, num_bytes, check):
+    """Log and record the result of normalizing a file in this process."""
+    if status == NORMALIZE_SKIPPED:
         _log.info("skipping normalization: {0}".format(path))
-        return
+    elif status == NORMALIZE_CHANGED:
+        if check:
+            _log.info("not normalized: {0}".format(path))
+            return
+        _log.info("writing to: {0}".format(path))
+        predata.invalidate(path)
+        metrics.incr(metrics.METRIC_FILES_WRITTEN)
+        metrics.incr(metrics.METRIC_BYTES_WRITTEN, num_bytes)
+
+
+def normalize_yaml(path, check=False):
+    """Normalize a YAML file, and return a NORMALIZE_* status."""
+    status, num_bytes = _normalize_yaml_file(path, check)
+    _record_normalization(path, status, num_bytes, check)
+    return status
+
 
-    write_yaml_with_header(data, path, stdout=stdout)
+def normalize_yaml_files(paths, check=False, workers=None):
+    """Normalize YAML files using a pool of processes.
+
+    Returns a dict mapping each path to its NORMALIZE_* status.
+
+    Arguments:
+      check: whether to only report the files that are not normalized,
+        rather than write them.
+      workers: the number of worker processes, or None for the number
+        of CPUs.
+    """
+    paths = list(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # Send the paths in chunks to reduce the overhead per file, with a
+    # few chunks per worker to even out the load.
+    chunk_size = max(1, -(-len(paths) // (4 * workers)))
+    chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        results = [_normalize_yaml_chunk(chunk, check) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_normalize_yaml_chunk, chunks,
+                                        [check] * len(chunks)))
+
+    statuses = {}
+    for chunk, chunk_results in zip(chunks, results):
+        for path, (status, num_bytes) in zip(chunk, chunk_results):
+            _record_normalization(path, status, num_bytes, check)
+            statuses[path] = status
+    return statuses
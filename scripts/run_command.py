@@ -8,14 +8,17 @@ import argparse
 import json
 import logging
 import os
-import subprocess
+import pathlib
 import sys
 import textwrap
+import webbrowser
 
 import init_path
-from pyelect.html import generator as htmlgen
-from pyelect import jsongen
-from pyelect import lang
+# Only import modules that every command needs here.  Each command
+# function and add_arguments_*() function imports the modules it needs, so
+# that running a command (or showing its help) does not import e.g. Django
+# unless the command uses it.
+from pyelect import metrics
 from pyelect import utils
 
 
@@ -24,6 +27,29 @@ _log = logging.getLogger()
 DEFAULT_BUILD_DIR_NAME = '_build'
 _FORMATTER_CLASS = argparse.RawDescriptionHelpFormatter
 
+# The commands, as (name, help) pairs.  For each command name, the module
+# must define a command_<name>(ns) function and can define an
+# add_arguments_<name>(parser) function.
+COMMANDS = (
+    ('bench_html', "compare the speed of the template engines."),
+    ('deploy', "copy the changed files of an HTML build to a target directory."),
+    ('diff_json', "show the structural differences between two JSON files."),
+    ('lang_coverage', "report the phrases missing translations."),
+    ('lang_csv_ids', "create text ID's from a CSV file."),
+    ('lang_text_csv', "update the i18n files for the CSV phrases."),
+    ('lang_text_extras', 'update the i18n files for the "extra" phrases.'),
+    ('make_json', "create or update a JSON data file."),
+    ('make_sqlite', "export the data to an SQLite database."),
+    ('parse_csv', "parse a CSV language file from the Department."),
+    ('sample_html', "make sample HTML from the JSON data."),
+    ('search', "search the objects and phrases in any language."),
+    ('serve_api', "serve the JSON data over HTTP."),
+    ('serve_html', "serve the sample HTML, rendering pages on request."),
+    ('split_objects', "split an objects YAML file into one file per object."),
+    ('yaml_norm', "normalize one or more YAML files."),
+    ('yaml_temp', "temporary scratch command."),
+)
+
 DESCRIPTION = """\
 Helper script for repository contributors.
 
@@ -45,54 +71,218 @@ def _wrap(text):
 
 
 def get_default_output_dir_rel():
+    from pyelect.html import generator as htmlgen
+
     return os.path.join(DEFAULT_BUILD_DIR_NAME, htmlgen.HTML_OUTPUT_DIRNAME)
 
 
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _positive_int(text):
+    """Parse a command-line argument as an integer of at least 1."""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid int value: {0!r}".format(text))
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1: {0}".format(value))
+    return value
+
+
+def command_bench_html(ns):
+    from pyelect.html import benchmark
+
+    page_name = _resolve_page_name(ns.page_name)
+    page_names = None if page_name is None else [page_name]
+    results = benchmark.run_benchmark(engine_names=ns.engines, page_names=page_names,
+                                      repeat=ns.repeat, reference_date=ns.reference_date)
+    print(benchmark.format_results(results))
+
+
+def command_deploy(ns):
+    from pyelect.html import deploy
+
+    source_dir = ns.source_dir
+    if source_dir is None:
+        source_dir = os.path.join(utils.get_repo_dir(), get_default_output_dir_rel())
+    to_copy, to_delete = deploy.deploy(source_dir, ns.target_dir, full=ns.full,
+                                       dry_run=ns.dry_run, workers=ns.jobs)
+    if ns.dry_run:
+        for rel_path in to_copy:
+            print("copy: {0}".format(rel_path))
+        for rel_path in to_delete:
+            print("delete: {0}".format(rel_path))
+        return
+    print("copied {0} file(s) and deleted {1} file(s)".format(len(to_copy), len(to_delete)))
+
+
+def command_diff_json(ns):
+    from pyelect import jsondiff
+
+    old_data = _read_json(ns.old_path)
+    new_data = _read_json(ns.new_path)
+    with metrics.stage('diff_json'):
+        diff = jsondiff.diff_json(old_data, new_data)
+    print(jsondiff.format_diff(diff))
+    if ns.patch_path:
+        patch = jsondiff.make_patch(old_data, new_data, diff=diff)
+        text = json.dumps(patch, sort_keys=True, separators=(',', ':'))
+        utils.write(ns.patch_path, text)
+
+
+def _format_coverage_row(label, counts):
+    from pyelect import coverage
+
+    percent = coverage.format_percent(counts['present'], counts['expected'])
+    return "{0:<12}{1:>9}{2:>9}{3:>9}{4:>6}".format(label, counts['expected'],
+                                                    counts['present'], counts['missing'],
+                                                    percent)
+
+
+def command_lang_coverage(ns):
+    from pyelect import coverage
+    from pyelect import jsongen
+
+    json_data = jsongen.get_json()
+    index = coverage.get_coverage_index(json_data)
+    langs = ns.langs or index.langs
+    if ns.list_missing or ns.list_present:
+        for lang_code in langs:
+            if ns.list_missing:
+                text_ids = index.get_missing(lang_code, object_type=ns.object_type)
+            else:
+                text_ids = index.get_present(lang_code, object_type=ns.object_type)
+            for text_id in text_ids:
+                print("{0}\t{1}".format(lang_code, text_id))
+        return
+
+    object_types = [ns.object_type] if ns.object_type else [None]
+    if ns.by_type:
+        object_types += index.object_types
+    print("{0:<12}{1:>9}{2:>9}{3:>9}{4:>6}".format('language', 'expected', 'present',
+                                                   'missing', '%'))
+    for object_type in object_types:
+        if len(object_types) > 1:
+            print("\n{0}:".format(object_type or 'all phrases'))
+        for lang_code in langs:
+            counts = index.get_counts(lang_code, object_type=object_type)
+            print(_format_coverage_row(lang_code, counts))
+
+
 def command_lang_csv_ids(ns):
+    from pyelect import lang
+
     path = ns.input_path
     data = lang.create_text_ids(path)
     print(utils.yaml_dump(data))
 
 def command_lang_text_csv(ns):
+    from pyelect import lang
+
     lang.update_csv_translations()
 
 
 def command_lang_text_extras(ns):
+    from pyelect import lang
+
     lang.update_extras()
 
 
+def _check_reference_date_pinned(ns, path):
+    """Raise an exception if writing the repo JSON file without a pinned date."""
+    from pyelect import calendar
+    from pyelect import jsongen
+
+    json_path = jsongen.get_json_path()
+    if (calendar.get_pinned_reference_date(ns.reference_date) is not None or
+        os.path.realpath(path) != os.path.realpath(json_path)):
+        return
+    try:
+        json_data = jsongen.get_json()
+    except FileNotFoundError:
+        recorded = None
+    else:
+        recorded = json_data.get('_meta', {}).get(calendar.META_KEY_REFERENCE_DATE)
+    raise Exception("pass --reference-date or set {0} when writing {1}, so that the file "
+                    "does not change from day to day (the file was last built with: {2})"
+                    .format(calendar.ENV_REFERENCE_DATE, json_path, recorded))
+
+
 def command_make_json(ns):
+    from pyelect import compact
+    from pyelect import history
+    from pyelect import jsongen
+
     path = ns.output_path
-    json_data = jsongen.make_json_data()
-    text = json.dumps(json_data, indent=4, sort_keys=True)
+    _check_reference_date_pinned(ns, path)
+    with metrics.stage('make_json_data'):
+        json_data = jsongen.make_json_data(reference_date=ns.reference_date,
+                                           calendar_horizon=ns.calendar_years)
+    text = jsongen.dumps_json(json_data, indent=4, sort_keys=True)
     utils.write(path, text)
+    if ns.compact:
+        with metrics.stage('json_compact'):
+            compact_text = compact.dumps(compact.compact(json.loads(text)))
+        utils.write(compact.get_compact_path(path), compact_text)
+    if ns.snapshot:
+        with metrics.stage('json_snapshot'):
+            version = history.add_snapshot(json.loads(text), history_dir=ns.history_dir)
+        _log.info("json snapshot version: {0}".format(version))
+
+
+def command_make_sqlite(ns):
+    from pyelect import jsongen
+    from pyelect import sqldata
+
+    path = ns.output_path
+    if path is None:
+        path = os.path.join(utils.get_repo_dir(), DEFAULT_BUILD_DIR_NAME, sqldata.FILE_NAME)
+    with metrics.stage('make_json_data'):
+        json_data = jsongen.make_json_data(reference_date=ns.reference_date,
+                                           calendar_horizon=ns.calendar_years)
+        # Materialize the inherited objects.
+        json_data = json.loads(jsongen.dumps_json(json_data))
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with metrics.stage('make_sqlite'):
+        sqldata.make_sqlite(json_data, path)
 
 
 def command_parse_csv(ns):
+    from pyelect import lang
+
     path = ns.path
     data = lang.parse_contest_csv(path)
     print(data)
 
 
+def _resolve_page_name(page_name):
+    """Return the page file name beginning with the given prefix."""
+    from pyelect.html import generator as htmlgen
+
+    if not page_name:
+        return page_name
+    # Only require that the user type a matching prefix.
+    names = htmlgen.get_template_page_file_names()
+    for name in names:
+        if name.startswith(page_name):
+            return name
+    raise Exception("no page begins with: {0!r} (choose from: {1})"
+                    .format(page_name, ", ".join(names)))
+
+
 def command_sample_html(ns):
+    from pyelect.html import generator as htmlgen
+
     debug = ns.debug
     local = ns.local
     dir_path = ns.output_dir
     open_browser = ns.open_browser
-    page_name = ns.page_name
+    page_name = _resolve_page_name(ns.page_name)
     print_html = ns.print_html
 
-    if page_name:
-        # Only require that the user type a matching prefix.
-        names = htmlgen.get_template_page_file_names()
-        for name in names:
-            if name.startswith(page_name):
-                page_name = name
-                break
-        else:
-            raise Exception("no page begins with: {0!r} (choose from: {1})"
-                            .format(page_name, ", ".join(names)))
-
     if dir_path is None:
         repo_dir = utils.get_repo_dir()
         dir_path = os.path.join(repo_dir, get_default_output_dir_rel())
@@ -100,9 +290,44 @@ def command_sample_html(ns):
     # Make and output HTML.
     html_path = htmlgen.make_html(dir_path, page_name=page_name,
                                   print_html=print_html, local_assets=local,
-                                  debug=debug)
+                                  debug=debug, reference_date=ns.reference_date,
+                                  engine_name=ns.engine, minify=ns.minify,
+                                  precompress=ns.precompress, fingerprint=ns.fingerprint,
+                                  swap=ns.swap)
     if open_browser:
-        subprocess.call(["open", html_path])
+        webbrowser.open(pathlib.Path(os.path.abspath(html_path)).as_uri())
+
+
+def command_search(ns):
+    from pyelect import jsongen
+    from pyelect import search
+
+    json_data = jsongen.get_json()
+    results = search.search(json_data, ns.query, node_name=ns.node_name, limit=ns.limit)
+    for doc_id, node_name, label in results:
+        print("{0}\t{1}\t{2}".format(node_name, doc_id, label))
+
+
+def command_serve_html(ns):
+    from pyelect.html import preview
+
+    page_name = _resolve_page_name(ns.page_name)
+    server = preview.make_server(host=ns.host, port=ns.port, local_assets=ns.local,
+                                 reference_date=ns.reference_date, debug=ns.debug,
+                                 engine_name=ns.engine)
+    if ns.open_browser:
+        webbrowser.open(preview.get_server_url(server, page_name=page_name))
+    preview.serve(server)
+
+
+def command_serve_api(ns):
+    from pyelect import api
+    from pyelect import jsongen
+
+    json_path = ns.json_path
+    if json_path is None:
+        json_path = jsongen.get_json_path()
+    api.serve(json_path, host=ns.host, port=ns.port)
 
 
 def _get_all_files(dir_path):
@@ -115,18 +340,30 @@ def _get_all_files(dir_path):
     return paths
 
 
+def command_split_objects(ns):
+    from pyelect import jsongen
+
+    for base_name in ns.base_names:
+        rel_dir = jsongen.split_objects_file(base_name)
+        print("split {0} into: {1}".format(base_name, rel_dir))
+
+
 def command_yaml_norm(ns):
     path = ns.path
     if path:
-        if not utils.is_yaml_file_normalizable(path):
-            raise Exception("not normalizable: {0}".format(path))
         paths = [path]
     else:
         data_dir = utils.get_pre_data_dir()
         paths = _get_all_files(data_dir)
         paths = [p for p in paths if os.path.splitext(p)[1] == '.yaml']
-    for path in paths:
-        utils.normalize_yaml(path, stdout=False)
+    statuses = utils.normalize_yaml_files(paths, check=ns.check, workers=ns.jobs)
+    if path and statuses[path] == utils.NORMALIZE_SKIPPED:
+        raise Exception("not normalizable: {0}".format(path))
+    changed = sorted(p for p, status in statuses.items() if
+                     status == utils.NORMALIZE_CHANGED)
+    if ns.check and changed:
+        print("files not normalized:\n  {0}".format("\n  ".join(changed)))
+        sys.exit(1)
 
 
 def command_yaml_temp(ns):
@@ -160,42 +397,131 @@ def command_yaml_temp(ns):
     utils.write_yaml(data, path)
 
 
-def make_subparser(sub, command_name, help, command_func=None, details=None, **kwargs):
-    if command_func is None:
-        command_func_name = "command_{0}".format(command_name)
-        command_func = globals()[command_func_name]
+def _add_reference_date_argument(parser, from_json=False):
+    """
+    Arguments:
+      from_json: whether the command reads the repo JSON file, and so
+        defaults to the reference date the file was built with.
+    """
+    from pyelect import calendar
 
-    # Capitalize the first letter for the long description.
-    desc = help[0].upper() + help[1:]
-    if details is not None:
-        desc += "\n\n{0}".format(details)
-    desc = _wrap(desc)
-    parser = sub.add_parser(command_name, formatter_class=_FORMATTER_CLASS,
-                            help=help, description=desc, **kwargs)
-    parser.set_defaults(run_command=command_func)
-    return parser
+    default = ('the value of the {0} environment variable if set, and otherwise '
+               'today'.format(calendar.ENV_REFERENCE_DATE))
+    if from_json:
+        default = ('the date the JSON file was built with if it records one, and '
+                   'otherwise ' + default)
+    parser.add_argument('--reference-date', dest='reference_date', metavar='YYYY-MM-DD',
+        type=calendar.parse_reference_date,
+        help=('the date to compute election years from, for reproducible '
+              'builds.  Defaults to {0}.'.format(default)))
 
 
-def create_parser():
-    """Return an ArgumentParser object."""
-    root_parser = argparse.ArgumentParser(formatter_class=_FORMATTER_CLASS,
-            description=DESCRIPTION)
-    sub = root_parser.add_subparsers(help='sub-command help')
+def _add_engine_argument(parser):
+    from pyelect.html import engines
+
+    parser.add_argument('--engine', choices=engines.ENGINES, default=engines.DEFAULT_ENGINE,
+        help=('the template engine to render with.  Defaults to {0}.  The {1} '
+              'engine requires Jinja2.'.format(engines.DEFAULT_ENGINE, engines.ENGINE_JINJA2)))
+
+
+def add_arguments_bench_html(parser):
+    from pyelect.html import benchmark
+    from pyelect.html import engines
 
-    parser = make_subparser(sub, "lang_csv_ids",
-                help="create text ID's from a CSV file.")
+    parser.add_argument('--page', dest='page_name',
+        help='the page to benchmark.  Defaults to all pages.')
+    parser.add_argument('--engine', dest='engines', action='append', choices=engines.ENGINES,
+        help=('an engine to benchmark (can be given more than once).  '
+              'Defaults to all engines.'))
+    parser.add_argument('--repeat', type=int, default=benchmark.DEFAULT_REPEAT,
+        help=('the number of times to render each page.  Defaults to {0}.'
+              .format(benchmark.DEFAULT_REPEAT)))
+    _add_reference_date_argument(parser, from_json=True)
+
+    return ("Renders each page with each template engine from the same "
+            "template data, and reports the time to initialize each engine, "
+            "the time for the first render of each page (which includes "
+            "compiling or loading its template), and the mean time of the "
+            "later renders.  Also reports whether the engines render the "
+            "same HTML up to whitespace.")
+
+
+def add_arguments_deploy(parser):
+    from pyelect.html import deploy
+
+    parser.add_argument('target_dir', metavar='TARGET_DIR',
+        help='the directory to deploy to.')
+    parser.add_argument('--source', dest='source_dir', metavar='BUILD_DIR',
+        help=("the HTML build directory.  Defaults to the following directory "
+              "relative to the repo: {0}".format(get_default_output_dir_rel())))
+    parser.add_argument('--full', action='store_true',
+        help=("copy every file and delete every file not in the build, ignoring "
+              "what the target says was last deployed."))
+    parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+        help='list the files that would be copied and deleted, and stop.')
+    parser.add_argument('--jobs', type=_positive_int, metavar='COUNT',
+        help='the number of files to copy at once.')
+
+    return ("Each HTML build writes a manifest of its files, with their hashes "
+            "and sizes, to {0}.  The target directory keeps the manifest of "
+            "the build last deployed to it, so only the new and changed files "
+            "are copied, and the files no longer in the build are deleted."
+            .format(deploy.MANIFEST_FILE_NAME))
+
+
+def add_arguments_diff_json(parser):
+    parser.add_argument('old_path', metavar='OLD_PATH', help="the path to the old JSON file.")
+    parser.add_argument('new_path', metavar='NEW_PATH', help="the path to the new JSON file.")
+    parser.add_argument('--patch', dest='patch_path', metavar='PATH',
+        help=('also write a compact patch to the given path that clients can '
+              'apply to go from the old file to the new file.'))
+
+    return ("Compares the files node by node and object by object, "
+            "and summarizes phrase changes by language.")
+
+
+def add_arguments_lang_coverage(parser):
+    from pyelect import lang
+
+    parser.add_argument('--lang', dest='langs', action='append', choices=lang.LANGS,
+        help=('a language to report on (can be given more than once).  '
+              'Defaults to all languages.'))
+    parser.add_argument('--type', dest='object_type', metavar='NODE',
+        help=('only include the phrases referenced by the objects in this '
+              'JSON node (e.g. offices).'))
+    parser.add_argument('--by-type', dest='by_type', action='store_true',
+        help='also break down the counts by the JSON node referencing each phrase.')
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--missing', dest='list_missing', action='store_true',
+        help='list the text IDs missing a translation instead of the counts.')
+    group.add_argument('--present', dest='list_present', action='store_true',
+        help='list the text IDs with a translation instead of the counts.')
+
+    return ("Reports on the phrases in the repo JSON file.  A phrase counts "
+            "as expected in a language if the translations files for the "
+            "language list it (Edge phrases are not expected in every "
+            "language).")
+
+
+def add_arguments_lang_csv_ids(parser):
     parser.add_argument('input_path', metavar='CSV_PATH',
         help="a path to a CSV file.")
 
+
+def add_arguments_lang_text_csv(parser):
+    from pyelect import lang
+
     csv_dir = lang.get_rel_path_csv_dir()
     csv_trans_dir = lang.get_rel_path_translations_csv()
     details = textwrap.dedent("""\
     Update the translation files in the directory {0} with the information
     in the CSV files in the directory: {1}.
     """.format(csv_trans_dir, csv_dir))
-    parser = make_subparser(sub, "lang_text_csv",
-                help="update the i18n files for the CSV phrases.",
-                details=details)
+    return details
+
+
+def add_arguments_lang_text_extras(parser):
+    from pyelect import lang
 
     extra_phrases_path = lang.get_rel_path_phrases_extra()
     extra_trans_dir = lang.get_rel_path_translations_extra()
@@ -203,25 +529,64 @@ def create_parser():
     Add to the translation files in the directory {0} any new phrases in
     the file: {1}.
     """.format(extra_trans_dir, extra_phrases_path))
-    parser = make_subparser(sub, "lang_text_extras",
-                help='update the i18n files for the "extra" phrases.',
-                details=details)
+    return details
+
+
+def add_arguments_make_json(parser):
+    from pyelect import calendar
+    from pyelect import history
+    from pyelect import jsongen
 
     rel_path_default = jsongen.get_rel_path_json_data()
-    parser = make_subparser(sub, "make_json",
-                help="create or update a JSON data file.")
     parser.add_argument('output_path', metavar='PATH', nargs="?", default=rel_path_default,
+        help=("the output path. Defaults to the following path relative to the "
+              "repo root: {0}.  Writing this file requires a --reference-date "
+              "(or the {1} environment variable), since the file records it."
+              .format(rel_path_default, calendar.ENV_REFERENCE_DATE)))
+    _add_reference_date_argument(parser)
+    parser.add_argument('--calendar-years', dest='calendar_years', metavar='N', type=int,
+        help=('the number of years to include in the election calendar. '
+              'Defaults to {0}.'.format(calendar.DEFAULT_HORIZON)))
+    parser.add_argument('--compact', action='store_true',
+        help=('also write a compact form of the JSON, with objects stored as '
+              'rows and references as numbers, to the output path with '
+              '".compact" before the extension (see pyelect/compact.py).'))
+    parser.add_argument('--snapshot', action='store_true',
+        help=('also store the JSON as a new version in the snapshot history, '
+              'as a delta against the previous version.'))
+    parser.add_argument('--history-dir', dest='history_dir', metavar='DIR',
+        help=('the snapshot history directory.  Defaults to the following '
+              'directory relative to the repo root: {0}.'.format(history.DEFAULT_REL_DIR)))
+
+
+def add_arguments_make_sqlite(parser):
+    from pyelect import calendar
+    from pyelect import sqldata
+
+    rel_path_default = os.path.join(DEFAULT_BUILD_DIR_NAME, sqldata.FILE_NAME)
+    parser.add_argument('output_path', metavar='PATH', nargs="?",
         help=("the output path. Defaults to the following path relative to the "
               "repo root: {0}.".format(rel_path_default)))
+    _add_reference_date_argument(parser)
+    parser.add_argument('--calendar-years', dest='calendar_years', metavar='N', type=int,
+        help=('the number of years to include in the election calendar. '
+              'Defaults to {0}.'.format(calendar.DEFAULT_HORIZON)))
+
+    return ("Writes the same data as make_json, with one table per node of "
+            "objects and the phrases in a (text_id, lang, text) table.  See "
+            "pyelect/sqldata.py for the schema, and its SqliteData class for "
+            "reading the database from Python.")
 
-    parser = make_subparser(sub, "parse_csv",
-                help="parse a CSV language file from the Department.")
+
+def add_arguments_parse_csv(parser):
     parser.add_argument('path', metavar='PATH', help="a path to a CSV file.")
 
+
+def add_arguments_sample_html(parser):
+    from pyelect.html import assets
+    from pyelect.html import generator as htmlgen
+
     page_bases = htmlgen.get_template_page_bases()
-    parser = make_subparser(sub, "sample_html",
-                help="make sample HTML from the JSON data.",
-                details="Uses the repo JSON file as input.")
     parser.add_argument('--page', dest='page_name',
         help=('the page to generate (from: {0}).  Defaults to all pages.'
               .format(", ".join(page_bases))))
@@ -237,27 +602,219 @@ def create_parser():
         help='write the HTML to stdout.')
     parser.add_argument('--debug', action='store_true',
         help="set Django's TEMPLATE_DEBUG to True.")
+    parser.add_argument('--minify', action='store_true',
+        help='collapse the whitespace in the generated pages.')
+    parser.add_argument('--gzip', dest='precompress', action='store_true',
+        help=('also write a gzipped copy (ending in .gz) of each HTML, CSS, '
+              'JS, and JSON file, for web servers that serve precompressed '
+              'files.'))
+    parser.add_argument('--fingerprint', action='store_true',
+        help=('also copy each static file to a name containing a hash of its '
+              'contents, link to those names, and write a manifest of them '
+              'to {0}.  The fingerprinted files can then be served with '
+              'immutable cache headers.'.format(assets.MANIFEST_FILE_NAME)))
+    parser.add_argument('--swap', action='store_true',
+        help=('build into a new directory next to the output directory, and '
+              'then atomically point the output directory, which must be a '
+              'symlink if it exists, at it.  Readers never see a partial '
+              'build, and several such builds can run at once.'))
+    _add_engine_argument(parser)
+    _add_reference_date_argument(parser, from_json=True)
+
+    return "Uses the repo JSON file as input."
+
+
+def add_arguments_search(parser):
+    parser.add_argument('query', metavar='QUERY',
+        help='the text to search for, in any language.')
+    parser.add_argument('--node', dest='node_name', metavar='NODE',
+        help='only show results from this JSON node (e.g. offices or phrases).')
+    parser.add_argument('--limit', type=int, metavar='COUNT',
+        help='the maximum number of results to show.')
+
+    return ("Searches the names of the objects in the repo JSON file, and "
+            "all phrase translations.  Matches contain every word of the "
+            "query, ignoring case and accents, and the last word can be the "
+            "start of a word.  Prints the node, ID, and English label of "
+            "each match, objects first.")
+
+
+def add_arguments_serve_api(parser):
+    from pyelect import api
+    from pyelect import jsongen
+
+    rel_path_default = jsongen.get_rel_path_json_data()
+    parser.add_argument('json_path', metavar='PATH', nargs='?',
+        help=("the JSON file to serve.  Defaults to the following path relative "
+              "to the repo root: {0}.".format(rel_path_default)))
+    parser.add_argument('--host', default=api.DEFAULT_HOST,
+        help='the host to listen on.  Defaults to {0}.'.format(api.DEFAULT_HOST))
+    parser.add_argument('--port', type=int, default=api.DEFAULT_PORT,
+        help='the port to listen on.  Defaults to {0}.'.format(api.DEFAULT_PORT))
+
+    return ("Serves each node at /<node> and each object at "
+            "/<node>/<object_id>, with filtering by attribute "
+            "(e.g. /districts?district_type_id=...) and by language "
+            "for phrases (e.g. /phrases/<id>?lang=es).  Responses "
+            "support ETags and gzip, and the data is reloaded when "
+            "the JSON file changes.")
+
+
+def add_arguments_serve_html(parser):
+    from pyelect import api
+    from pyelect.html import preview
+
+    parser.add_argument('--page', dest='page_name',
+        help='the page to open in the browser.  Defaults to the index page.')
+    parser.add_argument('--host', default=api.DEFAULT_HOST,
+        help='the host to listen on.  Defaults to {0}.'.format(api.DEFAULT_HOST))
+    parser.add_argument('--port', type=int, default=preview.DEFAULT_PORT,
+        help='the port to listen on.  Defaults to {0}.'.format(preview.DEFAULT_PORT))
+    parser.add_argument('--local', action='store_true',
+        help='link to assets locally rather than via a CDN.')
+    parser.add_argument('--no-browser', dest='open_browser', action='store_false',
+        help='suppress opening the browser.')
+    parser.add_argument('--debug', action='store_true',
+        help="set Django's TEMPLATE_DEBUG to True.")
+    _add_engine_argument(parser)
+    _add_reference_date_argument(parser, from_json=True)
+
+    return ("Renders each page from the repo JSON file when it is "
+            "first requested, and keeps it in memory until the JSON "
+            "file or a template changes.  Static files are served "
+            "directly from the repo.")
+
+
+def add_arguments_split_objects(parser):
+    from pyelect import jsongen
+
+    rel_dir = os.path.join(utils.DIR_PRE_DATA, jsongen.DIR_NAME_OBJECTS)
+    parser.add_argument('base_names', metavar='NAME', nargs='+',
+        help='the object type to split, e.g. offices (can be given more than once).')
+
+    return ("Replaces the file {0} with a directory {1} containing the file "
+            "{2} with the file's _meta, and one YAML file per object, named "
+            "after its ID.  The JSON made from either layout is the same, "
+            "but editing one object then changes only its file, and a "
+            "long-running process reparses only the changed files."
+            .format(os.path.join(rel_dir, 'NAME.yaml'), os.path.join(rel_dir, 'NAME'),
+                    jsongen.FILE_NAME_OBJECTS_META))
+
 
-    parser = make_subparser(sub, "yaml_norm",
-                help="normalize one or more YAML files.")
+def add_arguments_yaml_norm(parser):
     parser.add_argument('--all', dest='all', action='store_true',
         help='normalize all YAML files.')
+    parser.add_argument('--check', action='store_true',
+        help=('only list the files that are not normalized, without changing '
+              'them, and exit with status 1 if there are any.'))
+    parser.add_argument('--jobs', type=_positive_int, metavar='N',
+        help='the number of worker processes.  Defaults to the number of CPUs.')
     parser.add_argument('path', metavar='PATH', nargs='?',
         help="a path to a YAML file.")
 
-    parser = make_subparser(sub, "yaml_temp",
-                help="temporary scratch command.")
+    return ("Each file is read and parsed once, and written only if "
+            "normalizing changes it.")
+
+
+def add_arguments_yaml_temp(parser):
     parser.add_argument('path', metavar='PATH', nargs='?',
         help="the target path of a non-English YAML file.")
 
+
+def _make_description(help, details=None):
+    # Capitalize the first letter for the long description.
+    desc = help[0].upper() + help[1:]
+    if details is not None:
+        desc += "\n\n{0}".format(details)
+    return _wrap(desc)
+
+
+def make_subparser(sub, command_name, help, command_func=None, add_arguments=True,
+                   **kwargs):
+    """Add and return the subparser for a command.
+
+    Arguments:
+      add_arguments: whether to add the command's arguments and long
+        description.  This can require importing the command's modules.
+    """
+    if command_func is None:
+        command_func_name = "command_{0}".format(command_name)
+        command_func = globals()[command_func_name]
+
+    parser = sub.add_parser(command_name, formatter_class=_FORMATTER_CLASS,
+                            help=help, **kwargs)
+    parser.set_defaults(run_command=command_func, command_name=command_name)
+    details = None
+    if add_arguments:
+        add_arguments_func = globals().get("add_arguments_{0}".format(command_name))
+        if add_arguments_func is not None:
+            details = add_arguments_func(parser)
+        parser.description = _make_description(help, details)
+    return parser
+
+
+def _get_command_name(argv, root_parser):
+    """Return the name of the command given in argv, or None if none."""
+    # The root options that take a value, e.g. "--metrics PATH".
+    value_options = set()
+    for action in root_parser._actions:
+        if action.nargs != 0:
+            value_options.update(action.option_strings)
+    command_names = set(name for name, help in COMMANDS)
+    args = iter(argv)
+    for arg in args:
+        if arg in value_options:
+            # Then skip the option's value.
+            next(args, None)
+        elif arg in command_names:
+            return arg
+        elif not arg.startswith('-'):
+            break
+    return None
+
+
+def create_parser(argv=None):
+    """Return an ArgumentParser object.
+
+    Arguments:
+      argv: the command-line arguments to be parsed, if known.  If given,
+        only the arguments of the command they name are added, so that
+        only the modules that command needs are imported.
+    """
+    root_parser = argparse.ArgumentParser(formatter_class=_FORMATTER_CLASS,
+            description=DESCRIPTION)
+    root_parser.add_argument('--metrics', dest='metrics_path', metavar='PATH',
+        help=('write build metrics (stage timings, object counts, bytes written, '
+              'etc.) to the given path after the command finishes.'))
+    root_parser.add_argument('--metrics-format', dest='metrics_format',
+        choices=metrics.FORMATS,
+        help=('the format of the metrics file.  Defaults to {0} for paths '
+              'ending in ".prom" and {1} otherwise.'
+              .format(metrics.FORMAT_PROMETHEUS, metrics.FORMAT_JSON)))
+    sub = root_parser.add_subparsers(help='sub-command help')
+
+    selected_name = None if argv is None else _get_command_name(argv, root_parser)
+    for command_name, help in COMMANDS:
+        add_arguments = argv is None or command_name == selected_name
+        make_subparser(sub, command_name, help=help, add_arguments=add_arguments)
+
     return root_parser
 
 
+def _write_metrics(ns):
+    path = ns.metrics_path
+    if path is None:
+        return
+    format_ = metrics.get_format(path, ns.metrics_format)
+    text = metrics.format_text(format_)
+    utils.write(path, text)
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv[1:]
     logging.basicConfig(level='INFO')
-    parser = create_parser()
+    parser = create_parser(argv)
     ns = parser.parse_args(argv)
     try:
         ns.run_command
@@ -267,7 +824,9 @@ def main(argv=None):
         #   http://bugs.python.org/issue16308
         parser.print_help()
     else:
-        ns.run_command(ns)
+        with metrics.stage("command_{0}".format(ns.command_name)):
+            ns.run_command(ns)
+        _write_metrics(ns)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,78 @@
+"""Tests of the optimize module, and of precompressing in HTML builds."""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyelect.html import generator
+from pyelect.html import optimize
+
+
+_REFERENCE_DATE = '2026-10-18'
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _get_gzip_paths(dir_path):
+    return sorted(os.path.relpath(os.path.join(root_dir, file_name), start=dir_path) for
+                  root_dir, dir_names, file_names in os.walk(dir_path) for
+                  file_name in file_names if file_name.endswith(optimize.GZIP_EXTENSION))
+
+
+class PrecompressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir_path)
+
+    def make_path(self, file_name):
+        return os.path.join(self.dir_path, file_name)
+
+    def test_precompress_dir(self):
+        _write(self.make_path('a.html'), "<p>text</p>\n" * 100)
+        optimize.precompress_dir(self.dir_path)
+        with gzip.open(self.make_path('a.html.gz'), 'rt') as f:
+            self.assertEqual(f.read(), "<p>text</p>\n" * 100)
+
+    def test_precompress_dir__stale(self):
+        _write(self.make_path('a.html'), "<p>text</p>\n" * 100)
+        _write(self.make_path('b.html'), "<p>text</p>\n" * 100)
+        optimize.precompress_dir(self.dir_path)
+        os.remove(self.make_path('b.html'))
+        optimize.precompress_dir(self.dir_path)
+        self.assertEqual(_get_gzip_paths(self.dir_path), ['a.html.gz'])
+
+    def test_remove_gzip_files(self):
+        _write(self.make_path('a.html'), "<p>text</p>\n" * 100)
+        # A file other than a gzipped copy written by precompressing.
+        _write(self.make_path('data.txt.gz'), "")
+        optimize.precompress_dir(self.dir_path)
+        optimize.remove_gzip_files(self.dir_path)
+        self.assertEqual(_get_gzip_paths(self.dir_path), ['data.txt.gz'])
+
+
+class BuildTest(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def make_html(self, **kwargs):
+        generator.make_html(self.output_dir, reference_date=_REFERENCE_DATE, **kwargs)
+
+    def test_rebuild_without_gzip(self):
+        self.make_html(precompress=True)
+        self.assertTrue(_get_gzip_paths(self.output_dir))
+        self.make_html(minify=True)
+        self.assertEqual(_get_gzip_paths(self.output_dir), [])
+        with open(os.path.join(self.output_dir, 'build_manifest.json')) as f:
+            self.assertNotIn(optimize.GZIP_EXTENSION + '"', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
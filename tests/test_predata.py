@@ -0,0 +1,45 @@
+"""Tests of the predata module."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from pyelect import predata
+from pyelect import utils
+
+
+class LoadTest(unittest.TestCase):
+
+    def setUp(self):
+        dir_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, dir_path)
+        self.path = os.path.join(dir_path, 'objects.yaml')
+        self.addCleanup(predata.invalidate, self.path)
+
+    def write(self, text, mtime):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_load__cached(self):
+        self.write("value: 1\n", mtime=1000)
+        data = predata.load(self.path, utils.read_yaml)
+        self.assertIs(predata.load(self.path, utils.read_yaml), data)
+        self.assertIs(predata.load_many([self.path], utils.read_yaml)[0], data)
+
+    def test_load__changed(self):
+        self.write("value: 1\n", mtime=1000)
+        self.assertEqual(predata.load(self.path, utils.read_yaml)['value'], 1)
+        self.write("value: 2\n", mtime=2000)
+        self.assertEqual(predata.load(self.path, utils.read_yaml)['value'], 2)
+
+    def test_load_many__changed(self):
+        self.write("value: 1\n", mtime=1000)
+        self.assertEqual(predata.load_many([self.path], utils.read_yaml)[0]['value'], 1)
+        self.write("value: 2\n", mtime=2000)
+        self.assertEqual(predata.load_many([self.path], utils.read_yaml)[0]['value'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""Tests of the search module."""
+
+import unittest
+
+from pyelect import search
+
+
+_JSON_DATA = {
+    'offices': {
+        'office_city_attorney': {'name_i18n': 'office_city_attorney_name'},
+        'office_district_attorney': {'name_i18n': 'office_district_attorney_name'},
+        'office_mayor': {'name_i18n': 'office_mayor_name'},
+    },
+    'phrases': {
+        'office_city_attorney_name': {'en': 'City Attorney', 'zh': '市法務官'},
+        'office_district_attorney_name': {'en': 'District Attorney', 'zh': '地方檢察官'},
+        'office_mayor_name': {'en': 'Mayor', 'zh': '市長'},
+    },
+}
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = search.SearchIndex.from_json_data(_JSON_DATA)
+
+    def search_ids(self, query):
+        return [doc[0] for doc in self.index.search(query, node_name='offices')]
+
+    def test_word(self):
+        self.assertEqual(self.search_ids('attorney'),
+                         ['office_city_attorney', 'office_district_attorney'])
+
+    def test_prefix(self):
+        self.assertEqual(self.search_ids('May'), ['office_mayor'])
+
+    def test_cjk_char(self):
+        self.assertEqual(self.search_ids('市'), ['office_city_attorney', 'office_mayor'])
+
+    def test_cjk_char_with_words(self):
+        # A one-character CJK term matches within a longer query, too.
+        self.assertEqual(self.search_ids('attorney 市'), ['office_city_attorney'])
+        self.assertEqual(self.search_ids('市 attorney'), ['office_city_attorney'])
+        self.assertEqual(self.search_ids('市 att'), ['office_city_attorney'])
+
+    def test_cjk_bigram(self):
+        self.assertEqual(self.search_ids('檢察'), ['office_district_attorney'])
+
+    def test_no_match(self):
+        self.assertEqual(self.search_ids('市 district'), [])
+
+    def test_json_round_trip(self):
+        index = search.SearchIndex.from_json(self.index.to_json())
+        self.assertEqual(index.search('attorney 市'), self.index.search('attorney 市'))
+
+
+if __name__ == '__main__':
+    unittest.main()